@@ -1,11 +1,14 @@
 import sys
 from raw_trip import *
+from trip_reader import print_progress
+from trip_cache import read_validated_trips
+from parallel import imap_jobs, read_data_list, file_range_tasks, merge_by_file
 from const import *
 import re
 import argparse
 import numpy as np
+from trip_reports import DayAggregator
 
-zone_locator = ZoneLocator('/data/taxi/ODzones_simp_vertices.csv')
 logger = Logger()
 
 parser = argparse.ArgumentParser(
@@ -14,95 +17,61 @@ parser.add_argument('--data_list', dest='data_list', type=str, required=True,
                     help='list of data file paths')
 #parser.add_argument('--output', dest='output', type=str, required=True,
 #                    help='output path') # name, without file type suffix
+parser.add_argument('--jobs', dest='jobs', type=int, default=1,
+                    help='number of worker processes')
+parser.add_argument('--split', dest='split', type=int, default=1,
+                    help='number of byte ranges each data file is split into for the jobs')
+parser.add_argument('--cache_dir', dest='cache_dir', type=str, default='',
+                    help='directory of validated trips written by ingest.py, used when up to date')
+parser.add_argument('--zone_file', dest='zone_file', type=str, default=ZONE_FILE,
+                    help='zone polygon file')
+parser.add_argument('--location_zone_file', dest='location_zone_file', type=str,
+                    default=LOCATION_ZONE_FILE,
+                    help='lookup table from TLC taxi zone IDs to zones, for the trips '
+                         'without coordinates')
+parser.add_argument('--histograms', dest='histograms', action='store_true',
+                    help='also write the speed histograms of the bins to '
+                         'day_yyyy-mm_histogram.npz, for percentiles in aggregate_month.py')
 args = parser.parse_args()
 
-NUM_ZONES = len(zone_names)
-NUM_DAYS = 31
-NUM_HOURS = 24
+zone_locator = ZoneLocator(args.zone_file, args.location_zone_file)
 
-DAY_BASE = NUM_HOURS * NUM_ZONES * NUM_ZONES
-HOUR_BASE = NUM_ZONES * NUM_ZONES
-
-class Aggregator:
-  def __init__(self, year_month):
-    self.year_month = year_month
-    self.bins = [[] for _ in range(NUM_DAYS * DAY_BASE)]
-
-  def add_trip(self, trip):
-    t = trip.pickup_time
-    # use compressed integer index for (day, hour, pickup_zone, dropoff_zone)
-    bin_id = (t.day - 1) * DAY_BASE + t.hour * HOUR_BASE + trip.pickup_zone * NUM_ZONES + trip.dropoff_zone
-
-    #bin_id = ('%d/%02d/%02d' % (t.year, t.month, t.day), t.hour, trip.pickup_zone, trip.dropoff_zone)
-    #if bin_id not in self.bins:
-    #  self.bins[bin_id] = []
-    self.bins[bin_id].append(trip.speed)
-
-  def report(self, file=''):
-    with open(file, 'w') as f:
-      f.write(','.join([
-        'date',
-        'hour',
-        'pickup_zone',
-        'dropoff_zone',
-        'mean',
-        'std',
-        'percentile_85',
-        'count'
-      ]) + '\n')
-
-      for bin_id, speeds in enumerate(self.bins):
-        if len(speeds) == 0: continue
-        day = bin_id / DAY_BASE + 1
-        hour = bin_id / HOUR_BASE % NUM_HOURS
-        pickup_zone = bin_id / NUM_ZONES % NUM_ZONES
-        dropoff_zone = bin_id % NUM_ZONES
-        f.write('%s,%d,%d,%d,%.9f,%.9f,%.9f,%d\n' % (
-          '%s-%02d' % (self.year_month, day), # date
-          hour,
-          pickup_zone, #zone_names[bin_id[2]],
-          dropoff_zone, #zone_names[bin_id[3]],
-          np.average(speeds),
-          np.std(speeds),
-          np.percentile(speeds, 85),
-          len(speeds)
-        ))
-
-def process_raw_data(file, aggregator, stats):
-  f = open(file, 'r')
+def process_raw_data(file, aggregator, stats, byte_range=None):
   print 'processing %s...' % file
-  lines = f.readlines()[1:]
-  line_counter, num_lines = 0, len(lines)
-  for line in lines:
-    line_counter += 1
-    if line_counter % 1000 == 0:
-      print '\r%.2f%%' % (1.0 * line_counter / num_lines * 100),
-      sys.stdout.flush()
-    if line == '':
-      continue
+  for trips, progress in read_validated_trips(file, stats, zone_locator, args.cache_dir,
+                                              byte_range):
+    if args.jobs == 1:
+      print_progress(progress)
+    aggregator.add_trips(trips)
 
-    try:
-      trip = RawTrip(line=line, zone_locator=zone_locator, stats=stats, logger=logger)
-    except Exception:
-      continue
+  print 'finished processing %s' % file
 
-    aggregator.add_trip(trip)
 
-  print 'finished processing %s' % file
+def process_range(task):
+  """
+  Aggregates the trips of a data file within a byte range.
 
+  Args:
+    task: (filename, byte_range) from file_range_tasks.
 
-f_data_list = open(args.data_list, 'r')
-for filename in f_data_list.readlines():
-  filename = filename.rstrip()
-  if filename == '':
-    continue
+  Returns: (filename, DayAggregator, TripStats) partial results.
+  """
+  filename, byte_range = task
   month = re.match('^.*(\d\d\d\d-\d\d)\.csv$', filename).group(1)
 
-  aggregator = Aggregator(month)
+  aggregator = DayAggregator(month)
   stats = TripStats()
-  process_raw_data(filename, aggregator, stats)
+  process_raw_data(filename, aggregator, stats, byte_range)
+  return filename, aggregator, stats
+
 
-  output_csv = 'day_%s.csv' % month
-  stats_txt = 'day_%s_stats.txt' % month
+tasks = file_range_tasks(read_data_list(args.data_list), args.split,
+                         args.cache_dir, zone_locator)
+results = imap_jobs(process_range, tasks, args.jobs)
+for filename, aggregator, stats in merge_by_file(results):
+  output_csv = 'day_%s.csv' % aggregator.year_month
+  stats_txt = 'day_%s_stats.txt' % aggregator.year_month
   aggregator.report(output_csv)
-  stats.report(stats_txt)
\ No newline at end of file
+  stats.report(stats_txt)
+  if args.histograms:
+    aggregator.write_histogram('day_%s_histogram.npz' % aggregator.year_month)
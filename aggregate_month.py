@@ -1,13 +1,20 @@
-import sys
-from const import *
-import re
+import os
 import argparse
-import datetime
 import numpy as np
+from parallel import imap_jobs, read_data_list
+from state_store import StateStore, pending_files
+from trip_cache import file_signature
+from speed_stats import BinnedSpeedStats
+from trip_bins import KeyedBins
+from trip_file import NUM_HOURS, HOUR_BASE
 
 # Process daily zone-to-zone aggregation and generate monthly speed aggregation.
 # Bin: yyyy-mm, hour
-# Values: speed, count
+# Values: speed mean, std, 85th percentile, count
+#
+# Mean and std are rolled up exactly from the count, mean and std of the rows of the
+# day_yyyy-mm.csv files. Percentiles need the speed histograms written by
+# aggregate_day.py --histograms next to the CSV, and are nan for bins without them.
 
 parser = argparse.ArgumentParser(
   description='Monthly speed aggregation of TLC yellow cab trips')
@@ -15,18 +22,87 @@ parser.add_argument('--data_list', dest='data_list', type=str, required=True,
                     help='list of data file paths')
 parser.add_argument('--output', dest='output', type=str, required=True,
                     help='output path') # name, without file type suffix
+parser.add_argument('--jobs', dest='jobs', type=int, default=1,
+                    help='number of files processed in parallel')
+parser.add_argument('--state_dir', dest='state_dir', type=str, default='',
+                    help='directory of the partial aggregation states of the data files, '
+                         'reused when up to date')
 args = parser.parse_args()
 
-class Aggregator:
-  def __init__(self):
-    self.bins = {}
+def month_bin_ids(years, months, hours):
+  """
+  Returns: int64 array of the (year, month, hour) bin ids, in the order of the tuples.
+    Only the bin ids that occur get a bin, see KeyedBins.
+  """
+  return (years * 12 + months - 1) * NUM_HOURS + hours
 
-  def add_record(self, year, month, hour, mean, count):
-    bin_id = (year, month, hour)
-    if bin_id not in self.bins:
-      self.bins[bin_id] = [0, 0] # sum, count
-    self.bins[bin_id][0] += mean * count
-    self.bins[bin_id][1] += count
+
+# date,hour,pickup_zone,dropoff_zone,mean,std,percentile_85,count
+# 2009-01-01,0,0,0,17.464400259,6.139807473,25.620456343,8
+# The date is split into year, month and day.
+NUM_DAY_FIELDS = 10
+
+def read_day_csv(file):
+  """
+  Loads a day_yyyy-mm.csv written by aggregate_day.py, with or without header line,
+  in a single NumPy conversion of the whole file.
+
+  Returns: (year, month, hour, mean, std, count) arrays of the rows.
+  """
+  with open(file, 'r') as f:
+    text = f.read().strip()
+  if text.startswith('date'):
+    text = text[text.find('\n') + 1:] if text.find('\n') != -1 else ''
+  values = np.fromstring(text.replace('-', ',').replace('\n', ','), sep=',')
+  if len(values) % NUM_DAY_FIELDS != 0:
+    raise ValueError('malformed day aggregation file %s' % file)
+  values = values.reshape(len(values) / NUM_DAY_FIELDS, NUM_DAY_FIELDS)
+  year, month, hour, count = [values[:, index].astype(np.int64) for index in [0, 1, 3, 9]]
+  return year, month, hour, values[:, 6], values[:, 7], count
+
+
+def histogram_path(file):
+  """
+  Returns: Path of the histograms written by aggregate_day.py --histograms for a
+    day_yyyy-mm.csv.
+  """
+  return os.path.splitext(file)[0] + '_histogram.npz'
+
+
+def histogram_signature(file):
+  """
+  Returns: Signature of the histograms of a day_yyyy-mm.csv, None if there are none.
+  """
+  path = histogram_path(file)
+  return file_signature(path) if os.path.exists(path) else None
+
+
+def read_day_histogram(file):
+  """
+  Returns: (year_month, BinnedSpeedStats) of the day bins written by
+    Aggregator.write_histogram of aggregate_day.py.
+  """
+  with np.load(file) as arrays:
+    return str(arrays['year_month']), BinnedSpeedStats.from_arrays(arrays)
+
+
+class Aggregator(KeyedBins):
+
+  def add_day_csv(self, file):
+    """
+    Adds the rows of a day_yyyy-mm.csv, grouped by month and hour. Uses the histograms
+    next to the file instead when present, which give the same moments plus
+    percentiles.
+    """
+    if os.path.exists(histogram_path(file)):
+      year_month, day_bins = read_day_histogram(histogram_path(file))
+      year, month = [int(x) for x in year_month.split('-')]
+      hours = np.arange(day_bins.num_bins) / HOUR_BASE % NUM_HOURS
+      bin_map = self._indices(month_bin_ids(np.full(day_bins.num_bins, year), month, hours))
+      self.bins.rollup(day_bins, bin_map)
+      return
+    year, month, hour, mean, std, count = read_day_csv(file)
+    self.bins.add_moments(self._indices(month_bin_ids(year, month, hour)), count, mean, std)
 
   def report(self, file):
     with open(file, 'w') as f:
@@ -34,53 +110,76 @@ class Aggregator:
         'year_month',
         'hour',
         'mean',
+        'std',
+        'percentile_85',
         'count'
       ]) + '\n')
 
-      bin_ids = sorted(self.bins.keys())
-
-      for bin_id in bin_ids:
-        sum, count = self.bins[bin_id]
-        assert count > 0
-        f.write('%s,%d,%.9f,%d\n' % (
-          '%s-%02d' % (bin_id[0], bin_id[1]), # yyyy-mm
-          bin_id[2],
-          sum / count,
-          count
-        ))
-
-def process_data(file, aggregator):
-  f = open(file, 'r')
-  print 'processing %s...' % file
-  lines = f.readlines()[1:]
-  line_counter, num_lines = 0, len(lines)
-  for line in lines:
-    line_counter += 1
-    if line_counter % 1000 == 0:
-      print '\r%.2f%%' % (1.0 * line_counter / num_lines * 100),
-      sys.stdout.flush()
-    if line == '':
-      continue
-
-    #date,hour,pickup_zone,dropoff_zone,mean,std,percentile_85,count
-    #2009-01-01,0,0,0,17.464400259,6.139807473,25.620456343,8
-
-    tokens = line.split(',')
-    year, month, day = [int(x) for x in re.split('-', tokens[0])]
-    hour = int(tokens[1])
-    count = int(tokens[-1])
-    mean = float(tokens[4])
-    aggregator.add_record(year, month, hour, mean, count)
-
-  print 'finished processing %s' % file
+      bins = self.nonempty_bins()
+      bin_ids = self.keys[bins]
+      months = bin_ids / NUM_HOURS
+      percentile = np.full(len(bins), np.nan)
+      has_histogram = self.bins.has_histogram(bins)
+      percentile[has_histogram] = self.bins.percentile(bins[has_histogram], 85)
+      columns = zip(
+        months / 12, # year
+        months % 12 + 1, # month
+        bin_ids % NUM_HOURS, # hour
+        self.bins.mean(bins),
+        self.bins.std(bins),
+        percentile,
+        self.bins.count[bins]
+      )
+      f.writelines('%d-%02d,%d,%.9f,%.9f,%.9f,%d\n' % row for row in columns)
+
+def file_state(aggregator):
+  """
+  Returns: Dict of the arrays of the partial results of a data file, for StateStore.
+  """
+  state = aggregator.bins.to_arrays()
+  state['keys'] = aggregator.keys
+  return state
+
+
+def file_results(state):
+  """
+  Returns: Aggregator of the partial results of a dict returned by file_state.
+  """
+  aggregator = Aggregator()
+  aggregator.keys = np.array(state['keys'])
+  aggregator.key_order = np.argsort(aggregator.keys, kind='mergesort')
+  aggregator.bins = BinnedSpeedStats.from_arrays(state)
+  return aggregator
 
-aggregator = Aggregator()
 
-f_data_list = open(args.data_list, 'r')
-for filename in f_data_list.readlines():
-  filename = filename.rstrip()
-  if filename == '':
-    continue
-  process_data(filename, aggregator)
+def process_file(filename):
+  """
+  Returns: Partial Aggregator of one data file.
+  """
+  print 'processing %s...' % filename
+  aggregator = Aggregator()
+  aggregator.add_day_csv(filename)
+  print 'finished processing %s' % filename
+  return aggregator
+
+
+filenames = read_data_list(args.data_list)
+store = StateStore(args.state_dir, {'aggregation': 'month', 'bins': 'year_month_hour'})
+# A state depends on whether the histograms of the file were read, and on which.
+histograms = dict([(filename, histogram_signature(filename)) for filename in filenames])
+states, pending = pending_files(store, filenames, histograms)
+for filename in filenames:
+  if filename in states:
+    print 'skipping %s, stored state is up to date' % filename
+
+for filename, file_aggregator in zip(pending, imap_jobs(process_file, pending, args.jobs)):
+  states[filename] = file_state(file_aggregator)
+  store.save(filename, states[filename], histograms[filename])
+
+# Partial results are merged in the order of the data list, so that a rerun from the
+# stored states gives the same report.
+aggregator = Aggregator()
+for filename in filenames:
+  aggregator.merge(file_results(states[filename]))
 
 aggregator.report(args.output)
@@ -0,0 +1,176 @@
+import sys, os, re
+from raw_trip import ZoneLocator, TripStats
+from trip_reader import print_progress
+from trip_cache import read_validated_trips, reject_nozone
+from parallel import imap_jobs, read_data_list, file_range_tasks, merge_by_file
+from trip_bins import dimensions, parse_dimensions, TripFields, Grouping
+from trip_reports import HourAggregator, DayAggregator, ZoneAggregator
+from const import ZONE_FILE, LOCATION_ZONE_FILE
+import argparse
+
+# Speed aggregation of TLC yellow cab trips by any lists of bin dimensions, computed in
+# a single pass over the data: every trip is parsed and validated once for all the
+# groupings. Groupings by pickup_zone or dropoff_zone only include the trips inside the
+# zones, as aggregate_day.py and aggregate_zone.py; the others include all validated
+# trips, as aggregate_yyyy-mm_hour.py.
+#
+# Each grouping is written to <output_dir>/<dimensions joined by _>.csv with columns
+# <dimensions>,mean,std,percentile_85,count.
+#
+# --reports also writes the reports of the aggregate_*.py scripts from the same pass:
+#   hourly: <output_dir>/<yyyy-mm>.txt per data file, as aggregate_yyyy-mm_hour.py.
+#   day: <output_dir>/day_<yyyy-mm>.csv per data file, as aggregate_day.py.
+#   zone: <output_dir>/zone.csv, as aggregate_zone.py.
+# The trip stats are written once: to <output_dir>/stats/<yyyy-mm>_stats.txt per data
+# file if there are hourly or day reports, and in total to stdout. They include the
+# zone checks if any grouping or report uses zones.
+
+report_names = ['hourly', 'day', 'zone']
+zone_reports = ['day', 'zone']
+month_reports = ['hourly', 'day']
+
+parser = argparse.ArgumentParser(
+  description='Speed aggregation of TLC yellow cab trips by bin dimensions')
+parser.add_argument('--data_list', dest='data_list', type=str, required=True,
+                    help='list of data file paths')
+parser.add_argument('--bin', dest='bin', type=str, action='append', default=[],
+                    help='bin dimensions of one grouping as a comma separated string of '
+                         'the following: ' + ','.join(sorted(dimensions.keys())) +
+                         '; repeat for several groupings')
+parser.add_argument('--reports', dest='reports', type=str, default='',
+                    help='reports of the aggregate scripts as a comma separated string of '
+                         'the following: ' + ','.join(report_names))
+parser.add_argument('--output_dir', dest='output_dir', type=str, default='.',
+                    help='output directory')
+parser.add_argument('--zone_file', dest='zone_file', type=str, default=ZONE_FILE,
+                    help='zone polygon file, used if a grouping or report uses zones')
+parser.add_argument('--location_zone_file', dest='location_zone_file', type=str,
+                    default=LOCATION_ZONE_FILE,
+                    help='lookup table from TLC taxi zone IDs to zones, for the trips '
+                         'without coordinates, used with the zone file')
+parser.add_argument('--jobs', dest='jobs', type=int, default=1,
+                    help='number of worker processes')
+parser.add_argument('--split', dest='split', type=int, default=1,
+                    help='number of byte ranges each data file is split into for the jobs')
+parser.add_argument('--cache_dir', dest='cache_dir', type=str, default='',
+                    help='directory of validated trips written by ingest.py, used when up to date')
+args = parser.parse_args()
+
+try:
+  grouping_names = [parse_dimensions(value) for value in args.bin]
+except ValueError as e:
+  print >> sys.stderr, e
+  sys.exit(1)
+reports = args.reports.split(',') if args.reports != '' else []
+for report in reports:
+  if report not in report_names:
+    print >> sys.stderr, 'unsupported report "%s"' % report
+    sys.exit(1)
+if len(grouping_names) == 0 and len(reports) == 0:
+  print >> sys.stderr, 'no --bin or --reports given'
+  sys.exit(1)
+
+uses_zones = (any(Grouping(names).uses_zones for names in grouping_names) or
+              any(report in zone_reports for report in reports))
+zone_locator = (ZoneLocator(args.zone_file, args.location_zone_file)
+                if uses_zones else None)
+
+class Sinks:
+  def __init__(self, year_month=None):
+    """
+    The groupings and report aggregators fed by the trips of one data file, or all of
+    them for the totals.
+
+    Args:
+      year_month: yyyy-mm of the data file, needed for the hourly and day reports.
+    """
+    self.groupings = [Grouping(names) for names in grouping_names]
+    self.aggregators = {}
+    if 'hourly' in reports and year_month is not None:
+      self.aggregators['hourly'] = HourAggregator(year_month)
+    if 'day' in reports and year_month is not None:
+      self.aggregators['day'] = DayAggregator(year_month)
+    if 'zone' in reports:
+      self.aggregators['zone'] = ZoneAggregator()
+
+  def add_trips(self, trips, stats):
+    """
+    Args:
+      trips: TripBatch of validated trips, with zones located but not checked if
+        zone_locator is set.
+      stats: TripStats updated with the zone checks.
+    """
+    fields = TripFields(trips)
+    zone_fields = TripFields(reject_nozone(trips, stats)) if uses_zones else fields
+    for grouping in self.groupings:
+      grouping.add(zone_fields if grouping.uses_zones else fields)
+    for report, aggregator in self.aggregators.iteritems():
+      aggregator.add_trips(zone_fields.trips if report in zone_reports else trips)
+
+  def merge(self, other):
+    """
+    Merges the groupings and aggregators of another Sinks, skipping the per-month
+    aggregators this one does not have.
+    """
+    for grouping, other_grouping in zip(self.groupings, other.groupings):
+      grouping.merge(other_grouping)
+    for report, aggregator in self.aggregators.iteritems():
+      aggregator.merge(other.aggregators[report])
+
+
+def data_year_month(filename):
+  """
+  Returns: The yyyy-mm of a data file name if there are per-month reports, else None.
+  """
+  if not any(report in month_reports for report in reports):
+    return None
+  return re.match('^.*(\d\d\d\d-\d\d)\.csv$', filename).group(1)
+
+
+def process_range(task):
+  """
+  Aggregates the trips of a data file within a byte range.
+
+  Args:
+    task: (filename, byte_range) from file_range_tasks.
+
+  Returns: (filename, Sinks, TripStats) partial results.
+  """
+  filename, byte_range = task
+  sinks = Sinks(data_year_month(filename))
+  stats = TripStats()
+  print 'processing %s...' % filename
+  for trips, progress in read_validated_trips(filename, stats, zone_locator, args.cache_dir,
+                                              byte_range, keep_nozone=True):
+    if args.jobs == 1:
+      print_progress(progress)
+    sinks.add_trips(trips, stats)
+  print 'finished processing %s' % filename
+  return filename, sinks, stats
+
+
+total_sinks = Sinks()
+stats = TripStats()
+tasks = file_range_tasks(read_data_list(args.data_list), args.split,
+                         args.cache_dir, zone_locator)
+results = imap_jobs(process_range, tasks, args.jobs)
+# Partial results are merged in the order of the data list and byte ranges.
+for filename, sinks, file_stats in merge_by_file(results):
+  year_month = data_year_month(filename)
+  if 'hourly' in reports:
+    sinks.aggregators['hourly'].report(os.path.join(args.output_dir, '%s.txt' % year_month))
+  if 'day' in reports:
+    sinks.aggregators['day'].report(os.path.join(args.output_dir, 'day_%s.csv' % year_month))
+  if year_month is not None:
+    stats_dir = os.path.join(args.output_dir, 'stats')
+    if not os.path.exists(stats_dir):
+      os.makedirs(stats_dir)
+    file_stats.report(os.path.join(stats_dir, '%s_stats.txt' % year_month))
+  total_sinks.merge(sinks)
+  stats.merge(file_stats)
+
+for grouping in total_sinks.groupings:
+  grouping.report(os.path.join(args.output_dir, '%s.csv' % '_'.join(grouping.names)))
+if 'zone' in reports:
+  total_sinks.aggregators['zone'].report(os.path.join(args.output_dir, 'zone.csv'))
+stats.report()
@@ -1,11 +1,18 @@
-import sys
+import os, sys
 from raw_trip import *
+from trip_reader import print_progress
+from trip_cache import read_validated_trips
+from trip_cache import file_signature, input_format
+from parallel import imap_jobs, read_data_list, file_range_tasks, merge_by_file
+from state_store import StateStore, pending_files
 from const import *
 import argparse
 import numpy as np
+import great_circle
+from speed_stats import BinnedSpeedStats
+from trip_file import NUM_ZONE_BINS
+from trip_reports import ZoneAggregator
 
-stats = TripStats()
-zone_locator = ZoneLocator('/data/taxi/ODzones_simp_vertices.csv')
 logger = Logger()
 
 parser = argparse.ArgumentParser(
@@ -14,93 +21,103 @@ parser.add_argument('--data_list', dest='data_list', type=str, required=True,
                     help='list of data file paths')
 parser.add_argument('--output', dest='output', type=str, required=True,
                     help='output path')
+parser.add_argument('--jobs', dest='jobs', type=int, default=1,
+                    help='number of worker processes')
+parser.add_argument('--split', dest='split', type=int, default=1,
+                    help='number of byte ranges each data file is split into for the jobs')
+parser.add_argument('--cache_dir', dest='cache_dir', type=str, default='',
+                    help='directory of validated trips written by ingest.py, used when up to date')
+parser.add_argument('--zone_file', dest='zone_file', type=str, default=ZONE_FILE,
+                    help='zone polygon file')
+parser.add_argument('--location_zone_file', dest='location_zone_file', type=str,
+                    default=LOCATION_ZONE_FILE,
+                    help='lookup table from TLC taxi zone IDs to zones, for the trips '
+                         'without coordinates')
+parser.add_argument('--state_dir', dest='state_dir', type=str, default='',
+                    help='directory of the partial aggregation states of the data files, '
+                         'reused when up to date')
 args = parser.parse_args()
 
-class Aggregator:
-  def __init__(self):
-    self.bins = {}
-
-  def add_trip(self, trip):
-    t = trip.pickup_time
-
-    season = ''
-    for months, key in season_months.iteritems():
-      if t.month in months:
-        season = key
-        break
-
-    day_of_week = t.weekday()
-    is_weekday = day_of_week <= 4
-
-    time_of_day = 3 # off-peak
-    for key, range in time_of_day_ranges.iteritems():
-      if range[0] <= t.time() and t.time() <= range[1]:
-        time_of_day = key
-        break
-
-    bin_id = (trip.pickup_zone, trip.dropoff_zone, season, is_weekday, time_of_day)
-
-    if bin_id not in self.bins:
-      self.bins[bin_id] = []
-    self.bins[bin_id].append(trip.speed)
-
-  def report(self, file=''):
-    with open(file, 'w') as f:
-      f.write(','.join([
-        'pickup_zone',
-        'dropoff_zone',
-        'season',
-        'is_weekday',
-        'time_of_day',
-        'mean',
-        'std',
-        'percentile_85',
-        'count'
-      ]) + '\n')
-
-      for bin_id, speeds in sorted(self.bins.iteritems()):
-        f.write('%s,%s,%s,%s,%s,%.9f,%.9f,%.9f,%d\n' % (
-          zone_names[bin_id[0]],
-          zone_names[bin_id[1]],
-          season_names[bin_id[2]],
-          bin_id[3],
-          time_of_day_names[bin_id[4]],
-          np.average(speeds),
-          np.std(speeds),
-          np.percentile(speeds, 85),
-          len(speeds)
-        ))
-
-def process_raw_data(file, aggregator):
-  f = open(file, 'r')
+zone_locator = ZoneLocator(args.zone_file, args.location_zone_file)
+
+def process_raw_data(file, aggregator, stats, byte_range=None):
   print 'processing %s...' % file
-  lines = f.readlines()[1:]
-  line_counter, num_lines = 0, len(lines)
-  for line in lines:
-    line_counter += 1
-    if line_counter % 1000 == 0:
-      print '\r%.2f%%' % (1.0 * line_counter / num_lines * 100),
-      sys.stdout.flush()
-    if line == '':
-      continue
-
-    try:
-      trip = RawTrip(line=line, zone_locator=zone_locator, stats=stats, logger=logger)
-    except Exception:
-      continue
-
-    aggregator.add_trip(trip)
+  for trips, progress in read_validated_trips(file, stats, zone_locator, args.cache_dir,
+                                              byte_range):
+    if args.jobs == 1:
+      print_progress(progress)
+    aggregator.add_trips(trips)
 
   print 'finished processing %s' % file
 
 
-aggregator = Aggregator()
-f_data_list = open(args.data_list, 'r')
-for filename in f_data_list.readlines():
-  filename = filename.rstrip()
-  if filename == '':
-    continue
-  process_raw_data(filename, aggregator)
+def process_range(task):
+  """
+  Aggregates the trips of a data file within a byte range.
+
+  Args:
+    task: (filename, byte_range) from file_range_tasks.
+
+  Returns: (filename, ZoneAggregator, TripStats) partial results.
+  """
+  filename, byte_range = task
+  aggregator = ZoneAggregator()
+  stats = TripStats()
+  process_raw_data(filename, aggregator, stats, byte_range)
+  return filename, aggregator, stats
+
+
+def file_state(aggregator, stats):
+  """
+  Returns: Dict of the arrays of the partial results of a data file, for StateStore.
+  """
+  state = aggregator.bins.to_arrays()
+  state['trip_counts'] = stats.counts
+  return state
+
+
+def file_results(state):
+  """
+  Returns: (ZoneAggregator, TripStats) partial results of a dict returned by file_state.
+  """
+  aggregator = ZoneAggregator()
+  aggregator.bins = BinnedSpeedStats.from_arrays(state)
+  stats = TripStats()
+  stats.counts = np.array(state['trip_counts'])
+  return aggregator, stats
+
+
+filenames = read_data_list(args.data_list)
+store = StateStore(args.state_dir, {
+  'aggregation': 'zone',
+  'zone_file': file_signature(zone_locator.zone_file),
+  'location_zone_file': (file_signature(zone_locator.location_zone_file)
+                         if os.path.exists(zone_locator.location_zone_file) else None),
+  'great_circle_mode': great_circle.mode,
+  'num_bins': NUM_ZONE_BINS
+})
+# Trips are read from a trip file instead of the CSV when one is usable, per file.
+formats = dict([(filename, input_format(args.cache_dir, filename, zone_locator))
+                for filename in filenames])
+states, pending = pending_files(store, filenames, formats)
+for filename in filenames:
+  if filename in states:
+    print 'skipping %s, stored state is up to date' % filename
+
+tasks = file_range_tasks(pending, args.split, args.cache_dir, zone_locator)
+results = imap_jobs(process_range, tasks, args.jobs)
+for filename, file_aggregator, file_stats in merge_by_file(results):
+  states[filename] = file_state(file_aggregator, file_stats)
+  store.save(filename, states[filename], formats[filename])
+
+# Partial results are merged in the order of the data list, so that a rerun from the
+# stored states gives the same report.
+aggregator = ZoneAggregator()
+stats = TripStats()
+for filename in filenames:
+  file_aggregator, file_stats = file_results(states[filename])
+  aggregator.merge(file_aggregator)
+  stats.merge(file_stats)
 
 aggregator.report(args.output)
 stats.report()
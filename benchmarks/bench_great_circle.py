@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# Compares the great-circle distance modes against geopy's vincenty over the NYC
+# bounding box, and reports the accuracy and the speed of every mode.
+
+import sys, os, time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import great_circle
+
+# NYC bounding box.
+min_lat, max_lat = 40.49, 40.92
+min_lon, max_lon = -74.26, -73.69
+
+parser = argparse.ArgumentParser(
+  description='Benchmark great-circle distance modes against vincenty.')
+parser.add_argument('--num_pairs', dest='num_pairs', type=int, default=20000,
+                    help='number of random point pairs')
+parser.add_argument('--seed', dest='seed', type=int, default=0,
+                    help='random seed')
+args = parser.parse_args()
+
+np.random.seed(args.seed)
+n = args.num_pairs
+
+# Half of the pairs span the whole box, half are short trips around the .1 mile threshold.
+lat1 = np.random.uniform(min_lat, max_lat, n)
+lon1 = np.random.uniform(min_lon, max_lon, n)
+lat2 = np.random.uniform(min_lat, max_lat, n)
+lon2 = np.random.uniform(min_lon, max_lon, n)
+short = np.arange(n) % 2 == 1
+bearing = np.random.uniform(0, 2 * np.pi, n)
+length = np.random.uniform(0, .3, n) / 69. # degrees, roughly
+lat2[short] = lat1[short] + length[short] * np.cos(bearing[short])
+lon2[short] = lon1[short] + length[short] * np.sin(bearing[short]) / np.cos(np.radians(40.7))
+# Reported trip distance, to count flips of the .9x/3x ratio checks.
+reported = np.random.uniform(0, 20, n)
+
+start = time.time()
+reference = great_circle.vincenty_array(lat1, lon1, lat2, lon2)
+vincenty_time = time.time() - start
+
+def threshold_flips(values):
+  flips = np.count_nonzero((values < .1) != (reference < .1))
+  flips += np.count_nonzero((reported < .9 * values) != (reported < .9 * reference))
+  flips += np.count_nonzero((reported > 3. * values) != (reported > 3. * reference))
+  return flips
+
+print '%d point pairs in the NYC bounding box (%d shorter than .3 miles)' % (n, np.count_nonzero(short))
+print '%-16s %14s %14s %8s %14s %14s' % (
+  'mode', 'max abs (mi)', 'max rel', 'flips', 'scalar (us)', 'array (us)')
+for mode in great_circle.supported_modes:
+  scalar = great_circle.scalar_functions[mode]
+  vectorized = great_circle.array_functions[mode]
+  num_scalar = n if mode != 'vincenty' else min(n, 2000)
+
+  start = time.time()
+  for i in xrange(num_scalar):
+    scalar(lat1[i], lon1[i], lat2[i], lon2[i])
+  scalar_time = (time.time() - start) / num_scalar * 1e6
+
+  if mode == 'vincenty':
+    values, array_time = reference, vincenty_time / n * 1e6
+  else:
+    start = time.time()
+    values = vectorized(lat1, lon1, lat2, lon2)
+    array_time = (time.time() - start) / n * 1e6
+
+  error = np.abs(values - reference)
+  valid = reference > 0
+  print '%-16s %14.3e %14.3e %8d %14.3f %14.3f' % (
+    mode, error.max(), (error[valid] / reference[valid]).max(),
+    threshold_flips(values), scalar_time, array_time)
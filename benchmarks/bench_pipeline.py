@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+# Measures the throughput and peak memory of every stage of the raw trip pipeline on
+# synthetic TLC data (see synthetic_trips.py): reading, parsing, validation, zone
+# location and the report aggregators, plus the per-row RawTrip and
+# ZoneLocator.locate paths on a sample. Results are written as JSON, and compared with
+# the JSON of a previous run given by --baseline.
+
+import sys, os, time, json, shutil, subprocess, tempfile, platform, resource
+import argparse
+import numpy as np
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(root)
+from raw_trip import RawTrip, ZoneLocator, TripStats, parse_trip_lines, validate_trips
+from trip_reader import read_line_chunks, read_header
+from trip_schema import detect_schema
+from trip_cache import reject_nozone
+from trip_reports import HourAggregator, DayAggregator, ZoneAggregator
+import synthetic_trips
+
+parser = argparse.ArgumentParser(
+  description='Benchmark the raw trip pipeline stages on synthetic data.')
+parser.add_argument('--num_trips', dest='num_trips', type=int, default=500000,
+                    help='number of synthetic trips')
+parser.add_argument('--reject_rate', dest='reject_rate', type=float, default=.1,
+                    help='fraction of invalid trips')
+parser.add_argument('--era', dest='era', type=str, default='2015',
+                    choices=sorted(synthetic_trips.eras.keys()),
+                    help='CSV layout, by first year')
+parser.add_argument('--zone_grid', dest='zone_grid', type=int, default=3,
+                    help='the zones are a zone_grid x zone_grid grid')
+parser.add_argument('--scalar_trips', dest='scalar_trips', type=int, default=20000,
+                    help='number of trips of the per-row stages')
+parser.add_argument('--seed', dest='seed', type=int, default=0,
+                    help='random seed')
+parser.add_argument('--output', dest='output', type=str, default='bench_pipeline.json',
+                    help='JSON result path')
+parser.add_argument('--baseline', dest='baseline', type=str, default='',
+                    help='JSON result of a previous run to compare with')
+parser.add_argument('--data_dir', dest='data_dir', type=str, default='',
+                    help='directory for the synthetic files, kept after the run; '
+                         'a temporary directory by default')
+args = parser.parse_args()
+
+def reset_peak_rss():
+  """
+  Resets the peak resident set size on Linux, so that each stage has its own peak.
+  Returns: Whether the reset is supported.
+  """
+  try:
+    with open('/proc/self/clear_refs', 'w') as f:
+      f.write('5')
+    return True
+  except IOError:
+    return False
+
+
+def peak_rss_mb():
+  """
+  Returns: Peak resident set size in MB, since the last reset_peak_rss if supported.
+  """
+  if os.path.exists('/proc/self/status'):
+    with open('/proc/self/status', 'r') as f:
+      for line in f:
+        if line.startswith('VmHWM:'):
+          return int(line.split()[1]) / 1024.
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024. # kB on Linux
+
+
+results = []
+peak_is_per_stage = True
+
+def run_stage(name, rows, function):
+  """
+  Times function() and records its rows per second and peak memory.
+
+  Returns: The result of function.
+  """
+  global peak_is_per_stage
+  peak_is_per_stage &= reset_peak_rss()
+  start = time.time()
+  result = function()
+  seconds = time.time() - start
+  results.append({
+    'stage': name,
+    'rows': rows,
+    'seconds': seconds,
+    'rows_per_sec': rows / seconds if seconds > 0 else float('inf'),
+    'peak_rss_mb': peak_rss_mb()
+  })
+  return result
+
+
+def git_commit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=root,
+                                   stderr=open(os.devnull, 'w')).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+data_dir = args.data_dir if args.data_dir != '' else tempfile.mkdtemp(prefix='bench_pipeline')
+if not os.path.exists(data_dir):
+  os.makedirs(data_dir)
+zone_file = os.path.join(data_dir, 'zones.csv')
+location_zone_file = os.path.join(data_dir, 'location_zones.csv')
+trip_file = os.path.join(data_dir, 'yellow_tripdata_%d-%02d.csv' %
+                         synthetic_trips.era_months[args.era])
+num_zones = args.zone_grid * args.zone_grid
+synthetic_trips.write_zone_file(zone_file, args.zone_grid, args.zone_grid)
+synthetic_trips.write_location_zone_file(location_zone_file, num_zones)
+start = time.time()
+reject_counts = synthetic_trips.write_trip_csv(trip_file, args.num_trips, args.reject_rate,
+                                               args.era, num_zones, args.seed)
+print 'generated %d trips in %.1f s' % (args.num_trips, time.time() - start)
+
+zone_locator = ZoneLocator(zone_file)
+schema = detect_schema(read_header(trip_file), location_zone_file)
+year_month = '%d-%02d' % synthetic_trips.era_months[args.era]
+stats = TripStats()
+n = args.num_trips
+
+chunks = run_stage('read', n, lambda: [lines for lines, progress in
+                                       read_line_chunks(trip_file)])
+batches = run_stage('parse', n, lambda: [parse_trip_lines(lines, schema)
+                                         for lines in chunks])
+accepted = run_stage('validate', n, lambda: [validate_trips(batch, stats)
+                                             for batch in batches])
+num_accepted = sum(len(trips) for trips in accepted)
+
+def locate(trips):
+  trips.pickup_zone = trips.locate_zones(zone_locator, 'pickup')
+  trips.dropoff_zone = trips.locate_zones(zone_locator, 'dropoff')
+  return reject_nozone(trips, stats)
+
+located = run_stage('zone_locate', num_accepted, lambda: [locate(trips) for trips in accepted])
+num_located = sum(len(trips) for trips in located)
+
+def aggregate(aggregator, batches):
+  for trips in batches:
+    aggregator.add_trips(trips)
+
+run_stage('aggregate_hourly', num_accepted,
+          lambda: aggregate(HourAggregator(year_month), accepted))
+run_stage('aggregate_day', num_located, lambda: aggregate(DayAggregator(year_month), located))
+run_stage('aggregate_zone', num_located, lambda: aggregate(ZoneAggregator(), located))
+
+if schema.has_coordinates():
+  sample = [line for lines in chunks for line in lines][:args.scalar_trips]
+  run_stage('raw_trip_scalar', len(sample),
+            lambda: [RawTrip(line, TripStats(), zone_locator) for line in sample])
+  trips = accepted[0]
+  lons, lats = trips.pickup_lon[:args.scalar_trips], trips.pickup_lat[:args.scalar_trips]
+  run_stage('zone_locate_scalar', len(lons),
+            lambda: [zone_locator.locate(lon, lat) for lon, lat in zip(lons, lats)])
+
+if args.data_dir == '':
+  shutil.rmtree(data_dir)
+
+report = {
+  'commit': git_commit(),
+  'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+  'python': platform.python_version(),
+  'numpy': np.__version__,
+  'params': {
+    'num_trips': args.num_trips,
+    'reject_rate': args.reject_rate,
+    'era': args.era,
+    'num_zones': num_zones,
+    'seed': args.seed
+  },
+  'reject_counts': reject_counts,
+  'accepted': num_accepted,
+  'located': num_located,
+  'peak_rss_per_stage': peak_is_per_stage,
+  'stages': results
+}
+with open(args.output, 'w') as f:
+  json.dump(report, f, indent=2, sort_keys=True)
+
+baseline = {}
+if args.baseline != '':
+  with open(args.baseline, 'r') as f:
+    baseline = dict([(stage['stage'], stage) for stage in json.load(f)['stages']])
+
+print '%d trips (%s layout), %d accepted, %d in zones' % (n, args.era, num_accepted,
+                                                         num_located)
+print '%-20s %12s %10s %14s %12s%s' % ('stage', 'rows', 'seconds', 'rows/sec', 'peak MB',
+                                       ' %10s' % 'speedup' if baseline else '')
+for stage in results:
+  speedup = ''
+  if stage['stage'] in baseline:
+    speedup = ' %9.2fx' % (stage['rows_per_sec'] / baseline[stage['stage']]['rows_per_sec'])
+  print '%-20s %12d %10.3f %14.0f %12.1f%s' % (stage['stage'], stage['rows'],
+                                             stage['seconds'], stage['rows_per_sec'],
+                                             stage['peak_rss_mb'], speedup)
+if not peak_is_per_stage:
+  print 'peak MB is the peak of the whole process so far'
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+# Compares the timestamp parsers of timestamps.py against the per-row parsing that
+# RawTrip used before, on random TLC timestamps with some format drift.
+
+import sys, os, time, calendar, datetime, re
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from timestamps import INVALID_TIME, parse_timestamp, parse_timestamp_column
+
+parser = argparse.ArgumentParser(
+  description='Benchmark timestamp parsing.')
+parser.add_argument('--num_values', dest='num_values', type=int, default=200000,
+                    help='number of timestamps')
+parser.add_argument('--drift', dest='drift', type=float, default=.01,
+                    help='fraction of timestamps with fractional or missing seconds')
+parser.add_argument('--seed', dest='seed', type=int, default=0,
+                    help='random seed')
+args = parser.parse_args()
+
+def legacy_parse(value):
+  """
+  The per-row parsing of RawTrip before timestamps.py.
+  """
+  year, month, day, hour, minute, second = [int(x) for x in re.split('[ :-]', value)]
+  t = datetime.datetime(year, month, day, hour, minute, second)
+  return calendar.timegm(t.timetuple())
+
+
+def legacy_column(values):
+  """
+  The column parsing of parse_trip_lines before timestamps.py: a NumPy datetime64 cast
+  if every value has 19 characters, otherwise legacy_parse per row.
+  """
+  strings = np.array(values)
+  if strings.dtype.itemsize == 19 and (np.char.str_len(strings) == 19).all():
+    try:
+      return strings.astype('datetime64[s]').astype(np.int64)
+    except ValueError:
+      pass
+  return np.array([scalar_or_invalid(legacy_parse, value) for value in values])
+
+
+def scalar_or_invalid(function, value):
+  try:
+    return function(value)
+  except ValueError:
+    return INVALID_TIME
+
+
+np.random.seed(args.seed)
+n = args.num_values
+epochs = np.random.randint(1230768000, 1483228800, n) # 2009 to 2016
+values = [datetime.datetime.utcfromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S') for t in epochs]
+drift = np.flatnonzero(np.random.uniform(size=n) < args.drift)
+for i in drift[::2]:
+  values[i] = values[i][:16] # missing seconds
+for i in drift[1::2]:
+  values[i] += '.000' # fractional seconds
+clean_values = [value for value in values if len(value) == 19]
+expected = epochs - epochs % 60 * np.array([len(value) == 16 for value in values])
+
+def measure(function, values):
+  start = time.time()
+  result = function(values)
+  return result, (time.time() - start) / len(values) * 1e6
+
+print '%d timestamps, %d with fractional or missing seconds' % (n, len(drift))
+print '%-22s %14s %14s %14s' % ('parser', 'clean (us)', 'drift (us)', 'drift errors')
+parsers = [
+  ('legacy scalar', lambda values: np.array([scalar_or_invalid(legacy_parse, value)
+                                             for value in values])),
+  ('legacy column', legacy_column),
+  ('parse_timestamp', lambda values: np.array([scalar_or_invalid(parse_timestamp, value)
+                                               for value in values])),
+  ('parse_timestamp_column', parse_timestamp_column)
+]
+for name, function in parsers:
+  clean_result, clean_time = measure(function, clean_values)
+  assert (clean_result == epochs[[len(value) == 19 for value in values]]).all()
+  result, drift_time = measure(function, values)
+  print '%-22s %14.3f %14.3f %14d' % (name, clean_time, drift_time,
+                                      np.count_nonzero(result != expected))
@@ -0,0 +1,207 @@
+import datetime
+import numpy as np
+from great_circle import great_circle_miles_array
+
+# Synthetic TLC yellow cab data for benchmarks: trip CSVs in the layout of every era of
+# trip_schema.py, an OD zone polygon file in the format of ODzones_simp_vertices.csv,
+# and a taxi zone ID lookup table for the location_id era. Importers must have the
+# repository root on sys.path.
+#
+# Zones are a grid of rectangles in lower Manhattan and Brooklyn. Valid trips start and
+# end inside the grid, with a trip distance 1.05 to 1.8 times the straight-line distance
+# and a speed of 4 to 35 mph. Rejected trips are spread evenly over the kinds of
+# reject_kinds.
+
+# Bounding box of the zone grid.
+min_lon, max_lon = -74.02, -73.90
+min_lat, max_lat = 40.64, 40.80
+
+# Header and row template of every era, keyed by the first year of the layout.
+eras = {
+  '2009': (
+    'vendor_name,Trip_Pickup_DateTime,Trip_Dropoff_DateTime,Passenger_Count,'
+    'Trip_Distance,Start_Lon,Start_Lat,Rate_Code,store_and_forward,End_Lon,End_Lat,'
+    'Payment_Type,Fare_Amt,surcharge,mta_tax,Tip_Amt,Tolls_Amt,Total_Amt',
+    'VTS,%(pickup_time)s,%(dropoff_time)s,1,%(distance)s,%(pickup_lon)s,%(pickup_lat)s,'
+    ',,%(dropoff_lon)s,%(dropoff_lat)s,CASH,%(fare)s,0,,0,0,%(fare)s'),
+  '2010': (
+    'vendor_id,pickup_datetime,dropoff_datetime,passenger_count,trip_distance,'
+    'pickup_longitude,pickup_latitude,rate_code,store_and_fwd_flag,dropoff_longitude,'
+    'dropoff_latitude,payment_type,fare_amount,surcharge,mta_tax,tip_amount,'
+    'tolls_amount,total_amount',
+    'CMT,%(pickup_time)s,%(dropoff_time)s,1,%(distance)s,%(pickup_lon)s,%(pickup_lat)s,'
+    '1,N,%(dropoff_lon)s,%(dropoff_lat)s,CSH,%(fare)s,0.5,0.5,0,0,%(fare)s'),
+  '2015': (
+    'VendorID,tpep_pickup_datetime,tpep_dropoff_datetime,passenger_count,'
+    'trip_distance,pickup_longitude,pickup_latitude,RateCodeID,store_and_fwd_flag,'
+    'dropoff_longitude,dropoff_latitude,payment_type,fare_amount,extra,mta_tax,'
+    'tip_amount,tolls_amount,improvement_surcharge,total_amount',
+    '1,%(pickup_time)s,%(dropoff_time)s,1,%(distance)s,%(pickup_lon)s,%(pickup_lat)s,'
+    '1,N,%(dropoff_lon)s,%(dropoff_lat)s,1,%(fare)s,0.5,0.5,0,0,0.3,%(fare)s'),
+  '2016h2': (
+    'VendorID,tpep_pickup_datetime,tpep_dropoff_datetime,passenger_count,'
+    'trip_distance,RatecodeID,store_and_fwd_flag,PULocationID,DOLocationID,'
+    'payment_type,fare_amount,extra,mta_tax,tip_amount,tolls_amount,'
+    'improvement_surcharge,total_amount',
+    '1,%(pickup_time)s,%(dropoff_time)s,1,%(distance)s,1,N,%(pickup_location)s,'
+    '%(dropoff_location)s,1,%(fare)s,0.5,0.5,0,0,0.3,%(fare)s')
+}
+
+# Month of the generated trips of every era.
+era_months = {
+  '2009': (2009, 3),
+  '2010': (2014, 3),
+  '2015': (2015, 3),
+  '2016h2': (2016, 9)
+}
+
+reject_kinds = ['missing_pickup', 'missing_dropoff', 'invalid_duration', 'short_distance',
+                'long_distance', 'fast_speed', 'impossible_short_distance', 'nozone',
+                'malformed']
+
+# Number of TLC taxi zone IDs of the location_id era.
+NUM_LOCATIONS = 263
+
+def zone_rectangles(num_columns, num_rows):
+  """
+  Returns: List of (min_lon, min_lat, max_lon, max_lat) of the grid zones, row by row.
+  """
+  lons = np.linspace(min_lon, max_lon, num_columns + 1)
+  lats = np.linspace(min_lat, max_lat, num_rows + 1)
+  return [(lons[i], lats[j], lons[i + 1], lats[j + 1])
+          for j in range(num_rows) for i in range(num_columns)]
+
+
+def write_zone_file(path, num_columns=3, num_rows=3):
+  """
+  Writes the grid zones as an OD zone polygon file with header
+  OBJECTID,part,zone,Long,Latt, readable by raw_trip.ZoneLocator.
+  """
+  with open(path, 'w') as f:
+    f.write('OBJECTID,part,zone,Long,Latt\n')
+    object_id = 0
+    for zone, (x0, y0, x1, y1) in enumerate(zone_rectangles(num_columns, num_rows)):
+      for lon, lat in [(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)]:
+        object_id += 1
+        f.write('%d,0,%d,%.6f,%.6f\n' % (object_id, zone, lon, lat))
+
+
+def location_zones(num_zones):
+  """
+  Returns: int64 array from taxi zone ID to OD zone, -1 for the IDs outside all zones
+    (every num_zones + 1-th ID and ID 0).
+  """
+  return np.arange(NUM_LOCATIONS + 1) % (num_zones + 1) - 1
+
+
+def write_location_zone_file(path, num_zones):
+  """
+  Writes the lookup table of location_zones, readable by
+  trip_schema.read_location_zones.
+  """
+  with open(path, 'w') as f:
+    f.write('LocationID,zone\n')
+    for location, zone in enumerate(location_zones(num_zones)):
+      if location > 0:
+        f.write('%d,%d\n' % (location, zone))
+
+
+def _format_times(t):
+  return [datetime.datetime.utcfromtimestamp(x).strftime('%Y-%m-%d %H:%M:%S') for x in t]
+
+
+def _format_floats(values, precision):
+  return ['%.*f' % (precision, x) for x in values]
+
+
+def write_trip_csv(path, num_trips, reject_rate=.1, era='2015', num_zones=9, seed=0):
+  """
+  Writes a synthetic TLC trip CSV with a header line.
+
+  Args:
+    path: Output path.
+    num_trips: Number of trip lines.
+    reject_rate: Fraction of the trips made invalid, by one of reject_kinds each.
+    era: Key of eras.
+    num_zones: Number of OD zones of write_zone_file or write_location_zone_file.
+    seed: Random seed.
+
+  Returns: Dict from reject kind to the number of trips made invalid by it.
+  """
+  random = np.random.RandomState(seed)
+  n = num_trips
+  year, month = era_months[era]
+  start = (datetime.datetime(year, month, 1) - datetime.datetime(1970, 1, 1)).days * 86400
+
+  pickup_lon = random.uniform(min_lon, max_lon, n)
+  pickup_lat = random.uniform(min_lat, max_lat, n)
+  dropoff_lon = random.uniform(min_lon, max_lon, n)
+  dropoff_lat = random.uniform(min_lat, max_lat, n)
+  rejected = np.flatnonzero(random.uniform(size=n) < reject_rate)
+  kinds = random.randint(0, len(reject_kinds), len(rejected))
+  reject_rows = dict([(kind, rejected[kinds == index])
+                      for index, kind in enumerate(reject_kinds)])
+  # Trips starting west of the grid, before the distances are derived from the points.
+  pickup_lon[reject_rows['nozone']] = min_lon - .02
+
+  # Move the dropoff of very short trips about a mile north or south.
+  euclidean = great_circle_miles_array(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon)
+  short = euclidean < .2
+  dropoff_lat[short] = pickup_lat[short] + np.where(pickup_lat[short] < max_lat - .02,
+                                                    .015, -.015)
+  euclidean = great_circle_miles_array(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon)
+  distance = euclidean * random.uniform(1.05, 1.8, n)
+  speed = np.clip(random.uniform(4, 35, n), distance * 3600 / 7000, distance * 3600 / 90)
+  pickup_time = start + random.randint(0, 28 * 86400, n)
+  dropoff_time = pickup_time + np.round(distance / speed * 3600).astype(np.int64)
+  zones = location_zones(num_zones)
+  valid_locations = np.flatnonzero(zones >= 0)
+  pickup_location = valid_locations[random.randint(0, len(valid_locations), n)]
+  dropoff_location = valid_locations[random.randint(0, len(valid_locations), n)]
+
+  malformed = np.zeros(n, dtype=bool)
+  for kind, rows in reject_rows.iteritems():
+    if kind == 'missing_pickup':
+      pickup_lon[rows] = pickup_lat[rows] = 0
+      pickup_location[rows] = -1
+    elif kind == 'missing_dropoff':
+      dropoff_lon[rows] = dropoff_lat[rows] = 0
+      dropoff_location[rows] = -1
+    elif kind == 'invalid_duration':
+      dropoff_time[rows] = pickup_time[rows]
+    elif kind == 'short_distance':
+      distance[rows] = .05
+    elif kind == 'long_distance':
+      distance[rows] = 25
+    elif kind == 'fast_speed':
+      distance[rows] = np.maximum(distance[rows], 3)
+      dropoff_time[rows] = pickup_time[rows] + 90
+    elif kind == 'impossible_short_distance':
+      distance[rows] = np.maximum(euclidean[rows] * .5, .1)
+    elif kind == 'nozone':
+      pickup_location[rows] = np.flatnonzero(zones == -1)[1] # an ID without zone
+    elif kind == 'malformed':
+      malformed[rows] = True
+
+  header, template = eras[era]
+  columns = {
+    'pickup_time': _format_times(pickup_time),
+    'dropoff_time': _format_times(dropoff_time),
+    'distance': _format_floats(distance, 2),
+    'pickup_lon': _format_floats(pickup_lon, 6),
+    'pickup_lat': _format_floats(pickup_lat, 6),
+    'dropoff_lon': _format_floats(dropoff_lon, 6),
+    'dropoff_lat': _format_floats(dropoff_lat, 6),
+    'pickup_location': [str(x) if x >= 0 else '' for x in pickup_location],
+    'dropoff_location': [str(x) if x >= 0 else '' for x in dropoff_location],
+    'fare': _format_floats(2.5 + distance * 2.5, 2)
+  }
+  names = sorted(columns.keys())
+  with open(path, 'w') as f:
+    f.write(header + '\n')
+    for row, is_malformed in zip(zip(*[columns[name] for name in names]), malformed):
+      line = template % dict(zip(names, row))
+      if is_malformed:
+        line = ','.join(line.split(',')[:3])
+      f.write(line + '\n')
+  return dict([(kind, len(rows)) for kind, rows in reject_rows.iteritems()])
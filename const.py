@@ -53,3 +53,10 @@ zone_names = {
   7: 'Upper East Side',
   8: 'Upper Manhattan'
 }
+
+# Default data files, overridable by the --zone_file and --location_zone_file options.
+# OD zone polygons, see raw_trip.ZoneLocator.
+ZONE_FILE = '/data/taxi/ODzones_simp_vertices.csv'
+# Lookup table from TLC taxi zone IDs to OD zones, written by ingest.py
+# --taxi_zone_centroids.
+LOCATION_ZONE_FILE = '/data/taxi/taxi_zones_ODzones.csv'
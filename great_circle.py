@@ -0,0 +1,137 @@
+import math
+import numpy as np
+
+# Great-circle distance kernels used in place of geopy's vincenty in the hot loops.
+# All functions take (lat, lon) in degrees and return miles.
+#
+# Accuracy modes:
+#   'equirectangular': Flat projection using the WGS-84 meridional and prime vertical
+#                      radii at the mean latitude of the two points. About 0.002% error
+#                      against vincenty for trips within NYC.
+#   'haversine':       Spherical formula with the mean earth radius. Up to ~0.3% error
+#                      against vincenty, depending on the bearing.
+#   'vincenty':        geopy's ellipsoidal solver. Exact, but slow and not vectorized.
+# See benchmarks/bench_great_circle.py for the accuracy and speed comparison.
+
+METERS_PER_MILE = 1609.344
+
+# WGS-84 ellipsoid.
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+
+# Mean earth radius (IUGG) in miles, used by haversine.
+EARTH_RADIUS = 6371008.8 / METERS_PER_MILE
+
+supported_modes = ['equirectangular', 'haversine', 'vincenty']
+
+# Accuracy mode used by great_circle_miles and great_circle_miles_array.
+mode = 'equirectangular'
+
+def set_mode(new_mode):
+  """
+  Args:
+    new_mode: One of supported_modes.
+  """
+  global mode
+  if new_mode not in supported_modes:
+    raise ValueError('unsupported great-circle distance mode "%s"' % new_mode)
+  mode = new_mode
+
+
+def haversine(lat1, lon1, lat2, lon2):
+  """
+  Returns: Spherical great-circle distance in miles between two points.
+  """
+  phi1, phi2 = math.radians(lat1), math.radians(lat2)
+  sin_dphi = math.sin((phi2 - phi1) / 2)
+  sin_dlambda = math.sin(math.radians(lon2 - lon1) / 2)
+  h = sin_dphi * sin_dphi + math.cos(phi1) * math.cos(phi2) * sin_dlambda * sin_dlambda
+  return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(h, 1.)))
+
+
+def haversine_array(lat1, lon1, lat2, lon2):
+  """
+  Vectorized haversine over NumPy arrays (or scalars broadcast against arrays).
+  """
+  phi1, phi2 = np.radians(lat1), np.radians(lat2)
+  sin_dphi = np.sin((phi2 - phi1) / 2)
+  sin_dlambda = np.sin(np.radians(np.subtract(lon2, lon1)) / 2)
+  h = sin_dphi * sin_dphi + np.cos(phi1) * np.cos(phi2) * sin_dlambda * sin_dlambda
+  return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(h, 1.)))
+
+
+def equirectangular(lat1, lon1, lat2, lon2):
+  """
+  Returns: Distance in miles between two nearby points, using the local ellipsoid radii.
+  """
+  phi = math.radians((lat1 + lat2) / 2)
+  sin_phi = math.sin(phi)
+  w = 1 - WGS84_E2 * sin_phi * sin_phi
+  prime_vertical = WGS84_A / math.sqrt(w)
+  meridional = prime_vertical * (1 - WGS84_E2) / w
+  dy = meridional * math.radians(lat2 - lat1)
+  dx = prime_vertical * math.cos(phi) * math.radians(lon2 - lon1)
+  return math.sqrt(dx * dx + dy * dy) / METERS_PER_MILE
+
+
+def equirectangular_array(lat1, lon1, lat2, lon2):
+  """
+  Vectorized equirectangular over NumPy arrays (or scalars broadcast against arrays).
+  """
+  phi = np.radians(np.add(lat1, lat2) / 2)
+  sin_phi = np.sin(phi)
+  w = 1 - WGS84_E2 * sin_phi * sin_phi
+  prime_vertical = WGS84_A / np.sqrt(w)
+  meridional = prime_vertical * (1 - WGS84_E2) / w
+  dy = meridional * np.radians(np.subtract(lat2, lat1))
+  dx = prime_vertical * np.cos(phi) * np.radians(np.subtract(lon2, lon1))
+  return np.sqrt(dx * dx + dy * dy) / METERS_PER_MILE
+
+
+def vincenty(lat1, lon1, lat2, lon2):
+  """
+  Returns: geopy's vincenty distance in miles.
+  """
+  from geopy.distance import vincenty as geopy_vincenty
+  return geopy_vincenty((lat1, lon1), (lat2, lon2)).miles
+
+
+def vincenty_array(lat1, lon1, lat2, lon2):
+  """
+  geopy's vincenty applied element by element. Only meant as a reference.
+  """
+  lat1, lon1, lat2, lon2 = np.broadcast_arrays(lat1, lon1, lat2, lon2)
+  result = np.empty(lat1.shape)
+  for index in np.ndindex(lat1.shape):
+    result[index] = vincenty(lat1[index], lon1[index], lat2[index], lon2[index])
+  return result
+
+
+scalar_functions = {
+  'equirectangular': equirectangular,
+  'haversine': haversine,
+  'vincenty': vincenty
+}
+
+array_functions = {
+  'equirectangular': equirectangular_array,
+  'haversine': haversine_array,
+  'vincenty': vincenty_array
+}
+
+def great_circle_miles(point1, point2):
+  """
+  Drop-in replacement for vincenty(point1, point2).miles, using the current mode.
+
+  Args:
+    point1, point2: (lat, lon) tuples.
+  """
+  return scalar_functions[mode](point1[0], point1[1], point2[0], point2[1])
+
+
+def great_circle_miles_array(lat1, lon1, lat2, lon2):
+  """
+  Returns: NumPy array of distances in miles, using the current mode.
+  """
+  return array_functions[mode](lat1, lon1, lat2, lon2)
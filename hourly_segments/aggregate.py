@@ -3,9 +3,11 @@
 # Process the generated speed files and aggregate the speeds based on 
 # street, hour, time of day, etc.
 
-import sys, datetime, re
+import sys, os, calendar, datetime, re
 import road_network, sign_installation, speed_limit
 import argparse
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import time_bins
 
 supported_bin_attrs = [
   'segment',
@@ -34,6 +36,13 @@ parser.add_argument('--total', dest='total', action='store_true',
                     help='compute total rather than average')
 parser.add_argument('--data_type', dest='data_type', default='speed', type=str,
                     help='aggregated data type: speed, volume, count (only affect csv header)')
+parser.add_argument('--network_snapshot', dest='network_snapshot', type=str,
+                    default='network/lion_network.npz',
+                    help='snapshot of the network with speed limits, written on the first run '
+                         'and reused while the network and speed limit files are unchanged; '
+                         'empty to always read the files')
+parser.add_argument('--jobs', dest='jobs', type=int, default=1,
+                    help='number of worker processes for the speed limit paths')
 parser.set_defaults(with_sign=None)
 
 args = parser.parse_args()
@@ -61,27 +70,43 @@ compute_total = args.total
 # Write the pruned network to a clean network file used by speed estimation (without attributes irrelevant to speed estimation).
 #road_network.write_clean_network(network_pruned, 'network/lion_network_pruned.txt')
 
-# Read the lion network.
-network_lion = road_network.read_lion('network/lion_nodes.csv', 'network/lion_edges.csv')
+# Read the network and its speed limits from the snapshot of a previous run if the
+# input files are unchanged.
+network_inputs = ['network/lion_nodes.csv', 'network/lion_edges.csv', 'network/speed_limit.csv']
+network = None
+if args.network_snapshot != '':
+  network = road_network.load_snapshot(args.network_snapshot, network_inputs)
 
-# Set network
-network = network_lion
+if network is None:
+  # Read the lion network.
+  network_lion = road_network.read_lion('network/lion_nodes.csv', 'network/lion_edges.csv')
 
-# Parse the sign installation. We do not have complete information and the precise installation dates
-# for now. The following lines generate and read the (incomplete) sign installation information.
-#sign_installation.process('corridors_sign_installation.csv', 'network/sign_installation.csv', network)
-#sign_installation.read('network/sign_installation.csv', network)
+  # Set network
+  network = network_lion
 
+  # Parse the sign installation. We do not have complete information and the precise installation dates
+  # for now. The following lines generate and read the (incomplete) sign installation information.
+  # Add network/sign_installation.csv to network_inputs when reading it.
+  #sign_installation.process('corridors_sign_installation.csv', 'network/sign_installation.csv', network)
+  #sign_installation.read('network/sign_installation.csv', network)
 
-# If speed limit information is needed, then place the speed_limit.csv file
-# within the running directory and uncomment the line that generates/reads it.
-# Generate speed limit
-#speed_limit.process('Speed_limit_manhattan_verified.csv', 'speed_limit.csv', network)
-# Read speed limit
-speed_limit.read('network/speed_limit.csv', network)
-# Plot speed limit (for visualization only)
-#speed_limit.plot_sign('sign_locations_lion_maxsl.csv', network)
 
+  # If speed limit information is needed, then place the speed_limit.csv file
+  # within the running directory and uncomment the line that generates/reads it.
+  # Generate speed limit
+  #speed_limit.process('Speed_limit_manhattan_verified.csv', 'speed_limit.csv', network)
+  # Read speed limit
+  speed_limit.read('network/speed_limit.csv', network, args.jobs)
+  # Plot speed limit (for visualization only)
+  #speed_limit.plot_sign('sign_locations_lion_maxsl.csv', network)
+
+  if args.network_snapshot != '':
+    road_network.write_snapshot(network, args.network_snapshot, network_inputs)
+
+
+# Sign and speed limit of every edge, looked up per speed below.
+edge_signs = [road_network.sign_names[code] for code in network.edge_sign]
+edge_speed_limits = network.edge_speed_limit.tolist()
 
 # Time of day definition.
 times_of_day = {
@@ -140,6 +165,15 @@ seasons = {
   'Winter': [12, 1, 2]
 }
 
+# Lookup tables of the above definitions, indexed by rank.
+times_of_day_table = time_bins.time_of_day_table(
+  dict([(times_of_day_rank[name], t_range) for name, t_range in times_of_day.iteritems()]),
+  times_of_day_rank['off-peak'])
+times_of_day_by_rank = dict([(rank, name) for name, rank in times_of_day_rank.iteritems()])
+season_names = sorted(seasons.keys())
+seasons_table = time_bins.season_table(
+  dict([(tuple(seasons[name]), rank) for rank, name in enumerate(season_names)]))
+
 # Stores the bin sum and count.
 # Bin id is a concatenation of attributes, such as '<segment_id>,<year>,<month>,<day of week>'
 bins = {}
@@ -163,31 +197,26 @@ for speed_file in f_speeds.readlines():
     line_tokens = line.split()
     dt_tokens = [int(x) for x in re.split('-|_', line_tokens[0])]
     year, month, day, hour, minute, second = dt_tokens
-    dt = datetime.datetime(year, month, day, hour, minute, second)
-    time_of_day = 'off-peak' # If not in other time_of_day bins, then it's off peak.
-    for t_of_day, t_range in times_of_day.iteritems():
-      if t_range[0] <= dt.time() and dt.time() <= t_range[1]:
-        time_of_day = t_of_day
-        break
-    season = ''
-    for season_name, season_months in seasons.iteritems():
-      if month in season_months:
-        season = season_name
-    day_of_week = day_of_week_names[dt.weekday()]
-    is_weekday = True if dt.weekday() <= 4 else False
+    t = calendar.timegm((year, month, day, hour, minute, second))
+    # If not in other time_of_day bins, then it's off peak.
+    time_of_day = times_of_day_by_rank[time_bins.time_of_day(t, times_of_day_table)]
+    season = season_names[time_bins.season(t, seasons_table)]
+    weekday = time_bins.day_of_week(t)
+    day_of_week = day_of_week_names[weekday]
+    is_weekday = weekday <= 4
 
     speeds = [float(x) for x in line_tokens[1:]]
     counts = [int(x) for x in count_tokens[1:]]
     for edge_index, speed in enumerate(speeds):
       if speed == -1:
         continue # Skip roads without computed speeds.
-      sign = network.edges[edge_index].sign
+      sign = edge_signs[edge_index]
       count = counts[edge_index]
 
       if (with_sign == True and sign != 'yes') or (with_sign == False and sign != 'no'):
         continue
 
-      speed_limit = network.edges[edge_index].speed_limit
+      speed_limit = edge_speed_limits[edge_index]
 
       #bin_id = ','.join([sign, 'before' if dt < announcement_date else 'after'])
       #bin_arr = [year, month]
@@ -13,10 +13,21 @@ parser.add_argument('--treatment', dest='treatment_file', type=str, required=Tru
                     help='path to treatment speed file')
 parser.add_argument('--output', dest='output', type=str, required=True,
                     help='output path')
+parser.add_argument('--network_snapshot', dest='network_snapshot', type=str,
+                    default='network/lion_network_base.npz',
+                    help='snapshot of the network, written on the first run and reused while '
+                         'the network files are unchanged; empty to always read the files')
 
 args = parser.parse_args()
 
-network = road_network.read_lion('network/lion_nodes.csv', 'network/lion_edges.csv')
+network_inputs = ['network/lion_nodes.csv', 'network/lion_edges.csv']
+network = None
+if args.network_snapshot != '':
+  network = road_network.load_snapshot(args.network_snapshot, network_inputs)
+if network is None:
+  network = road_network.read_lion('network/lion_nodes.csv', 'network/lion_edges.csv')
+  if args.network_snapshot != '':
+    road_network.write_snapshot(network, args.network_snapshot, network_inputs)
 
 control_results = {}
 first_line = True
@@ -1,19 +1,75 @@
 #!/usr/bin/env python
 
-# Process the road network file and generate nodes, edges objects.
+# Process the road network file and generate the road network arrays.
 
-import sys, datetime, math, copy, bisect
-from geopy.distance import vincenty
-import heapq
+import sys, os, datetime, math, hashlib, json
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import great_circle
+from great_circle import great_circle_miles, great_circle_miles_array
+from great_circle import WGS84_A, WGS84_E2, METERS_PER_MILE
+from parallel import imap_jobs
+
+# Lower bound of the great-circle miles per degree of latitude, and of longitude at the
+# equator: the WGS-84 meridional radius of curvature at the equator, the smallest radius
+# of the ellipsoid.
+MIN_MILES_PER_DEGREE = WGS84_A * (1 - WGS84_E2) * math.pi / 180 / METERS_PER_MILE
+
+def search_radius(threshold, max_abs_lat):
+  """
+  Args:
+    threshold: Distance in miles.
+    max_abs_lat: Largest absolute latitude of the points.
+
+  Returns: Radius in degrees of the Euclidean lat/lon distance beyond which two points,
+    one of them within max_abs_lat, are more than threshold miles apart. It has a 1.5x
+    margin for the accuracy modes of great_circle.
+  """
+  cos_lat = math.cos(math.radians(min(max_abs_lat + 1, 90)))
+  if cos_lat <= 0:
+    return float('inf')
+  return 1.5 * threshold / (MIN_MILES_PER_DEGREE * cos_lat)
+
+
+def expand_ranges(starts, counts):
+  """
+  Returns: int64 array of the concatenated ranges [start, start + count).
+  """
+  offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+  return np.repeat(starts, counts) + offsets
+
+# Sign states of edges, indexed by the codes of RoadNetwork.edge_sign.
+sign_names = ['unknown', 'no', 'yes', 'conflict']
+sign_codes = dict((name, code) for code, name in enumerate(sign_names))
+
+# Edge attributes set for few edges, kept in dicts of RoadNetwork.edge_notes by edge id,
+# with their values for the other edges. Year = 1 denotes no information.
+edge_note_defaults = {
+  'date_inst': datetime.date(1, 1, 1),
+  'date_inst_path': '', # path that sets the date_inst
+  'sign_path': '' # path that sets the sign
+}
 
 class Node:
-  def __init__(self, id, lat, lon, virtual=False):
+  def __init__(self, network, id):
+    """
+    View of a node of a RoadNetwork, reading the network arrays.
+    """
+    self.network = network
     self.id = id
-    self.lat = lat
-    self.lon = lon
-    self.virtual = virtual
-    self.incident_edges = []
-    
+
+  def __getattr__(self, name):
+    if name == 'lat':
+      return self.network.node_lat[self.id].item()
+    if name == 'lon':
+      return self.network.node_lon[self.id].item()
+    if name == 'virtual':
+      return self.network.node_virtual[self.id].item()
+    if name == 'incident_edges':
+      return self.network.incident_edges(self.id)
+    raise AttributeError(name)
+
   def __str__(self):
     return '%f,%f' % (self.lat, self.lon)
 
@@ -28,25 +84,198 @@ class Node:
 
 
 class Edge:
-  def __init__(self, edge_id, source, target, dist,
-               street='', twoway=False, segment_count=0, segment_id=-1):
-    self.id = (source, target)
-    self.edge_id = edge_id
-    self.source = source
-    self.target = target
-    self.dist = dist
-
-    self.street = street
-    self.twoway = twoway
-    self.segment_count = segment_count
-    self.segment_id = segment_id
-
-    self.date_inst = datetime.date(1, 1, 1) # Year = 1 denotes no information.
-    self.date_inst_path = '' # path that sets the date_inst
-    self.sign = 'unknown'
-    self.sign_path = '' # path that sets the sign
-    self.speed_limit = 0 # speed limit 0 is unknown
-    self.speed_limits = [] # all limits identified
+
+  # Attributes read from the network arrays, by array name.
+  array_attrs = {
+    'source': 'edge_source',
+    'target': 'edge_target',
+    'dist': 'edge_dist',
+    'twoway': 'edge_twoway',
+    'segment_count': 'edge_segment_count',
+    'segment_id': 'edge_segment_id',
+    'speed_limit': 'edge_speed_limit' # speed limit 0 is unknown
+  }
+
+  # Attributes that can be set.
+  writable_attrs = ['sign', 'speed_limit', 'speed_limits'] + edge_note_defaults.keys()
+
+  def __init__(self, network, edge_id):
+    """
+    View of an edge of a RoadNetwork, reading and writing the network arrays.
+    """
+    self.__dict__['network'] = network
+    self.__dict__['edge_id'] = edge_id
+
+  def __getattr__(self, name):
+    network, edge_id = self.network, self.edge_id
+    if name in self.array_attrs:
+      return getattr(network, self.array_attrs[name])[edge_id].item()
+    if name == 'id':
+      return (self.source, self.target)
+    if name == 'street':
+      return network.street_names[network.edge_street[edge_id]]
+    if name == 'sign':
+      return sign_names[network.edge_sign[edge_id]]
+    if name == 'speed_limits': # all limits identified
+      return network.edge_notes['speed_limits'].setdefault(edge_id, [])
+    if name in edge_note_defaults:
+      return network.edge_notes[name].get(edge_id, edge_note_defaults[name])
+    raise AttributeError(name)
+
+  def __setattr__(self, name, value):
+    network, edge_id = self.network, self.edge_id
+    if name not in self.writable_attrs:
+      raise AttributeError('edge attribute "%s" is read-only' % name)
+    if name == 'sign':
+      network.edge_sign[edge_id] = sign_codes[value]
+    elif name == 'speed_limit':
+      network.edge_speed_limit[edge_id] = value
+    else:
+      network.edge_notes[name][edge_id] = value
+
+
+class ElementViews:
+  def __init__(self, network, view, count):
+    """
+    Read-only sequence of the Node or Edge views of a RoadNetwork, in place of the
+    lists of objects.
+    """
+    self.network = network
+    self.view = view
+    self.count = count
+
+  def __len__(self):
+    return self.count
+
+  def __getitem__(self, index):
+    if index < 0:
+      index += self.count
+    if index < 0 or index >= self.count:
+      raise IndexError(index)
+    return self.view(self.network, index)
+
+  def __iter__(self):
+    for index in xrange(self.count):
+      yield self.view(self.network, index)
+
+
+class EdgeIndex:
+  def __init__(self, network):
+    """
+    Read-only (source, target) -> Edge mapping over RoadNetwork.find_edge, in place of
+    the dict of edges.
+    """
+    self.network = network
+
+  def __contains__(self, key):
+    return self.network.find_edge(key[0], key[1]) != -1
+
+  def __getitem__(self, key):
+    edge_id = self.network.find_edge(key[0], key[1])
+    if edge_id == -1:
+      raise KeyError(key)
+    return Edge(self.network, edge_id)
+
+
+class NodeGrid:
+  def __init__(self, lats, lons, cell_size):
+    """
+    Uniform lat/lon grid over the nodes of a network, for nearest node queries. Nodes
+    are sorted by cell and then by index, so that the nodes of a cell are the range
+    order[cell_starts[cell]:cell_starts[cell + 1]].
+
+    Args:
+      lats, lons: NumPy arrays of the node coordinates, indexed by node id.
+      cell_size: Cell width and height in degrees.
+    """
+    self.lats, self.lons = lats, lons
+    self.cell_size = cell_size
+    self.min_lat, self.min_lon = lats.min(), lons.min()
+    self.ny = int((lats.max() - self.min_lat) / cell_size) + 1
+    self.nx = int((lons.max() - self.min_lon) / cell_size) + 1
+    iy, ix = self._cell_indices(lats, lons)
+    cells = iy * self.nx + ix
+    self.order = np.argsort(cells, kind='mergesort')
+    self.cell_starts = np.searchsorted(cells[self.order], np.arange(self.ny * self.nx + 1))
+    self.lists = None # built by the first nearest_one
+
+  def _cell_indices(self, lats, lons):
+    iy = np.floor((lats - self.min_lat) / self.cell_size).astype(np.int64)
+    ix = np.floor((lons - self.min_lon) / self.cell_size).astype(np.int64)
+    return iy, ix
+
+  def _ring_count(self, radius):
+    """
+    Returns: Number of rings of cells around a cell covering the given radius.
+    """
+    if radius >= self.cell_size * max(self.nx, self.ny):
+      return max(self.nx, self.ny)
+    return int(math.ceil(radius / self.cell_size))
+
+  def nearest(self, lats, lons, radius):
+    """
+    Finds the node of the smallest Euclidean lat/lon distance to every point, as the
+    linear scan of RoadNetwork.find_intersection: ties go to the smallest node id.
+
+    Args:
+      lats, lons: NumPy arrays of point coordinates.
+      radius: Search radius in degrees.
+
+    Returns: int64 array of node ids, -1 for points without nodes within radius.
+    """
+    num_points = len(lats)
+    iy, ix = self._cell_indices(lats, lons)
+    k = self._ring_count(radius)
+    pair_points, pair_nodes = [], []
+    for dy in range(-k, k + 1):
+      for dx in range(-k, k + 1):
+        y, x = iy + dy, ix + dx
+        points = np.flatnonzero((y >= 0) & (y < self.ny) & (x >= 0) & (x < self.nx))
+        cells = y[points] * self.nx + x[points]
+        starts = self.cell_starts[cells]
+        counts = self.cell_starts[cells + 1] - starts
+        pair_points.append(np.repeat(points, counts))
+        pair_nodes.append(self.order[expand_ranges(starts, counts)])
+    pair_points = np.concatenate(pair_points)
+    pair_nodes = np.concatenate(pair_nodes)
+
+    dlat = lats[pair_points] - self.lats[pair_nodes]
+    dlon = lons[pair_points] - self.lons[pair_nodes]
+    dist = np.sqrt(dlat * dlat + dlon * dlon)
+    within = dist <= radius
+    pair_points, pair_nodes, dist = pair_points[within], pair_nodes[within], dist[within]
+    # First pair of every point by distance and then node id.
+    order = np.lexsort((pair_nodes, dist, pair_points))
+    points, first = np.unique(pair_points[order], return_index=True)
+    nearest = np.full(num_points, -1, dtype=np.int64)
+    nearest[points] = pair_nodes[order[first]]
+    return nearest
+
+  def nearest_one(self, lat, lon, radius):
+    """
+    Scalar nearest() of a single point, on Python lists of the grid arrays rather than
+    the arrays, which are slow to access element by element.
+
+    Returns: Node id, or -1.
+    """
+    iy = int(math.floor((lat - self.min_lat) / self.cell_size))
+    ix = int(math.floor((lon - self.min_lon) / self.cell_size))
+    k = self._ring_count(radius)
+    if self.lists is None:
+      self.lists = (self.order.tolist(), self.cell_starts.tolist(), self.lats.tolist(),
+                    self.lons.tolist())
+    order, cell_starts, lats, lons = self.lists
+    best_dist, choice = radius, -1
+    for y in range(max(iy - k, 0), min(iy + k + 1, self.ny)):
+      for x in range(max(ix - k, 0), min(ix + k + 1, self.nx)):
+        cell = y * self.nx + x
+        for index in order[cell_starts[cell]:cell_starts[cell + 1]]:
+          node_lat, node_lon = lats[index], lons[index]
+          dist = math.sqrt((lat - node_lat) * (lat - node_lat) + (lon - node_lon) * (lon - node_lon))
+          if dist < best_dist or (dist == best_dist and (choice == -1 or index < choice)):
+            best_dist = dist
+            choice = index
+    return choice
 
 
 class RoadNetwork:
@@ -54,19 +283,148 @@ class RoadNetwork:
   # Maximum tolerance for matching intersection.
   intersection_threshold = 0.1
   
-  def __init__(self, nodes=[], edges=[]):
+  def __init__(self, node_lat, node_lon, edge_source, edge_target, edge_dist,
+               node_virtual=None, edge_street=None, street_names=None, edge_twoway=None,
+               edge_segment_count=None, edge_segment_id=None):
     """
+    Road network kept in NumPy arrays indexed by node id and edge id. Adjacency is in
+    CSR form: the edges leaving node i are adjacency_edges[adjacency_offsets[i]:
+    adjacency_offsets[i + 1]], in order of edge id, with their targets in
+    adjacency_targets. Edges are looked up by (source, target) in the sorted edge_keys.
+
+    nodes and edges give Node and Edge views of the arrays, and edge_dict the
+    (source, target) lookup of edges, for per-element access.
+
     Args:
-      nodes: List of nodes.
-      edges: List of edges.
+      node_lat, node_lon: Node coordinates.
+      edge_source, edge_target: Node ids of the edges.
+      edge_dist: Edge lengths in miles.
+      node_virtual: Whether nodes are virtual intersections, False by default.
+      edge_street, street_names: Street of the edges, as ids into the list of street
+        names, see street_ids. Empty by default.
+      edge_twoway: Whether edges are two-way roads, False by default.
+      edge_segment_count: Number of LION segments of the edges, 0 by default.
+      edge_segment_id: LION segment id of the edges, -1 by default.
+    """
+    num_nodes, num_edges = len(node_lat), len(edge_source)
+    self.node_lat = np.asarray(node_lat, dtype=np.float64)
+    self.node_lon = np.asarray(node_lon, dtype=np.float64)
+    self.node_virtual = (np.asarray(node_virtual, dtype=bool) if node_virtual is not None
+                         else np.zeros(num_nodes, dtype=bool))
+
+    self.edge_source = np.asarray(edge_source, dtype=np.int64)
+    self.edge_target = np.asarray(edge_target, dtype=np.int64)
+    self.edge_dist = np.asarray(edge_dist, dtype=np.float64)
+    if edge_street is None:
+      edge_street, street_names = np.zeros(num_edges, dtype=np.int32), ['']
+    self.edge_street = np.asarray(edge_street, dtype=np.int32)
+    self.street_names = list(street_names)
+    self.edge_twoway = (np.asarray(edge_twoway, dtype=bool) if edge_twoway is not None
+                        else np.zeros(num_edges, dtype=bool))
+    self.edge_segment_count = (np.asarray(edge_segment_count, dtype=np.int64)
+                               if edge_segment_count is not None
+                               else np.zeros(num_edges, dtype=np.int64))
+    self.edge_segment_id = (np.asarray(edge_segment_id, dtype=np.int64)
+                            if edge_segment_id is not None
+                            else np.full(num_edges, -1, dtype=np.int64))
+
+    # Attributes set by speed_limit.read and sign_installation.read.
+    self.edge_speed_limit = np.zeros(num_edges, dtype=np.int64) # 0 is unknown
+    self.edge_sign = np.zeros(num_edges, dtype=np.int8) # codes of sign_names
+    self.edge_notes = dict((name, {}) for name in edge_note_defaults.keys() + ['speed_limits'])
+
+    self.adjacency_edges = np.argsort(self.edge_source, kind='mergesort')
+    self.adjacency_targets = self.edge_target[self.adjacency_edges]
+    self.adjacency_offsets = np.searchsorted(self.edge_source[self.adjacency_edges],
+                                             np.arange(num_nodes + 1))
+    # Sorted keys source * num_nodes + target. Parallel edges keep their edge order, and
+    # the last one is found, as in a dict of the edges.
+    keys = self.edge_source * num_nodes + self.edge_target
+    self.edge_key_order = np.argsort(keys, kind='mergesort')
+    self.edge_keys = keys[self.edge_key_order]
+
+    self.nodes = ElementViews(self, Node, num_nodes)
+    self.edges = ElementViews(self, Edge, num_edges)
+    self.edge_dict = EdgeIndex(self)
+    self.node_grid = None # built by the first intersection query
+    # Built by the first path search.
+    self.reverse_adjacency = None
+    self.search_arrays = None
+    self.path_bound_ratio = None
+
+
+  # Arrays of the network given to the constructor, see to_arrays.
+  constructor_arrays = ['node_lat', 'node_lon', 'edge_source', 'edge_target', 'edge_dist',
+                        'node_virtual', 'edge_street', 'street_names', 'edge_twoway',
+                        'edge_segment_count', 'edge_segment_id']
+
+  def to_arrays(self):
+    """
+    Returns: Dict of the arrays holding the network, see from_arrays. Street names are
+      a string array, and the edge notes a JSON string.
+    """
+    arrays = dict([(key, getattr(self, key)) for key in self.constructor_arrays])
+    arrays['street_names'] = np.array(self.street_names, dtype=str)
+    arrays['edge_speed_limit'] = self.edge_speed_limit
+    arrays['edge_sign'] = self.edge_sign
+    notes = dict([(name, dict([(str(edge_id), value) for edge_id, value in values.iteritems()]))
+                  for name, values in self.edge_notes.iteritems()])
+    for edge_id, value in notes['date_inst'].items():
+      notes['date_inst'][edge_id] = value.isoformat()
+    arrays['edge_notes'] = np.array(json.dumps(notes, sort_keys=True))
+    return arrays
+
+  @staticmethod
+  def from_arrays(arrays):
+    """
+    Returns: The RoadNetwork of a dict returned by to_arrays.
+    """
+    values = dict([(key, arrays[key]) for key in RoadNetwork.constructor_arrays])
+    values['street_names'] = arrays['street_names'].tolist()
+    network = RoadNetwork(**values)
+    network.edge_speed_limit = np.array(arrays['edge_speed_limit'])
+    network.edge_sign = np.array(arrays['edge_sign'])
+    notes = json.loads(str(arrays['edge_notes']))
+    for name, values in notes.iteritems():
+      for edge_id, value in values.iteritems():
+        if name == 'date_inst':
+          value = (datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S') if 'T' in value
+                   else datetime.datetime.strptime(value, '%Y-%m-%d').date())
+        elif name != 'speed_limits': # paths of CSV tokens
+          value = [str(token) for token in value] if isinstance(value, list) else str(value)
+        network.edge_notes[name][int(edge_id)] = value
+    return network
+
+  def incident_edges(self, node):
+    """
+    Returns: List of the Edge views leaving a node, in order of edge id.
+    """
+    start, end = self.adjacency_offsets[node], self.adjacency_offsets[node + 1]
+    return [Edge(self, edge_id) for edge_id in self.adjacency_edges[start:end].tolist()]
+
+  def find_edges(self, sources, targets):
     """
-    self.nodes = nodes
-    self.edges = edges
-    self.edge_dict = {}
-    for edge in edges:
-      self.edge_dict[(edge.source, edge.target)] = edge
-      self.nodes[edge.source].incident_edges.append(edge)
+    Args:
+      sources, targets: int64 NumPy arrays of node ids.
 
+    Returns: int64 array of the ids of the edges from sources to targets, -1 for
+      missing edges. Of parallel edges, the one with the largest id is returned.
+    """
+    num_nodes = len(self.node_lat)
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    keys = sources * num_nodes + targets
+    position = np.searchsorted(self.edge_keys, keys, side='right') - 1
+    found = ((position >= 0) & (sources >= 0) & (sources < num_nodes) &
+             (targets >= 0) & (targets < num_nodes))
+    found[found] = self.edge_keys[position[found]] == keys[found]
+    return np.where(found, self.edge_key_order[np.maximum(position, 0)], -1)
+
+  def find_edge(self, source, target):
+    """
+    Returns: Id of the edge from source to target, or -1.
+    """
+    return int(self.find_edges(np.array([source]), np.array([target]))[0])
 
   def edge_center(self, segment_id):
     """
@@ -75,146 +433,438 @@ class RoadNetwork:
 
     Returns: The coordinates of the center of the segment.
     """
-    edge = self.edges[segment_id]
-    lat1, lon1 = self.nodes[edge.source].lat, self.nodes[edge.source].lon
-    lat2, lon2 = self.nodes[edge.target].lat, self.nodes[edge.target].lon
+    source, target = self.edge_source[segment_id], self.edge_target[segment_id]
+    lat1, lon1 = self.node_lat[source].item(), self.node_lon[source].item()
+    lat2, lon2 = self.node_lat[target].item(), self.node_lon[target].item()
     return ((lat1 + lat2) / 2, (lon1 + lon2) / 2)
 
+  def _node_grid(self):
+    """
+    Returns: The NodeGrid of the nodes, built on the first call. Its cells are as wide
+      as the search radius of intersection_threshold, so that a query visits 3 x 3 cells.
+    """
+    if self.node_grid is None:
+      cell_size = search_radius(self.intersection_threshold, np.abs(self.node_lat).max())
+      self.node_grid = NodeGrid(self.node_lat, self.node_lon, cell_size)
+    return self.node_grid
+
   def find_intersection(self, point):
-    """Finds the intersection that is closest to (lon, lat)
-    Returns: Id of the intersection
+    """Finds the intersection that is closest to (lat, lon) by Euclidean lat/lon
+    distance, and checks that it is within intersection_threshold miles.
+
+    Only the nodes within search_radius of the point are visited: if the closest node
+    is farther away, it fails the threshold anyway.
+
+    Returns: Id of the intersection, -1 if there is none within the threshold.
     """
-    best_dist, choice = float('Inf'), -1
     lat, lon = point
-    for index, node in enumerate(self.nodes):
-      #dist = vincenty(point, (node.lat, node.lon)).miles
-      dist = math.sqrt((lat - node.lat) * (lat - node.lat) + (lon - node.lon) * (lon - node.lon))
-      #print point, node, dist
-      if dist < best_dist:
-        best_dist = dist
-        choice = index
-    best_dist = vincenty(point, (self.nodes[choice].lat, self.nodes[choice].lon)).miles
+    if len(self.nodes) == 0 or not np.isfinite(lat) or not np.isfinite(lon):
+      return -1
+    radius = search_radius(self.intersection_threshold, abs(lat))
+    choice = self._node_grid().nearest_one(lat, lon, radius)
+    if choice == -1:
+      return -1
+    best_dist = great_circle_miles(point, (self.node_lat[choice].item(),
+                                           self.node_lon[choice].item()))
     if best_dist > self.intersection_threshold:
       #print >> sys.stderr, 'cannot find intersection that matches %s' % (point,)
       return -1
     return choice
 
-    
-  def shortest_path(self, source, target, street=''):
-    """Finds the shortest path from soruce to target.
-    
+  def find_intersections(self, lats, lons):
+    """Batch find_intersection of arrays of points.
+
     Args:
-      source: Start point of the path. Node id.
-      target: End point of the path. Node id.
-      street: Name of the street that should be followed by the path.
-      
-    Returns: A list of edges describing the shortest path.
+      lats, lons: NumPy arrays of point coordinates.
+
+    Returns: int64 array of intersection ids, -1 for points without one.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    choices = np.full(len(lats), -1, dtype=np.int64)
+    points = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons))
+    if len(self.nodes) == 0 or len(points) == 0:
+      return choices
+    grid = self._node_grid()
+    radius = search_radius(self.intersection_threshold, np.abs(lats[points]).max())
+    choices[points] = grid.nearest(lats[points], lons[points], radius)
+    found = np.flatnonzero(choices != -1)
+    best_dist = great_circle_miles_array(lats[found], lons[found],
+                                         grid.lats[choices[found]], grid.lons[choices[found]])
+    choices[found[best_dist > self.intersection_threshold]] = -1
+    return choices
+
+  def _reverse_adjacency(self):
+    """
+    Returns: (offsets, edges, sources) of the CSR adjacency of the edges entering every
+      node, in order of edge id, built on the first call.
     """
+    if self.reverse_adjacency is None:
+      edges = np.argsort(self.edge_target, kind='mergesort')
+      offsets = np.searchsorted(self.edge_target[edges], np.arange(len(self.node_lat) + 1))
+      self.reverse_adjacency = (offsets, edges, self.edge_source[edges])
+    return self.reverse_adjacency
 
-    # Shortest path states.
-    # Key is (node_id, last_street).
-    # Value is an object {
-    #   'dist': (change_of_street, distance)
-    #   'prev': (previous_state, previous_edge)
-    # }
-    states = {}
-    states[(source, -1)] = {
-      'dist': (0, 0),
-      'prev': (None, None)  # previous (state, edge_id) in shortest path
-    }
-    
-    heap = []
+  def _adjacent(self, nodes, reverse=False):
+    """
+    Args:
+      nodes: int64 array of node ids.
+      reverse: Whether to take the edges entering the nodes instead of leaving them.
 
-    heapq.heappush(heap, ((0, 0), (source, -1)))
-    
-    target_state = None
-    while len(heap) > 0:
-      cur_dist, cur_state = heapq.heappop(heap)
-      if cur_dist > states[cur_state]['dist']:
-        continue
-      cur_node = cur_state[0]
-      if cur_node == target:
-        target_state = cur_state
-        break
-      for e in self.nodes[cur_node].incident_edges:
-        street_cost = 1 if cur_state[1] != e.street else 0
-        new_dist = (cur_dist[0] + street_cost, cur_dist[1] + e.dist)
-        next_state = (e.target, e.edge_id)
-        if next_state not in states:
-          states[next_state] = {'dist': (int(1e9), float('inf'))}
-        if states[next_state]['dist'] > new_dist:
-          states[next_state]['dist'] = new_dist
-          states[next_state]['prev'] = (cur_state, e.edge_id)
-          heapq.heappush(heap, (new_dist, next_state))
-
-    if target_state == None:
-      print >> sys.stderr, 'cannot find path from %s/%d to %s/%d' % (
-        self.nodes[source], source, self.nodes[target], target)
-      return []
-    
-    source_point = (self.nodes[source].lat, self.nodes[source].lon)
-    target_point = (self.nodes[target].lat, self.nodes[target].lon)
-    rough_dist = vincenty(source_point, target_point).miles
-    if states[target_state]['dist'][1] - rough_dist > 3:
-      print >> sys.stderr, 'extra distance > 3 mile, weird path from %s/%d to %s/%d' % (
-        self.nodes[source], source, self.nodes[target], target)
-      return []
-    # Seek shortest path backwards.
+    Returns: (nodes, edges, neighbors) arrays with one entry per edge: the node it
+      leaves (enters), the edge id and the node it enters (leaves).
+    """
+    if reverse:
+      offsets, edges, neighbors = self._reverse_adjacency()
+    else:
+      offsets, edges, neighbors = (self.adjacency_offsets, self.adjacency_edges,
+                                   self.adjacency_targets)
+    starts = offsets[nodes]
+    counts = offsets[nodes + 1] - starts
+    positions = expand_ranges(starts, counts)
+    return np.repeat(nodes, counts), edges[positions], neighbors[positions]
+
+  def _search_arrays(self):
+    """
+    Returns: (forward_level, backward_level, dist, prev_edge) arrays of the nodes used by
+      the path search, allocated on the first call. The levels are the number of edges
+      from the source (to the target), -1 for the nodes not reached, and are reset to -1
+      by every search. dist and prev_edge are only meaningful for the reached nodes.
+    """
+    if self.search_arrays is None:
+      num_nodes = len(self.node_lat)
+      self.search_arrays = (np.full(num_nodes, -1, dtype=np.int32),
+                            np.full(num_nodes, -1, dtype=np.int32),
+                            np.zeros(num_nodes), np.full(num_nodes, -1, dtype=np.int64))
+    return self.search_arrays
+
+  def _path_bound_ratio(self):
+    """
+    Returns: The smallest ratio of edge dist to the haversine distance between the nodes
+      of the edge, computed on the first call, or None if some edge dist is negative or
+      not a number. A path is then at least this ratio times the haversine distance
+      between its ends long, by the triangle inequality.
+    """
+    if self.path_bound_ratio is None:
+      ratio = -1. # no bound
+      if not np.any(~(self.edge_dist >= 0)):
+        lengths = great_circle.haversine_array(
+          self.node_lat[self.edge_source], self.node_lon[self.edge_source],
+          self.node_lat[self.edge_target], self.node_lon[self.edge_target])
+        ratios = self.edge_dist[lengths > 0] / lengths[lengths > 0]
+        ratio = ratios.min() if len(ratios) > 0 else 0.
+      self.path_bound_ratio = ratio
+    return self.path_bound_ratio if self.path_bound_ratio >= 0 else None
+
+  def _relax(self, tails, edges, heads, dist, prev_edge):
+    """
+    Sets dist and prev_edge of every head to the shortest of its candidate edges from
+    the tails, ties going to the smallest edge id.
 
-    cur_state = target_state
+    Returns: Sorted int64 array of the distinct heads.
+    """
+    candidates = dist[tails] + self.edge_dist[edges]
+    order = np.lexsort((edges, candidates, heads))
+    sorted_heads = heads[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sorted_heads[1:] != sorted_heads[:-1]
+    nodes, chosen = sorted_heads[first], order[first]
+    dist[nodes] = candidates[chosen]
+    prev_edge[nodes] = edges[chosen]
+    return nodes
+
+  def _path_edges(self, source, target, prev_edge):
+    """
+    Returns: List of the edge ids from source to target following prev_edge backwards.
+    """
     edges_on_path = []
-    while cur_state[0] != source:
-      edges_on_path.append(self.edges[states[cur_state]['prev'][1]])
-      cur_state = states[cur_state]['prev'][0]
+    node = target
+    while node != source:
+      edge_id = prev_edge[node].item()
+      edges_on_path.append(edge_id)
+      node = self.edge_source[edge_id].item()
     edges_on_path.reverse()
     return edges_on_path
+
+  def _hop_count(self, source, target, max_hops=None):
     """
-    dist = [float('Inf')] * len(self.nodes)  # distances for all nodes
-    dist[source] = 0
-
-    prev_edge = [-1] * len(self.nodes)  # incoming edge in the shortest path
-
-    heap = []
-    heapq.heappush(heap, (0, source))
-
-    target_reached = False
-    while len(heap) > 0:
-      cur_dist, cur_node = heapq.heappop(heap)
-      if cur_dist > dist[cur_node]:
-        continue
-      if cur_node == target:
-        target_reached = True
-        break
-      for e in self.nodes[cur_node].incident_edges:
-        next_node = e.target
-        if dist[next_node] > cur_dist + e.dist:
-          dist[next_node] = cur_dist + e.dist
-          prev_edge[next_node] = e
-          heapq.heappush(heap, (dist[next_node], next_node))
-
-    if target_reached == False:
-      print >> sys.stderr, 'cannot find path from %s/%d to %s/%d' % (
-        self.nodes[source], source, self.nodes[target], target)
-      return []
+    Breadth-first search from both ends, expanding the smaller frontier first.
 
-    source_point = (self.nodes[source].lat, self.nodes[source].lon)
-    target_point = (self.nodes[target].lat, self.nodes[target].lon)
-    rough_dist = vincenty(source_point, target_point).miles
-    if dist[target] - rough_dist > 1:
-      print >> sys.stderr, 'extra distance > 1 mile, weird path from %s/%d to %s/%d' % (
-        self.nodes[source], source, self.nodes[target], target)
-      return []
-    # Seek shortest path backwards.
-    cur_node = target
-    edges_on_path = []
-    while cur_node != source:
-      edges_on_path.append(prev_edge[cur_node])
-      cur_node = prev_edge[cur_node].source
+    Returns: The smallest number of edges of a path from source to target, or None if
+      there is none with at most max_hops edges.
+    """
+    num_nodes = len(self.node_lat)
+    reached = [np.zeros(num_nodes, dtype=bool), np.zeros(num_nodes, dtype=bool)]
+    reached[0][source] = reached[1][target] = True
+    frontiers = [np.array([source]), np.array([target])]
+    hops = 0
+    if source == target:
+      return hops
+    while max_hops is None or hops < max_hops:
+      side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+      if len(frontiers[side]) == 0:
+        return None
+      nodes = self._adjacent(frontiers[side], reverse=side == 1)[2]
+      nodes = np.unique(nodes[~reached[side][nodes]])
+      hops += 1
+      if reached[1 - side][nodes].any():
+        return hops
+      reached[side][nodes] = True
+      frontiers[side] = nodes
+    return None
+
+  def _pruned_search(self, source, targets, rough_dists):
+    """
+    Path search from the source to all the targets, one level of edges at a time. The
+    nodes of level k take the shortest distance through the nodes of level k - 1, so
+    that every target is reached by the paths of the fewest edges, and then the
+    shortest one.
+
+    Nodes that cannot be on a path of distance - rough_dist <= 3 to any target not
+    reached yet are dropped, by a lower bound of the distance left to the target from
+    _path_bound_ratio with a 1% margin. The targets themselves are dropped by the exact
+    condition. As a dropped node may have been on the paths of fewest edges,
+    _hop_count checks whether any path with fewer edges than the one found exists if
+    nodes were dropped on the way.
+
+    Args:
+      source: Node id.
+      targets: List of node ids.
+      rough_dists: Great-circle distances from the source to the targets.
+
+    Returns: List of (found, dist, edges_on_path) of every target: whether the target
+      can be reached, and the distance and edge ids of the path; dist is inf without a
+      path if the paths of fewest edges are longer than the bound.
+    """
+    level, _, dist, prev_edge = self._search_arrays()
+    ratio = self._path_bound_ratio()
+    level[source] = 0
+    dist[source] = 0.
+    frontier = np.array([source])
+    reached = [frontier]
+    first_cut = None # first level where nodes were dropped
+    # Targets not reached yet, the only ones the bound is kept for.
+    pending = np.array(targets, dtype=np.int64)
+    pending_rough_dists = np.array(rough_dists, dtype=np.float64)
+    try:
+      while True:
+        unreached = level[pending] == -1
+        pending, pending_rough_dists = pending[unreached], pending_rough_dists[unreached]
+        if len(pending) == 0 or len(frontier) == 0:
+          break
+        tails, edges, heads = self._adjacent(frontier)
+        new = level[heads] == -1
+        tails, edges, heads = tails[new], edges[new], heads[new]
+        if ratio is not None:
+          # Heads x pending targets.
+          left = np.maximum(.99 * ratio * great_circle.haversine_array(
+            self.node_lat[heads][:, np.newaxis], self.node_lon[heads][:, np.newaxis],
+            self.node_lat[pending], self.node_lon[pending]) - .001, 0.)
+          candidates = (dist[tails] + self.edge_dist[edges])[:, np.newaxis]
+          within = (~((candidates + left) - pending_rough_dists > 3)).any(axis=1)
+          if not within.all():
+            if first_cut is None:
+              first_cut = len(reached)
+            tails, edges, heads = tails[within], edges[within], heads[within]
+        frontier = self._relax(tails, edges, heads, dist, prev_edge)
+        level[frontier] = len(reached)
+        reached.append(frontier)
+
+      results = []
+      for target in targets:
+        hops = level[target].item()
+        if hops == -1:
+          if first_cut is None or self._hop_count(source, target) is None:
+            results.append((False, None, []))
+          else:
+            results.append((True, float('inf'), []))
+        elif first_cut is not None and first_cut < hops and (
+            self._hop_count(source, target, hops - 1) is not None):
+          results.append((True, float('inf'), []))
+        else:
+          results.append((True, dist[target].item(),
+                          self._path_edges(source, target, prev_edge)))
+      return results
+    finally:
+      level[np.concatenate(reached)] = -1
+
+  def _bidirectional_search(self, source, target):
+    """
+    Path search of the same result as _pruned_search without the distance bound, by a
+    breadth-first search from both ends. Once the two meet, the smallest number of
+    edges is known, and the nodes on the paths of fewest edges are traced back from the
+    meeting nodes. The shortest distances are then only computed over these nodes,
+    level by level from the source.
+
+    Returns: (found, dist, edges_on_path) as the results of _pruned_search.
+    """
+    forward_level, backward_level, dist, prev_edge = self._search_arrays()
+    levels = [forward_level, backward_level]
+    forward_level[source] = backward_level[target] = 0
+    reached = [[np.array([source])], [np.array([target])]]
+    hops = 0 if source == target else None
+    try:
+      while hops is None:
+        side = 0 if len(reached[0][-1]) <= len(reached[1][-1]) else 1
+        if len(reached[side][-1]) == 0:
+          return False, None, []
+        nodes = self._adjacent(reached[side][-1], reverse=side == 1)[2]
+        nodes = np.unique(nodes[levels[side][nodes] == -1])
+        levels[side][nodes] = len(reached[side])
+        reached[side].append(nodes)
+        other_levels = levels[1 - side][nodes]
+        if (other_levels != -1).any():
+          hops = len(reached[side]) - 1 + other_levels[other_levels != -1].min()
+
+      # Nodes of the paths of fewest edges by level, starting from a level that both
+      # searches reached.
+      pivot = min(len(reached[0]) - 1, hops)
+      nodes = reached[0][pivot]
+      path_levels = {pivot: nodes[backward_level[nodes] == hops - pivot]}
+      for k in range(pivot, 0, -1):
+        tails = self._adjacent(path_levels[k], reverse=True)[2]
+        path_levels[k - 1] = np.unique(tails[forward_level[tails] == k - 1])
+      for k in range(pivot, hops):
+        heads = self._adjacent(path_levels[k])[2]
+        path_levels[k + 1] = np.unique(heads[backward_level[heads] == hops - k - 1])
+
+      dist[source] = 0.
+      for k in range(1, hops + 1):
+        heads, edges, tails = self._adjacent(path_levels[k], reverse=True)
+        on_path = np.in1d(tails, path_levels[k - 1])
+        self._relax(tails[on_path], edges[on_path], heads[on_path], dist, prev_edge)
+      return True, dist[target].item(), self._path_edges(source, target, prev_edge)
+    finally:
+      for side in range(2):
+        levels[side][np.concatenate(reached[side])] = -1
+
+  def shortest_path(self, source, target, street='', bidirectional=False):
+    """Finds the shortest path from soruce to target.
+
+    Paths are compared by (number of edges, distance). This is the (change of street,
+    distance) cost of the original search over (node, last edge) states, in which every
+    edge counted as a change of street: the street of the edge was compared with the
+    id of the last edge, which never matched. Of equal paths, the one entering every
+    node by the edge of the smallest id is taken, as the order of that search did.
+    Paths more than 3 miles longer than the great-circle distance are rejected.
+
+    Args:
+      source: Start point of the path. Node id.
+      target: End point of the path. Node id.
+      street: Name of the street that should be followed by the path. Not used, see
+        above.
+      bidirectional: Whether to use _bidirectional_search instead of _pruned_search.
+        The paths are the same.
+
+    Returns: A list of edges describing the shortest path.
+    """
+    source, target = int(source), int(target)
+    rough_dist = self._rough_dist(source, target)
+    if bidirectional:
+      result = self._bidirectional_search(source, target)
+    else:
+      result = self._pruned_search(source, [target], [rough_dist])[0]
+    edges_on_path, warning = self._path_result(source, target, rough_dist, result)
+    if warning is not None:
+      print >> sys.stderr, warning
     return edges_on_path
+
+  def shortest_paths(self, requests, jobs=1):
+    """Batch shortest_path of many requests. The requests of the same source share
+    one search, continued until all their targets are reached, and the sources are
+    spread over the worker processes.
+
+    Args:
+      requests: List of (source, target, street) arguments of shortest_path.
+      jobs: Number of worker processes.
+
+    Returns: List of (edges, warning) of every request: the list of edges returned by
+      shortest_path, and the warning it prints to stderr or None. The warnings are
+      not printed, so that callers can print them in the order of their records.
+    """
+    global path_network
+    sources, groups = [], {} # request indices by source, in order of appearance
+    for index, request in enumerate(requests):
+      source = int(request[0])
+      if source not in groups:
+        sources.append(source)
+        groups[source] = []
+      groups[source].append(index)
+    targets = [int(request[1]) for request in requests]
+    rough_dists = [self._rough_dist(int(source), target)
+                   for (source, _, _), target in zip(requests, targets)]
+    tasks = [(source, [targets[index] for index in groups[source]],
+              [rough_dists[index] for index in groups[source]]) for source in sources]
+    # A few tasks per worker process, as most searches take a millisecond or less.
+    size = max(1, -(-len(tasks) // (max(jobs, 1) * 4)))
+    chunks = [tasks[start:start + size] for start in range(0, len(tasks), size)]
+
+    path_network = self
+    try:
+      results = [result for chunk_results in imap_jobs(_search_sources, chunks, jobs)
+                 for result in chunk_results]
+    finally:
+      path_network = None
+    paths = [None] * len(requests)
+    for source, source_results in zip(sources, results):
+      for index, result in zip(groups[source], source_results):
+        paths[index] = self._path_result(source, targets[index], rough_dists[index], result)
+    return paths
+
+  def _rough_dist(self, source, target):
+    """
+    Returns: Great-circle distance in miles between two nodes.
     """
+    return great_circle_miles((self.node_lat[source].item(), self.node_lon[source].item()),
+                              (self.node_lat[target].item(), self.node_lon[target].item()))
+
+  def _path_result(self, source, target, rough_dist, result):
+    """
+    Args:
+      rough_dist: Great-circle distance from source to target.
+      result: (found, dist, edges_on_path) of _pruned_search or _bidirectional_search.
+
+    Returns: (edges, warning): the list of Edge views of the path, empty if there is
+      none or it is more than 3 miles longer than rough_dist, and the warning of the
+      empty path or None.
+    """
+    found, dist, edges_on_path = result
+    if not found:
+      return [], 'cannot find path from %s/%d to %s/%d' % (
+        self.nodes[source], source, self.nodes[target], target)
+    if dist - rough_dist > 3:
+      return [], 'extra distance > 3 mile, weird path from %s/%d to %s/%d' % (
+        self.nodes[source], source, self.nodes[target], target)
+    return [self.edges[edge_id] for edge_id in edges_on_path], None
+
+
+# Network searched by the worker processes of RoadNetwork.shortest_paths, inherited
+# when they are forked.
+path_network = None
+
+def _search_sources(tasks):
+  """
+  Args:
+    tasks: List of (source, targets, rough_dists) of RoadNetwork.shortest_paths.
+
+  Returns: List of the _pruned_search results of every task.
+  """
+  return [path_network._pruned_search(*task) for task in tasks]
+
+
+
+def street_ids(streets):
+  """
+  Args:
+    streets: List of the street name of every edge.
+
+  Returns: (edge_street, street_names) with the street of every edge as an id into the
+    sorted list of distinct street names, for RoadNetwork.
+  """
+  street_names, edge_street = np.unique(np.array(streets, dtype=object), return_inverse=True)
+  return edge_street.astype(np.int32), street_names.tolist()
 
 
-  
 def read_simple_network(file_path):
   """Parses the road network.
   
@@ -229,19 +879,21 @@ def read_simple_network(file_path):
   f = open(file_path, 'r')
 
   num_nodes, num_edges = [int(x) for x in f.readline().split()]
-  nodes, edges = [], []
-  edge_dict = {}
+  lats, lons = [], []
+  sources, targets, dists = [], [], []
   for i in xrange(num_nodes):
     lat, lon = [float(x) for x in f.readline().split()]
-    nodes.append(Node(i, lat, lon))
+    lats.append(lat)
+    lons.append(lon)
   for i in xrange(num_edges):
     tokens = f.readline().split()
-    source, target, dist = int(tokens[0]), int(tokens[1]), float(tokens[2])
-    edges.append(Edge(i, source, target, dist))
+    sources.append(int(tokens[0]))
+    targets.append(int(tokens[1]))
+    dists.append(float(tokens[2]))
   print '%d nodes, %d edges' % (num_nodes, num_edges)
   f.close()
   
-  return RoadNetwork(nodes, edges)
+  return RoadNetwork(lats, lons, sources, targets, dists)
   
 
 def read_raw_lion(node_file_path, edge_file_path):
@@ -255,7 +907,7 @@ def read_raw_lion(node_file_path, edge_file_path):
     A RoadNetwork instance that represents the network.
   """
 
-  node_list, edge_list = [], []
+  lats, lons, virtual = [], [], []
   
   f = open(node_file_path, 'r')
   header = f.readline().strip().split(',')
@@ -264,18 +916,16 @@ def read_raw_lion(node_file_path, edge_file_path):
   idx_lat, idx_lon = header.index('Y'), header.index('X')
   lines = f.readlines()
   node_counter = 0
-  nodes = {}
+  nodes = {} # LION node id -> node id
   for line in lines:
     tokens = line.strip().split(',')
     id = int(tokens[idx_node_id])
-    lat, lon = float(tokens[idx_lat]), float(tokens[idx_lon])
-    virtual = True if tokens[idx_virtual] == '1' else False
-    node = Node(node_counter, lat, lon, virtual)
-    nodes[id] = node
+    lats.append(float(tokens[idx_lat]))
+    lons.append(float(tokens[idx_lon]))
+    virtual.append(tokens[idx_virtual] == '1')
+    nodes[id] = node_counter
     node_counter += 1
 
-    node_list.append(node)
-
     if node_counter % 1000 == 0:
       print '\rreading nodes %.2f%%' % (1.0 * node_counter / len(lines) * 100),
       sys.stdout.flush()
@@ -292,27 +942,26 @@ def read_raw_lion(node_file_path, edge_file_path):
   idx_source, idx_target = header.index('Node_F'), header.index('Node_T')
   lines = f.readlines()
 
+  sources, targets, dists = [], [], []
+  streets, twoways, segment_counts, segment_ids = [], [], [], []
   edge_map = {}
   for line in lines:
     tokens = line.strip().split(',')
-    id_source, id_target = int(tokens[idx_source]), int(tokens[idx_target])
-    street = tokens[idx_street]
-    twoway = True if tokens[idx_twoway] == '1' else False
-    segment_count, segment_id = int(tokens[idx_seg_count]), int(tokens[idx_segment_id])
-    source_node, target_node = nodes[id_source], nodes[id_target]
+    source, target = nodes[int(tokens[idx_source])], nodes[int(tokens[idx_target])]
 
-    if (source_node.id, target_node.id) in edge_map: # Skip parallel segments
+    if (source, target) in edge_map: # Skip parallel segments
       continue
-    edge_map[(source_node.id, target_node.id)] = True
-
-    dist = vincenty((source_node.lat, source_node.lon), (target_node.lat, target_node.lon)).miles
-
-    edge = Edge(edge_counter, source_node.id, target_node.id, dist,
-                street=street, twoway=twoway, segment_count=segment_count, segment_id=segment_id)
+    edge_map[(source, target)] = True
+
+    sources.append(source)
+    targets.append(target)
+    dists.append(great_circle_miles((lats[source], lons[source]), (lats[target], lons[target])))
+    streets.append(tokens[idx_street])
+    twoways.append(tokens[idx_twoway] == '1')
+    segment_counts.append(int(tokens[idx_seg_count]))
+    segment_ids.append(int(tokens[idx_segment_id]))
     edge_counter += 1
 
-    edge_list.append(edge)
-
     if edge_counter % 10000 == 0:
       print '\rreading edges %.2f%%' % (1.0 * edge_counter / len(lines) * 100),
       sys.stdout.flush()
@@ -320,7 +969,10 @@ def read_raw_lion(node_file_path, edge_file_path):
   print '\r' + ' ' * 50 + '\rreading edges 100%'
   f.close()
 
-  return RoadNetwork(node_list, edge_list)
+  edge_street, street_names = street_ids(streets)
+  return RoadNetwork(lats, lons, sources, targets, dists, node_virtual=virtual,
+                     edge_street=edge_street, street_names=street_names, edge_twoway=twoways,
+                     edge_segment_count=segment_counts, edge_segment_id=segment_ids)
 
 
 def prune_network(network_large, network_small):
@@ -335,63 +987,26 @@ def prune_network(network_large, network_small):
       A pruned RoadNetwork instance.
   """
   dist_threshold = .005
-  nodes, edges = [], []
 
-  y_nodes = sorted(copy.copy(network_small.nodes))
-
-  id_map = {}
-  node_counter = 0
-  for index, node_x in enumerate(network_large.nodes):
-    if index % 100 == 0:
-      print '\rpruning nodes %.2f%%' % (1.0 * index / len(network_large.nodes) * 100),
-      sys.stdout.flush()
-
-    hit = False
-    pos = bisect.bisect(y_nodes, node_x)
-    l, r = pos, pos
-    if l == len(y_nodes):
-      l -= 1
-    while not hit and (l >= 0 or r < len(y_nodes)):
-      if l >= 0:
-        if y_nodes[l].lat < node_x.lat - dist_threshold:
-          l = -1
-        else:
-          dist = node_x.line_distance(y_nodes[l])
-          if dist <= dist_threshold:
-            hit = True
-          l -= 1
-      if r < len(y_nodes):
-        if y_nodes[r].lat > node_x.lat + dist_threshold:
-          r = len(y_nodes)
-        else:
-          dist = node_x.line_distance(y_nodes[r])
-          if dist <= dist_threshold:
-            hit = True
-          r += 1
-    if not hit:
-      continue
-    id_map[node_x.id] = node_counter
-    node_x.id = node_counter
-    nodes.append(node_x)
-    node_counter += 1
-
-
-  edge_counter = 0
-  for index, edge in enumerate(network_large.edges):
-    if index % 100 == 0:
-      print '\rpruning edges %.2f%%' % (1.0 * index / len(network_large.nodes) * 100),
-      sys.stdout.flush()
-
-    if edge.source not in id_map or edge.target not in id_map:
-      continue
-    edge.source = id_map[edge.source]
-    edge.target = id_map[edge.target]
-    edge.edge_id = edge_counter
-    edges.append(edge)
-    edge_counter += 1
-
-  print '\r' + ' ' * 50 + '\r%d nodes, %d edges after pruning' % (len(nodes), len(edges))
-  return RoadNetwork(nodes, edges)
+  # A node is kept if a node of the small network is within dist_threshold degrees.
+  keep = np.zeros(len(network_large.node_lat), dtype=bool)
+  if len(network_small.node_lat) > 0:
+    grid = NodeGrid(network_small.node_lat, network_small.node_lon, dist_threshold)
+    keep = grid.nearest(network_large.node_lat, network_large.node_lon, dist_threshold) != -1
+  id_map = np.cumsum(keep) - 1
+  edges = np.flatnonzero(keep[network_large.edge_source] & keep[network_large.edge_target])
+
+  print '%d nodes, %d edges after pruning' % (keep.sum(), len(edges))
+  return RoadNetwork(network_large.node_lat[keep], network_large.node_lon[keep],
+                     id_map[network_large.edge_source[edges]],
+                     id_map[network_large.edge_target[edges]],
+                     network_large.edge_dist[edges],
+                     node_virtual=network_large.node_virtual[keep],
+                     edge_street=network_large.edge_street[edges],
+                     street_names=network_large.street_names,
+                     edge_twoway=network_large.edge_twoway[edges],
+                     edge_segment_count=network_large.edge_segment_count[edges],
+                     edge_segment_id=network_large.edge_segment_id[edges])
 
 def read_lion(node_file_path, edge_file_path):
   """Reads the processed LION network nodes and edges.
@@ -403,7 +1018,7 @@ def read_lion(node_file_path, edge_file_path):
   Returns: RoadNetwork instance.
   
   """
-  node_list, edge_list = [], []
+  lats, lons, virtual = [], [], []
 
   f = open(node_file_path, 'r')
   header = f.readline().strip().split(',')
@@ -413,13 +1028,11 @@ def read_lion(node_file_path, edge_file_path):
   node_counter = 0
   for line in lines:
     tokens = line.strip().split(',')
-    lat, lon = float(tokens[idx_lat]), float(tokens[idx_lon])
-    virtual = True if tokens[idx_virtual] == '1' else False
-    node = Node(node_counter, lat, lon, virtual)
+    lats.append(float(tokens[idx_lat]))
+    lons.append(float(tokens[idx_lon]))
+    virtual.append(tokens[idx_virtual] == '1')
     node_counter += 1
 
-    node_list.append(node)
-
     if node_counter % 1000 == 0:
       print '\rreading LION nodes %.2f%%' % (1.0 * node_counter / len(lines) * 100),
       sys.stdout.flush()
@@ -435,25 +1048,27 @@ def read_lion(node_file_path, edge_file_path):
   idx_segment_count = header.index('segment_count')
   idx_twoway = header.index('twoway')
   lines = f.readlines()
+  sources, targets, dists = [], [], []
+  streets, twoways, segment_counts = [], [], []
   for line in lines:
     tokens = line.strip().split(',')
-    id_source, id_target = int(tokens[idx_source]), int(tokens[idx_target])
-    dist = float(tokens[idx_dist])
-    street = tokens[idx_street]
-    twoway = True if tokens[idx_twoway] == '1' else False
-    segment_count = int(tokens[idx_segment_count])
-
-    edge = Edge(edge_counter, id_source, id_target, dist,
-                street=street, twoway=twoway, segment_count=segment_count)
+    sources.append(int(tokens[idx_source]))
+    targets.append(int(tokens[idx_target]))
+    dists.append(float(tokens[idx_dist]))
+    streets.append(tokens[idx_street])
+    twoways.append(tokens[idx_twoway] == '1')
+    segment_counts.append(int(tokens[idx_segment_count]))
     edge_counter += 1
-    edge_list.append(edge)
     if edge_counter % 10000 == 0:
       print '\rreading LION edges %.2f%%' % (1.0 * edge_counter / len(lines) * 100),
       sys.stdout.flush()
   print '\r' + ' ' * 50 + '\rreading LION edges 100%'
   f.close()
 
-  return RoadNetwork(node_list, edge_list)
+  edge_street, street_names = street_ids(streets)
+  return RoadNetwork(lats, lons, sources, targets, dists, node_virtual=virtual,
+                     edge_street=edge_street, street_names=street_names, edge_twoway=twoways,
+                     edge_segment_count=segment_counts)
 
 
 def write_lion_csv(network, node_csv, edge_csv):
@@ -503,3 +1118,80 @@ def write_clean_network(network, output_file_path):
   print output_file_path + ' written'
   f.close()
 
+
+# Version of the snapshot layout written by write_snapshot.
+SNAPSHOT_VERSION = 1
+
+def input_signatures(input_paths, known=[]):
+  """
+  Args:
+    input_paths: Paths to the files a network is built from.
+    known: Signatures returned by a previous call, in the same order. Files of another
+      size have changed, and are not hashed.
+
+  Returns: List of {'path', 'size', 'sha1'} of the files, with sha1 None for the files
+    not hashed. Files are hashed regardless of their mtime, which does not show every
+    change: a file rewritten within the same second, or copied with its mtime.
+  """
+  signatures = []
+  for index, input_path in enumerate(input_paths):
+    signature = {
+      'path': os.path.abspath(input_path),
+      'size': os.path.getsize(input_path),
+      'sha1': None
+    }
+    if index >= len(known) or known[index]['size'] == signature['size']:
+      sha1 = hashlib.sha1()
+      with open(input_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), ''):
+          sha1.update(block)
+      signature['sha1'] = sha1.hexdigest()
+    signatures.append(signature)
+  return signatures
+
+
+def write_snapshot(network, snapshot_path, input_paths):
+  """Writes the network, with its speed limits and signs, to a single .npz file that
+  load_snapshot reads instead of parsing and resolving the input files again.
+
+  Args:
+    network: RoadNetwork built from the input files.
+    snapshot_path: Path to the .npz snapshot.
+    input_paths: Paths to the files the network was built from, e.g. the LION node and
+      edge files and the processed speed limit file.
+  """
+  meta = {
+    'version': SNAPSHOT_VERSION,
+    'great_circle_mode': great_circle.mode,
+    'inputs': input_signatures(input_paths)
+  }
+  temp_path = '%s.tmp%d.npz' % (snapshot_path, os.getpid())
+  np.savez(temp_path, meta=np.array(json.dumps(meta)), **network.to_arrays())
+  os.rename(temp_path, snapshot_path)
+  print snapshot_path + ' written'
+
+
+def load_snapshot(snapshot_path, input_paths):
+  """Reads a network written by write_snapshot.
+
+  Args:
+    snapshot_path: Path to the .npz snapshot.
+    input_paths: Paths to the files the network is built from, in the order given to
+      write_snapshot.
+
+  Returns: RoadNetwork instance, or None if there is no snapshot or it is out of date:
+    the content of an input file changed, or it was written by another version or
+    great-circle mode.
+  """
+  if not os.path.exists(snapshot_path):
+    return None
+  with np.load(snapshot_path) as f:
+    meta = json.loads(str(f['meta']))
+    if meta['version'] != SNAPSHOT_VERSION or meta['great_circle_mode'] != great_circle.mode:
+      return None
+    if len(meta['inputs']) != len(input_paths):
+      return None
+    inputs = input_signatures(input_paths, meta['inputs'])
+    if [x['sha1'] for x in inputs] != [x['sha1'] for x in meta['inputs']]:
+      return None
+    return RoadNetwork.from_arrays(dict([(key, f[key]) for key in f.files]))
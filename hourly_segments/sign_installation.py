@@ -46,24 +46,37 @@ def process(input_path, output_path, network):
   f_out.close()
 
 
-def read(input_path, network):
+def read(input_path, network, jobs=1):
   """ Parses a processed sign installation file and writes installation dates to the road segments
   in the road network object.
   
   Args:
     input_path: Path to the processed sign installation file.
     network: RoadNetwork returned by road_network.
+    jobs: Number of worker processes of the path searches.
   """
   
   print >> sys.stderr, 'reading raw sign installation'
   f_in = open(input_path, 'r')
   header = f_in.readline()
-  
-  counter = 0
+
+  records = []
   for line in f_in.readlines():
     if line.strip() == '':
       break
-    tokens = line.split(',')
+    records.append(line.split(','))
+
+  # Shortest paths of the records whose endpoints are found but are not neighbors, all
+  # at once.
+  requests = []
+  for tokens in records:
+    source, target = int(tokens[0]), int(tokens[1])
+    if (source, target) not in network.edge_dict and source != -1 and target != -1:
+      requests.append((source, target, ''))
+  paths = iter(network.shortest_paths(requests, jobs))
+  
+  counter = 0
+  for tokens in records:
     source, target = int(tokens[0]), int(tokens[1])
     date_inst = parser.parse(tokens[6])
     
@@ -75,7 +88,9 @@ def read(input_path, network):
         continue
       # Both endpoints are found but endpoints are not neighbors.
       # Seek shortest path from source to target.
-      edges = network.shortest_path(source, target)
+      edges, warning = paths.next()
+      if warning is not None:
+        print >> sys.stderr, warning
       
       counter += 1
       for e in edges:
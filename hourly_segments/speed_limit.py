@@ -50,7 +50,7 @@ def process(input_path, output_path, network):
     
     source = network.find_intersection((from_y, from_x))
     target = network.find_intersection((to_y, to_x))
-    f_out.write('%d,%d,%d,%f,%f,%f,%f,' % (source, target, from_y, from_x, to_y, to_x))
+    f_out.write('%d,%d,%f,%f,%f,%f,' % (source, target, from_y, from_x, to_y, to_x))
     f_out.write('%s,%s,%s,%s,%s,%s,' % (
         tokens[idx_sl110714], tokens[idx_sg110714],
         tokens[idx_sl120415], tokens[idx_sg120415],
@@ -76,13 +76,14 @@ def get_path_length(edges):
   return ans
 
 
-def read(input_path, network):
+def read(input_path, network, jobs=1):
   """ Parses a processed speed limit file and writes sign information to the road segments
   in the road network object.
   
   Args:
     input_path: Path to the processed speed limit file.
     network: RoadNetwork returned by road_network.
+    jobs: Number of worker processes of the path searches.
   """
   
   print >> sys.stderr, 'reading processed speed limit CSV'
@@ -105,18 +106,30 @@ def read(input_path, network):
   contradictions = {}
 
   lines = f_in.readlines()
-  line_counter = 0
+  records = []
   for line in lines:
     line = line.strip()
     if line == '':
       break
+    records.append(line.split(','))
+
+  # Both endpoints are found but endpoints are not neighbors.
+  # Seek shortest path from source to target, and target to source, for all the records
+  # at once. Speed limit could be given in the reversed direction of a one-way road.
+  requests = []
+  for tokens in records:
+    source, target = int(tokens[idx_source]), int(tokens[idx_target])
+    if (source, target) not in network.edge_dict and source != -1 and target != -1:
+      requests += [(source, target, tokens[idx_street]), (target, source, tokens[idx_street])]
+  paths = iter(network.shortest_paths(requests, jobs))
 
+  line_counter = 0
+  for tokens in records:
     line_counter += 1
     if line_counter % 1000 == 0:
       print '\rreading speed limit %.2f%%' % (1.0 * line_counter / len(lines) * 100),
       sys.stdout.flush()
 
-    tokens = line.split(',')
     source, target = int(tokens[idx_source]), int(tokens[idx_target])
     street = tokens[idx_street]
     
@@ -143,10 +156,12 @@ def read(input_path, network):
         print >> sys.stderr, 'only a single endpoint is in Manhattan (%d, %d)' % (source, target)
         continue
       # Both endpoints are found but endpoints are not neighbors.
-      # Seek shortest path from source to target, and target to source.
-      # Speed limit could be given in the reversed direction of a one-way road.
-      edges = network.shortest_path(source, target, street)
-      rev_edges = network.shortest_path(target, source, street)
+      edges, warning = paths.next()
+      if warning is not None:
+        print >> sys.stderr, warning
+      rev_edges, warning = paths.next()
+      if warning is not None:
+        print >> sys.stderr, warning
 
       if (len(edges) == 0 or get_path_length(edges) > get_path_length(rev_edges)):
         # If the reverse path gives a shorter total length, then we use the reverse path.
@@ -0,0 +1,68 @@
+import argparse, sys
+from const import ZONE_FILE, LOCATION_ZONE_FILE
+from raw_trip import ZoneLocator
+from trip_reader import print_progress
+from trip_cache import write_cache, open_cache
+from trip_file import write_trip_file
+from trip_schema import write_location_zones
+from parallel import imap_jobs, read_data_list
+
+# Parses and validates the raw TLC trip CSVs once and writes the columnar cache
+# (trip_cache.py) or the fixed-width trip files (trip_file.py) that aggregate_day.py,
+# aggregate_zone.py and aggregate_yyyy-mm_hour.py read with --cache_dir.
+#
+# With --taxi_zone_centroids, writes the lookup table from TLC taxi zone IDs to zones
+# to --location_zone_file instead, used for the trips from July 2016 that have no
+# coordinates.
+
+parser = argparse.ArgumentParser(
+  description='Ingest of TLC yellow cab trips into a columnar cache')
+parser.add_argument('--data_list', dest='data_list', type=str, default='',
+                    help='list of data file paths')
+parser.add_argument('--cache_dir', dest='cache_dir', type=str, default='',
+                    help='cache directory')
+parser.add_argument('--zone_file', dest='zone_file', type=str, default=ZONE_FILE,
+                    help='zone polygon file, "" to skip zone location')
+parser.add_argument('--location_zone_file', dest='location_zone_file', type=str,
+                    default=LOCATION_ZONE_FILE,
+                    help='lookup table from TLC taxi zone IDs to zones, for the trips '
+                         'without coordinates')
+parser.add_argument('--taxi_zone_centroids', dest='taxi_zone_centroids', type=str,
+                    default='',
+                    help='CSV with header LocationID,lon,lat of the TLC taxi zone centroids; '
+                         'if given, only writes the location zone file from it')
+parser.add_argument('--format', dest='format', type=str, default='columns',
+                    choices=['columns', 'packed'],
+                    help='columns: one .npy file per column; packed: fixed-width trip file')
+parser.add_argument('--force', dest='force', action='store_true',
+                    help='rewrite caches that are up to date')
+parser.add_argument('--jobs', dest='jobs', type=int, default=1,
+                    help='number of files ingested in parallel')
+args = parser.parse_args()
+
+zone_locator = (ZoneLocator(args.zone_file, args.location_zone_file)
+                if args.zone_file != '' else None)
+
+if args.taxi_zone_centroids != '':
+  if zone_locator is None:
+    parser.error('--taxi_zone_centroids needs a --zone_file')
+  write_location_zones(args.taxi_zone_centroids, zone_locator, args.location_zone_file)
+  print args.location_zone_file + ' written'
+  sys.exit(0)
+if args.data_list == '' or args.cache_dir == '':
+  parser.error('--data_list and --cache_dir are required')
+
+def ingest_file(filename):
+  if not args.force and open_cache(args.cache_dir, filename, zone_locator) is not None:
+    print 'skipping %s, cache is up to date' % filename
+    return
+  print 'processing %s...' % filename
+  write = write_cache if args.format == 'columns' else write_trip_file
+  write(args.cache_dir, filename, zone_locator,
+        progress_callback=print_progress if args.jobs == 1 else None)
+  print 'finished processing %s' % filename
+
+
+filenames = read_data_list(args.data_list)
+for _ in imap_jobs(ingest_file, filenames, args.jobs):
+  pass
@@ -0,0 +1,79 @@
+import multiprocessing
+from trip_reader import split_byte_ranges
+from trip_cache import open_cache
+
+def imap_jobs(function, items, jobs=1):
+  """
+  Applies function to every item, in a pool of worker processes if jobs > 1.
+  Workers are forked, so function may rely on module globals such as parsed arguments.
+  function must be a module-level function and its results must be picklable.
+
+  Args:
+    function: Function of one item.
+    items: List of items.
+    jobs: Number of worker processes.
+
+  Yields: The results in the order of items.
+  """
+  if jobs <= 1:
+    for item in items:
+      yield function(item)
+    return
+
+  pool = multiprocessing.Pool(jobs)
+  try:
+    for result in pool.imap(function, items):
+      yield result
+    pool.close()
+  except:
+    pool.terminate()
+    raise
+  finally:
+    pool.join()
+
+
+def read_data_list(data_list):
+  """
+  Returns: The non-empty file paths listed in the data list file.
+  """
+  with open(data_list, 'r') as f:
+    return [line.strip() for line in f.readlines() if line.strip() != '']
+
+
+def file_range_tasks(filenames, split, cache_dir='', zone_locator=None):
+  """
+  Returns: A list of (filename, byte_range) tasks, splitting every file into up to
+    split byte ranges, in data list order. Files with a usable cache in cache_dir are
+    read whole, with byte_range None.
+  """
+  tasks = []
+  for filename in filenames:
+    if open_cache(cache_dir, filename, zone_locator) is not None:
+      tasks.append((filename, None))
+      continue
+    tasks.extend([(filename, byte_range)
+                  for byte_range in split_byte_ranges(filename, split)])
+  return tasks
+
+
+def merge_by_file(results):
+  """
+  Merges the consecutive partial results of the byte ranges of each file.
+
+  Args:
+    results: Iterable of (filename, aggregator, stats), in the order of
+      file_range_tasks. Aggregators and stats must have a merge method.
+
+  Yields: (filename, aggregator, stats) once per file.
+  """
+  current = None
+  for filename, aggregator, stats in results:
+    if current is not None and current[0] == filename:
+      current[1].merge(aggregator)
+      current[2].merge(stats)
+      continue
+    if current is not None:
+      yield current
+    current = (filename, aggregator, stats)
+  if current is not None:
+    yield current
@@ -1,23 +1,76 @@
-import datetime, re, sys
-from geopy.distance import vincenty
-
-# indices for every year are the same, except for 2016 second half
-trip_indices = {
-  'pickup_time': 1,
-  'dropoff_time': 2,
-  'pickup_lon': 5,
-  'pickup_lat': 6,
-  'dropoff_lon': 9,
-  'dropoff_lat': 10,
-  'distance': 4
+import sys
+import numpy as np
+from great_circle import great_circle_miles, great_circle_miles_array
+from trip_schema import coordinate_indices, default_schema, map_location_zones
+from timestamps import INVALID_TIME, parse_timestamp, parse_timestamp_column
+
+# Column indices of RawTrip, 2009 to 2016 June. See trip_schema for the other eras.
+trip_indices = coordinate_indices
+
+# Trip validation reason codes, one per TripStats counter.
+REGULAR = 0
+# does not have pickup location
+MISSING_PICKUP = 1
+# does not have dropoff location
+MISSING_DROPOFF = 2
+# duration <= 0 seconds
+INVALID_DURATION = 3
+# duration < 60 seconds
+SHORT_DURATION = 4
+# duration > 2 hours
+LONG_DURATION = 5
+# distance < .1 miles
+SHORT_DISTANCE = 6
+# distance > 20 miles
+LONG_DISTANCE = 7
+# Euclidean distance < .1 miles
+SHORT_EUCLIDEAN_DISTANCE = 8
+# distance < .9 x Euclidean distance
+IMPOSSIBLE_SHORT_DISTANCE = 9
+# distance > 3 x Euclidean distance
+IMPOSSIBLE_LONG_DISTANCE = 10
+# speed < 1 mph
+SLOW_SPEED = 11
+# speed > 100 mph
+FAST_SPEED = 12
+# pickup location not in any zone
+PICKUP_NOZONE = 13
+# dropoff location not in any zone
+DROPOFF_NOZONE = 14
+# too few fields, or unparsable timestamp or distance
+MALFORMED = 15
+
+reason_names = {
+  REGULAR: 'regular',
+  MISSING_PICKUP: 'missing_pickup',
+  MISSING_DROPOFF: 'missing_dropoff',
+  INVALID_DURATION: 'invalid_duration',
+  SHORT_DURATION: 'short_duration',
+  LONG_DURATION: 'long_duration',
+  SHORT_DISTANCE: 'short_distance',
+  LONG_DISTANCE: 'long_distance',
+  SHORT_EUCLIDEAN_DISTANCE: 'short_euclidean_distance',
+  IMPOSSIBLE_SHORT_DISTANCE: 'impossible_short_distance',
+  IMPOSSIBLE_LONG_DISTANCE: 'impossible_long_distance',
+  SLOW_SPEED: 'slow_speed',
+  FAST_SPEED: 'fast_speed',
+  PICKUP_NOZONE: 'pickup_nozone',
+  DROPOFF_NOZONE: 'dropoff_nozone',
+  MALFORMED: 'malformed'
 }
+reason_codes = dict((name, code) for code, name in reason_names.iteritems())
 
 class Polygon:
+
+  # Maximum number of point-edge pairs tested at once by contains_many.
+  max_broadcast_size = 1 << 22
+
   def __init__(self):
     """
     Initializes an empty polygon.
     """
     self.points = []
+    self.edge_array = None # cached edges() for contains_many
     self.min_lon, self.max_lon = float('inf'), float('-inf')
     self.min_lat, self.max_lat = float('inf'), float('-inf')
 
@@ -26,6 +79,7 @@ class Polygon:
     Points must be added in cc/ccw order!
     """
     self.points.append((lon, lat))
+    self.edge_array = None
     self.min_lon, self.max_lon = min(self.min_lon, lon), max(self.max_lon, lon)
     self.min_lat, self.max_lat = min(self.min_lat, lat), max(self.max_lat, lat)
 
@@ -51,9 +105,258 @@ class Polygon:
       i += 1
     return c
 
+  def contains_many(self, lons, lats):
+    """
+    Vectorized contains() over arrays of points, giving exactly the same results.
+
+    Args:
+      lons, lats: NumPy arrays of point coordinates.
+
+    Returns: Boolean NumPy array.
+    """
+    result = np.zeros(len(lons), dtype=bool)
+    in_box = np.flatnonzero((lons >= self.min_lon) & (lons <= self.max_lon) &
+                            (lats >= self.min_lat) & (lats <= self.max_lat))
+    if len(in_box) == 0:
+      return result
+    if self.edge_array is None:
+      self.edge_array = np.array(self.edges(), dtype=np.float64).reshape(-1, 4)
+    # Edges as (vj, vi) row vectors, broadcast against a column of points.
+    xj, yj, xi, yi = [self.edge_array[:, k][np.newaxis, :] for k in range(4)]
+    chunk = max(1, self.max_broadcast_size / len(self.edge_array))
+    for start in range(0, len(in_box), chunk):
+      index = in_box[start:start + chunk]
+      test_x, test_y = lons[index][:, np.newaxis], lats[index][:, np.newaxis]
+      with np.errstate(divide='ignore', invalid='ignore'):
+        crossing = (((yi > test_y) != (yj > test_y)) &
+                    (test_x < (xj - xi) * (test_y - yi) / (yj - yi) + xi))
+      result[index] = np.count_nonzero(crossing, axis=1) % 2 == 1
+    return result
+
+  def edges(self):
+    """
+    Returns: List of ((lon, lat), (lon, lat)) edges visited by the ray casting in
+      contains(). A ring ends when its first point is repeated.
+    """
+    edges = []
+    first = self.points[0]
+    j, i, n = 0, 1, len(self.points)
+    while i < n:
+      edges.append((self.points[j], self.points[i]))
+      if self.points[i] == first:
+        i += 1
+        if i < n:
+          first = self.points[i]
+      j = i
+      i += 1
+    return edges
+
+
+class ZoneGrid:
+
+  # Cell value for cells crossed by zone boundaries. Other cells hold the zone that
+  # contains the whole cell, or -1.
+  BOUNDARY = -2
+
+  # Kinds of boundary cell candidates.
+  NOT_CANDIDATE, EXACT, CONTAINED = 0, 1, 2
+
+  # Tolerance in degrees added around cells when testing for boundaries, so that
+  # rounding in the cell lookup cannot place a point in a wrong interior cell.
+  eps = 1e-9
+
+  def __init__(self, zone_polygon, cell_size=.002):
+    """
+    Builds a uniform lon/lat grid over the zone polygons. Every cell is either inside
+    a single zone, outside all zones, or a boundary cell with a short list of candidate
+    zones that fall back to the exact Polygon.contains test.
+
+    Args:
+      zone_polygon: Dict of zone id to Polygon, as in ZoneLocator. Zones are tried in
+        the dict order, as in ZoneLocator.locate, so that overlapping zones resolve the same.
+      cell_size: Cell width and height in degrees.
+    """
+    self.zone_polygon = zone_polygon
+    self.zones = [zone for zone, _ in zone_polygon.iteritems()]
+    polygons = zone_polygon.values()
+    self.min_lon = min(p.min_lon for p in polygons)
+    self.min_lat = min(p.min_lat for p in polygons)
+    self.cell_size = cell_size
+    self.nx = int((max(p.max_lon for p in polygons) - self.min_lon) / cell_size) + 1
+    self.ny = int((max(p.max_lat for p in polygons) - self.min_lat) / cell_size) + 1
+
+    self.cells = np.full((self.ny, self.nx), -1, dtype=np.int64)
+    resolved = np.zeros((self.ny, self.nx), dtype=bool)
+    boundary = np.zeros((self.ny, self.nx), dtype=bool)
+    crossed, inside = {}, {}
+    for zone in self.zones:
+      crossed[zone] = self._crossed_cells(zone_polygon[zone])
+      inside[zone] = self._center_inside(zone_polygon[zone]) & ~crossed[zone]
+      unresolved = ~resolved
+      boundary |= unresolved & crossed[zone]
+      self.cells[unresolved & inside[zone] & ~boundary] = zone
+      resolved |= inside[zone]
+    self.cells[boundary] = self.BOUNDARY
+
+    # Candidates of a boundary cell, in zone order: (zone, whether contains() is needed).
+    # The list ends at the first zone that contains the whole cell.
+    # The same lists are kept per zone in candidate_kind as flat cell arrays of
+    # NOT_CANDIDATE, EXACT or CONTAINED, for the vectorized lookup.
+    self.candidates = {}
+    self.candidate_kind = dict((zone, np.zeros(self.ny * self.nx, dtype=np.int8))
+                               for zone in self.zones)
+    for cell in np.flatnonzero(boundary):
+      iy, ix = cell / self.nx, cell % self.nx
+      candidates = []
+      for zone in self.zones:
+        if crossed[zone][iy, ix]:
+          candidates.append((zone, True))
+          self.candidate_kind[zone][cell] = self.EXACT
+        elif inside[zone][iy, ix]:
+          candidates.append((zone, False))
+          self.candidate_kind[zone][cell] = self.CONTAINED
+          break
+      self.candidates[cell] = candidates
+
+  def _cell_edges(self, ix, iy):
+    """
+    Returns: Lon/lat extent of cells, widened by eps.
+    """
+    x0 = self.min_lon + ix * self.cell_size - self.eps
+    y0 = self.min_lat + iy * self.cell_size - self.eps
+    return x0, y0, x0 + self.cell_size + 2 * self.eps, y0 + self.cell_size + 2 * self.eps
+
+  def _crossed_cells(self, polygon):
+    """
+    Returns: Boolean (ny, nx) array of cells whose points may get different contains()
+      results, i.e. cells touched by a polygon edge, and for unclosed rings also the
+      cells on the dangling endpoint lines and the bounding box edges.
+    """
+    crossed = np.zeros((self.ny, self.nx), dtype=bool)
+    degree = {}
+    for (x1, y1), (x2, y2) in polygon.edges():
+      degree[(x1, y1)] = degree.get((x1, y1), 0) + 1
+      degree[(x2, y2)] = degree.get((x2, y2), 0) + 1
+      ix0, ix1 = self._cell_range(min(x1, x2), max(x1, x2), self.min_lon, self.nx)
+      iy0, iy1 = self._cell_range(min(y1, y2), max(y1, y2), self.min_lat, self.ny)
+      iy, ix = np.mgrid[iy0:iy1 + 1, ix0:ix1 + 1]
+      cx0, cy0, cx1, cy1 = self._cell_edges(ix, iy)
+      # Separating axis test against the segment normal: the segment crosses the cell
+      # unless all four corners are strictly on one side of it.
+      sides = [(x2 - x1) * (cy - y1) - (y2 - y1) * (cx - x1)
+               for cx, cy in [(cx0, cy0), (cx0, cy1), (cx1, cy0), (cx1, cy1)]]
+      hit = (np.minimum.reduce(sides) <= 0) & (np.maximum.reduce(sides) >= 0)
+      crossed[iy[hit], ix[hit]] = True
+
+    # An unclosed ring leaves dangling endpoints. The ray casting result then also
+    # changes along the horizontal line to the left of such an endpoint.
+    dangling = [(x, y) for (x, y), count in degree.iteritems() if count % 2 == 1]
+    for x, y in dangling:
+      iy0, iy1 = self._cell_range(y, y, self.min_lat, self.ny)
+      ix0, ix1 = self._cell_range(x, x, self.min_lon, self.nx)
+      crossed[iy0:iy1 + 1, :ix1 + 1] = True
+    # Ray casting over an unclosed ring may also be odd just outside the bounding box,
+    # where contains() returns False without it, so the result changes along the box
+    # edges too.
+    if dangling:
+      ix0, ix1 = self._cell_range(polygon.min_lon, polygon.max_lon, self.min_lon, self.nx)
+      iy0, iy1 = self._cell_range(polygon.min_lat, polygon.max_lat, self.min_lat, self.ny)
+      for lon in [polygon.min_lon, polygon.max_lon]:
+        first, last = self._cell_range(lon, lon, self.min_lon, self.nx)
+        crossed[iy0:iy1 + 1, first:last + 1] = True
+      for lat in [polygon.min_lat, polygon.max_lat]:
+        first, last = self._cell_range(lat, lat, self.min_lat, self.ny)
+        crossed[first:last + 1, ix0:ix1 + 1] = True
+    return crossed
+
+  def _cell_range(self, low, high, origin, count):
+    """
+    Returns: First and last cell index overlapping [low, high], widened by eps.
+    """
+    first = int(np.floor((low - self.eps - origin) / self.cell_size))
+    last = int(np.floor((high + self.eps - origin) / self.cell_size))
+    return max(first, 0), min(last, count - 1)
+
+  def _center_inside(self, polygon):
+    """
+    Returns: Boolean (ny, nx) array of cells whose center is inside the polygon, using
+      the same ray casting rule as Polygon.contains, one scanline per row of cells.
+    """
+    inside = np.zeros((self.ny, self.nx), dtype=bool)
+    edges = np.array(polygon.edges(), dtype=np.float64).reshape(-1, 4)
+    xj, yj, xi, yi = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+    center_x = self.min_lon + (np.arange(self.nx) + .5) * self.cell_size
+    in_box_x = (center_x >= polygon.min_lon) & (center_x <= polygon.max_lon)
+    for iy in range(self.ny):
+      y = self.min_lat + (iy + .5) * self.cell_size
+      if y < polygon.min_lat or y > polygon.max_lat:
+        continue
+      spans = (yi > y) != (yj > y)
+      crossings = np.sort((xj[spans] - xi[spans]) * (y - yi[spans]) / (yj[spans] - yi[spans]) + xi[spans])
+      # Number of crossings to the right of each center.
+      count = len(crossings) - np.searchsorted(crossings, center_x, side='right')
+      inside[iy] = (count % 2 == 1) & in_box_x
+    return inside
+
+  def _lookup(self, lons, lats):
+    """
+    Returns: Cell values and flat cell indices of the points (-1 outside the grid).
+    """
+    ix = np.floor((lons - self.min_lon) / self.cell_size).astype(np.int64)
+    iy = np.floor((lats - self.min_lat) / self.cell_size).astype(np.int64)
+    in_grid = (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)
+    cell = np.where(in_grid, iy * self.nx + ix, -1)
+    values = np.where(in_grid, self.cells.ravel()[np.maximum(cell, 0)], -1)
+    return values, cell
+
+  def _locate_boundary(self, cell, lon, lat):
+    for zone, exact in self.candidates[cell]:
+      if not exact or self.zone_polygon[zone].contains(lon, lat):
+        return zone
+    return -1
+
+  def locate(self, lon, lat):
+    """
+    Returns: The same zone as ZoneLocator.locate.
+    """
+    values, cell = self._lookup(np.array([lon]), np.array([lat]))
+    if values[0] != self.BOUNDARY:
+      return int(values[0])
+    return self._locate_boundary(cell[0], lon, lat)
+
+  def locate_many(self, lons, lats):
+    """
+    Args:
+      lons, lats: NumPy arrays of point coordinates.
+
+    Returns: int64 array of zones, -1 for points outside all zones.
+    """
+    zones, cell = self._lookup(lons, lats)
+    # Walk the candidate lists of all boundary points together, one zone at a time.
+    pending = np.flatnonzero(zones == self.BOUNDARY)
+    zones[pending] = -1
+    for zone in self.zones:
+      if len(pending) == 0:
+        break
+      kind = self.candidate_kind[zone][cell[pending]]
+      found = kind == self.CONTAINED
+      exact = np.flatnonzero(kind == self.EXACT)
+      found[exact] = self.zone_polygon[zone].contains_many(lons[pending[exact]], lats[pending[exact]])
+      zones[pending[found]] = zone
+      pending = pending[~found]
+    return zones
+
 
 class ZoneLocator:
-  def __init__(self, zone_file):
+  def __init__(self, zone_file, location_zone_file=None):
+    """
+    Args:
+      zone_file: OD zone polygon file.
+      location_zone_file: Lookup table from TLC taxi zone IDs to OD zones, used to
+        locate the trips of the location_id era, see trip_schema.read_location_zones.
+    """
+    self.zone_file = zone_file
+    self.location_zone_file = location_zone_file
     self.zone_polygon = {}
     print 'parsing polygons...'
     with open(zone_file, 'r') as f:
@@ -69,8 +372,24 @@ class ZoneLocator:
           self.zone_polygon[zone] = Polygon()
         self.zone_polygon[zone].add_point(lon, lat)
     print 'finished parsing polygons'
+    self.grid = ZoneGrid(self.zone_polygon)
 
   def locate(self, lon, lat):
+    return self.grid.locate(lon, lat)
+
+  def locate_many(self, lons, lats):
+    """
+    Args:
+      lons, lats: NumPy arrays of point coordinates.
+
+    Returns: int64 array of zones, -1 for points outside all zones.
+    """
+    return self.grid.locate_many(lons, lats)
+
+  def locate_exact(self, lon, lat):
+    """
+    Tries every zone polygon without the grid.
+    """
     for zone, polygon in self.zone_polygon.iteritems():
       if polygon.contains(lon, lat):
         return zone
@@ -80,158 +399,354 @@ class ZoneLocator:
 class RawTrip:
   def __init__(self, line, stats, zone_locator=None, logger=None):
     """
+    Parses and validates a trip record. Rejected trips do not raise: the reason code
+    is stored in self.reason (REGULAR if the trip is accepted) and counted in stats.
+
     Args:
       line: Line of string containing the trip record.
     """
+    self.reason = self.validate(line, zone_locator)
+    stats.add_reason(self.reason)
+
+  def validate(self, line, zone_locator=None):
+    """
+    Returns: Reason code of the trip.
+    """
     tokens = line.rstrip().split(',')
+    if len(tokens) <= max(trip_indices.values()):
+      return MALFORMED
     for key, index in trip_indices.iteritems():
       value = tokens[index]
       if key.find('time') != -1:
-        year, month, day, hour, minute, second = [int(x) for x in re.split('[ :-]', value)]
-        value = datetime.datetime(year, month, day, hour, minute, second)
+        try:
+          value = parse_timestamp(value) # epoch seconds
+        except ValueError:
+          return MALFORMED
       else:
         try:
           value = float(value)
-          if value == 0 and (key.find('lon') != -1 or key.find('lat') != -1):
+          if value != value: # NaN, as unparsable values in validate_trips
+            value = None
+          elif (key.find('lon') != -1 or key.find('lat') != -1) and (
+              value == 0 or abs(value) == float('inf')):
             value = None
-        except Exception:
+        except ValueError:
           value = None
 
         if value == None: # value is zero if the data is wrong or no value is present
           if key.find('pickup') != -1:
-            stats.add_counter('missing_pickup')
-            raise Exception('missing pickup location')
+            return MISSING_PICKUP
           elif key.find('dropoff') != -1:
-            stats.add_counter('missing_dropoff')
-            raise Exception('missing dropoff location')
-          else:
-            print >> sys.stderr, 'FATAL ERROR', tokens[index]
+            return MISSING_DROPOFF
       setattr(self, key, value)
 
-    if self.distance < .1:
-      stats.add_counter('short_distance')
-      raise Exception('short distance < .1 miles')
+    if self.distance == None:
+      return MALFORMED
+    elif self.distance < .1:
+      return SHORT_DISTANCE
     elif self.distance > 20:
-      stats.add_counter('long_distance')
-      raise Exception('long distance > 20 miles')
+      return LONG_DISTANCE
 
-    self.trip_time = (self.dropoff_time - self.pickup_time).total_seconds() # in seconds
+    self.trip_time = self.dropoff_time - self.pickup_time # in seconds
     if self.trip_time <= 0:
-      stats.add_counter('invalid_duration')
-      raise Exception('invalid duration <= 0 seconds')
+      return INVALID_DURATION
     elif self.trip_time < 60:
-      stats.add_counter('short_duration')
-      raise Exception('short duration < 60 seconds')
+      return SHORT_DURATION
     elif self.trip_time > 7200:
-      stats.add_counter('long_duration')
-      raise Exception('long duration > 2 hours')
+      return LONG_DURATION
 
     self.speed = self.distance / self.trip_time * 3600 # mph
     if self.speed < 1:
-      stats.add_counter('slow_speed')
-      raise Exception('slow speed < 1 mph')
+      return SLOW_SPEED
     elif self.speed > 100:
-      stats.add_counter('fast_speed')
-      raise Exception('fast speed > 100 mph')
-
-    vincenty_distance = vincenty((self.pickup_lat, self.pickup_lon),
-                                 (self.dropoff_lat, self.dropoff_lon)).miles
-    if vincenty_distance < .1:
-      stats.add_counter('short_euclidean_distance')
-      raise Exception('Euclidean distance < .1 miles')
-
-    #if self.distance >= 3 * vincenty_distance and self.distance <= 10 * vincenty_distance:
-    #  logger.add_line('%.6f,%.6f,%.6f,%.6f,%.6f,%.6f,%.6f\n' %
-    #                  (self.distance, vincenty_distance, self.distance / vincenty_distance,
-    #                   self.pickup_lon, self.pickup_lat,
-    #                   self.dropoff_lon, self.dropoff_lat))
-
-    if self.distance < .9 * vincenty_distance:
-      stats.add_counter('impossible_short_distance')
-      raise Exception('distance < .9 x Euclidean distance')
-    elif self.distance > 3. * vincenty_distance:
-      stats.add_counter('impossible_long_distance')
-      raise Exception('distance > 3 x Euclidean distance')
-
-    #self.pickup_zone = zone_locator.locate(self.pickup_lon, self.pickup_lat)
-    #if self.pickup_zone == -1:
-    #  stats.add_counter('pickup_nozone')
-    #  raise Exception('pickup location not in any zone')
-    #self.dropoff_zone = zone_locator.locate(self.dropoff_lon, self.dropoff_lat)
-    #if self.dropoff_zone == -1:
-    #  stats.add_counter('dropoff_nozone')
-    #  raise Exception('dropoff location not in any zone')
-    stats.add_counter()
+      return FAST_SPEED
+
+    euclidean_distance = great_circle_miles((self.pickup_lat, self.pickup_lon),
+                                            (self.dropoff_lat, self.dropoff_lon))
+    if euclidean_distance < .1:
+      return SHORT_EUCLIDEAN_DISTANCE
+
+    if self.distance < .9 * euclidean_distance:
+      return IMPOSSIBLE_SHORT_DISTANCE
+    elif self.distance > 3. * euclidean_distance:
+      return IMPOSSIBLE_LONG_DISTANCE
+
+    if zone_locator is not None:
+      self.pickup_zone = zone_locator.locate(self.pickup_lon, self.pickup_lat)
+      if self.pickup_zone == -1:
+        return PICKUP_NOZONE
+      self.dropoff_zone = zone_locator.locate(self.dropoff_lon, self.dropoff_lat)
+      if self.dropoff_zone == -1:
+        return DROPOFF_NOZONE
+    return REGULAR
+
+
+class TripBatch:
+  def __init__(self, pickup_time, dropoff_time, pickup_lon, pickup_lat,
+               dropoff_lon, dropoff_lat, distance, pickup_location=None,
+               dropoff_location=None):
+    """
+    Holds a chunk of trips as NumPy columns, the columnar counterpart of RawTrip.
+
+    Args:
+      pickup_time, dropoff_time: int64 epoch seconds, INVALID_TIME if unparsable.
+      pickup_lon, pickup_lat, dropoff_lon, dropoff_lat: float64, NaN if missing.
+        None for the location_id era.
+      distance: float64 trip distance in miles, NaN if missing.
+      pickup_location, dropoff_location: float64 TLC taxi zone IDs, NaN if missing.
+        Only for the location_id era.
+    """
+    self.pickup_time = pickup_time
+    self.dropoff_time = dropoff_time
+    self.pickup_lon = pickup_lon
+    self.pickup_lat = pickup_lat
+    self.dropoff_lon = dropoff_lon
+    self.dropoff_lat = dropoff_lat
+    self.distance = distance
+    self.pickup_location = pickup_location
+    self.dropoff_location = dropoff_location
+    # Lookup table from taxi zone IDs to OD zones, for the location_id era.
+    self.location_zones = None
+    # Number of dropped lines with too few fields.
+    self.num_malformed = 0
+    # Set by validate_trips.
+    self.speed = None
+    self.pickup_zone = None
+    self.dropoff_zone = None
+
+  def __len__(self):
+    return len(self.pickup_time)
+
+  def select(self, mask):
+    """
+    Returns: A new TripBatch with only the rows where mask is True.
+    """
+    batch = TripBatch(*[getattr(self, key)[mask] if getattr(self, key) is not None else None
+                        for key in ['pickup_time', 'dropoff_time', 'pickup_lon', 'pickup_lat',
+                                    'dropoff_lon', 'dropoff_lat', 'distance',
+                                    'pickup_location', 'dropoff_location']])
+    batch.location_zones = self.location_zones
+    for key in ['speed', 'pickup_zone', 'dropoff_zone']:
+      value = getattr(self, key)
+      if value is not None:
+        setattr(batch, key, value[mask])
+    return batch
+
+  def has_coordinates(self):
+    return self.pickup_location is None
+
+  def locate_zones(self, zone_locator, end, mask=None):
+    """
+    Args:
+      zone_locator: ZoneLocator used for trips with coordinates.
+      end: 'pickup' or 'dropoff'.
+      mask: Optional boolean mask of the trips to locate.
+
+    Returns: int64 array of the OD zones, -1 for no zone. Trips of the location_id era
+      are mapped with location_zones.
+    """
+    mask = mask if mask is not None else slice(None)
+    if not self.has_coordinates():
+      if self.location_zones is None:
+        raise ValueError('trips with TLC taxi zone IDs need a location zone file')
+      return map_location_zones(self.location_zones, getattr(self, end + '_location')[mask])
+    return zone_locator.locate_many(getattr(self, end + '_lon')[mask],
+                                    getattr(self, end + '_lat')[mask])
+
+
+def _parse_float_column(values):
+  """
+  Converts a list of strings to a float64 array, with NaN for unparsable values.
+  """
+  try:
+    return np.array(values, dtype=np.float64)
+  except ValueError:
+    pass
+  column = np.empty(len(values))
+  for i, value in enumerate(values):
+    try:
+      column[i] = float(value)
+    except ValueError:
+      column[i] = np.nan
+  return column
+
+
+def parse_trip_lines(lines, schema=default_schema):
+  """
+  Splits raw trip lines into columns. Blank lines are skipped, and lines with too few
+  fields are dropped and counted in num_malformed of the returned batch.
+
+  Args:
+    lines: List of trip record strings.
+    schema: TripSchema of the file, see trip_schema.detect_schema.
+
+  Returns: A TripBatch.
+  """
+  rows = [line.rstrip().split(',') for line in lines if line.strip() != '']
+  num_rows = len(rows)
+  rows = [tokens for tokens in rows if len(tokens) >= schema.min_tokens]
+  columns = dict([(key, None) for key in coordinate_indices])
+  for key, index in schema.indices.iteritems():
+    values = [tokens[index] for tokens in rows]
+    if key.find('time') != -1:
+      columns[key] = parse_timestamp_column(values)
+    else:
+      column = _parse_float_column(values)
+      if key.find('lon') != -1 or key.find('lat') != -1:
+        column[column == 0] = np.nan # value is zero if the data is wrong or no value is present
+      columns[key] = column
+  batch = TripBatch(**columns)
+  batch.location_zones = schema.location_zones
+  batch.num_malformed = num_rows - len(rows)
+  return batch
+
+
+def validate_trips(batch, stats, zone_locator=None):
+  """
+  Applies the RawTrip filter chain to a whole batch using boolean masks, and counts
+  the reason code of every trip in stats.
+
+  Args:
+    batch: TripBatch returned by parse_trip_lines.
+    stats: TripStats to be updated.
+    zone_locator: If given, pickup and dropoff zones are located and trips outside
+      all zones are rejected.
+
+  Returns: A TripBatch with the accepted trips, with speed (and zones) set.
+  """
+  reasons = np.full(len(batch), REGULAR, dtype=np.int8)
+  remaining = np.ones(len(batch), dtype=bool)
+
+  def reject(mask, reason):
+    rejected = remaining & mask
+    reasons[rejected] = reason
+    remaining[rejected] = False
+
+  # NaN values compare as False and are rejected by the missing value checks.
+  # Infinite coordinates count as missing too, as in RawTrip.
+  with np.errstate(invalid='ignore'):
+    if batch.has_coordinates():
+      # Same order as the fields are checked in RawTrip.
+      reject(~np.isfinite(batch.pickup_lon), MISSING_PICKUP)
+      reject(batch.pickup_time == INVALID_TIME, MALFORMED)
+      reject(~np.isfinite(batch.dropoff_lon), MISSING_DROPOFF)
+      reject(~np.isfinite(batch.pickup_lat), MISSING_PICKUP)
+      reject(batch.dropoff_time == INVALID_TIME, MALFORMED)
+      reject(~np.isfinite(batch.dropoff_lat), MISSING_DROPOFF)
+    else:
+      reject(np.isnan(batch.pickup_location), MISSING_PICKUP)
+      reject(batch.pickup_time == INVALID_TIME, MALFORMED)
+      reject(np.isnan(batch.dropoff_location), MISSING_DROPOFF)
+      reject(batch.dropoff_time == INVALID_TIME, MALFORMED)
+
+    distance = batch.distance
+    reject(np.isnan(distance), MALFORMED)
+    reject(distance < .1, SHORT_DISTANCE)
+    reject(distance > 20, LONG_DISTANCE)
+
+    trip_time = (batch.dropoff_time - batch.pickup_time).astype(np.float64) # in seconds
+    reject(trip_time <= 0, INVALID_DURATION)
+    reject(trip_time < 60, SHORT_DURATION)
+    reject(trip_time > 7200, LONG_DURATION)
+
+    speed = np.full(len(batch), np.nan)
+    speed[remaining] = distance[remaining] / trip_time[remaining] * 3600 # mph
+    reject(speed < 1, SLOW_SPEED)
+    reject(speed > 100, FAST_SPEED)
+
+    # Trips without coordinates cannot be checked against the straight-line distance.
+    if batch.has_coordinates():
+      euclidean_distance = np.full(len(batch), np.nan)
+      euclidean_distance[remaining] = great_circle_miles_array(
+        batch.pickup_lat[remaining], batch.pickup_lon[remaining],
+        batch.dropoff_lat[remaining], batch.dropoff_lon[remaining])
+      reject(euclidean_distance < .1, SHORT_EUCLIDEAN_DISTANCE)
+      reject(distance < .9 * euclidean_distance, IMPOSSIBLE_SHORT_DISTANCE)
+      reject(distance > 3. * euclidean_distance, IMPOSSIBLE_LONG_DISTANCE)
+
+  if zone_locator is not None:
+    pickup_zone = np.full(len(batch), -1, dtype=np.int64)
+    dropoff_zone = np.full(len(batch), -1, dtype=np.int64)
+    pickup_zone[remaining] = batch.locate_zones(zone_locator, 'pickup', remaining)
+    reject(pickup_zone == -1, PICKUP_NOZONE)
+    dropoff_zone[remaining] = batch.locate_zones(zone_locator, 'dropoff', remaining)
+    reject(dropoff_zone == -1, DROPOFF_NOZONE)
+
+  stats.add_reasons(reasons)
+  stats.add_reason(MALFORMED, batch.num_malformed)
+  accepted = batch.select(remaining)
+  accepted.speed = speed[remaining]
+  if zone_locator is not None:
+    accepted.pickup_zone = pickup_zone[remaining]
+    accepted.dropoff_zone = dropoff_zone[remaining]
+  return accepted
+
+
+def group_indices(keys):
+  """
+  Groups row indices by key, keeping the original row order within each group.
+
+  Args:
+    keys: Integer NumPy array with one key per row.
+
+  Returns: A list of (key, indices) pairs sorted by key.
+  """
+  if len(keys) == 0:
+    return []
+  order = np.argsort(keys, kind='mergesort')
+  sorted_keys = keys[order]
+  starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+  ends = np.r_[starts[1:], len(keys)]
+  return [(sorted_keys[s], order[s:e]) for s, e in zip(starts, ends)]
 
 
 class TripStats:
   def __init__(self):
-    # total trip counts
-    self.total = 0
-
-    # does not have pickup location
-    self.missing_pickup = 0
-    # does not have dropoff location
-    self.missing_dropoff = 0
-
-    # duration <= 0 seconds
-    self.invalid_duration = 0
-    # duration < 60 seconds
-    self.short_duration = 0
-    # duration > 2 hours
-    self.long_duration = 0
-
-    # distance < .1 miles
-    self.short_distance = 0
-    # distance > 20 miles
-    self.long_distance = 0
-    # Euclidean distance < .1 miles
-    self.short_euclidean_distance = 0
-    # distance < .5 x Euclidean distance
-    self.impossible_short_distance = 0
-    # distance > 10 x Euclidean distance
-    self.impossible_long_distance = 0
-
-    # speed < 1 mph
-    self.slow_speed = 0
-    # speed > 100 mph
-    self.fast_speed = 0
-
-    # pickup location not in any zone
-    self.pickup_nozone = 0
-    # dropoff location not in any zone
-    self.dropoff_nozone = 0
-
-  def add_counter(self, counter=''):
-    self.total += 1
-    if counter != '':
-      setattr(self, counter, getattr(self, counter) + 1)
+    # trip counts indexed by reason code
+    self.counts = np.zeros(len(reason_names), dtype=np.int64)
+
+  def __getattr__(self, name):
+    """
+    Looks up a counter by name, e.g. stats.short_distance. Malformed records are not
+    included in the total.
+    """
+    if name == 'total':
+      return int(self.counts.sum() - self.counts[MALFORMED])
+    if name in reason_codes:
+      return int(self.counts[reason_codes[name]])
+    raise AttributeError(name)
+
+  def add_counter(self, counter='', count=1):
+    self.add_reason(reason_codes[counter] if counter != '' else REGULAR, count)
+
+  def add_reason(self, reason, count=1):
+    self.counts[reason] += count
+
+  def add_reasons(self, reasons):
+    """
+    Args:
+      reasons: NumPy array of reason codes.
+    """
+    self.counts += np.bincount(reasons, minlength=len(self.counts))
+
+  def merge(self, other):
+    """
+    Adds the counters of another TripStats.
+    """
+    self.counts += other.counts
 
   def report(self, file=''):
-    entries = [
-      'missing_pickup',
-      'missing_dropoff',
-      'invalid_duration',
-      'short_duration',
-      'long_duration',
-      'short_distance',
-      'long_distance',
-      'short_euclidean_distance',
-      'impossible_short_distance',
-      'impossible_long_distance',
-      'slow_speed',
-      'fast_speed',
-      'pickup_nozone',
-      'dropoff_nozone'
-    ]
-    with open(file, 'w') as f:
-      f.write('total: %d\n' % self.total)
-      regular = self.total
-      for key in entries:
-        count = getattr(self, key)
-        regular -= count
-        f.write('%s: %d (%.2f%%)\n' % (key, count, 1. * count / self.total * 100))
-      f.write('regular: %d (%.2f%%)\n' % (regular, 1. * regular / self.total * 100))
+    f = sys.stdout if file == '' else open(file, 'w')
+    f.write('total: %d\n' % self.total)
+    regular = self.total
+    for reason in range(MISSING_PICKUP, MALFORMED):
+      count = self.counts[reason]
+      regular -= count
+      f.write('%s: %d (%.2f%%)\n' % (reason_names[reason], count, 1. * count / self.total * 100))
+    f.write('regular: %d (%.2f%%)\n' % (regular, 1. * regular / self.total * 100))
+    f.write('malformed: %d\n' % self.malformed)
+    if f is not sys.stdout:
+      f.close()
 
 class Logger:
   def __init__(self):
@@ -3,7 +3,9 @@
 # Process the TLC taxi data CSVs and generate a subset of the data with only relative
 # columns for speed analysis.
 
-import sys
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from trip_schema import detect_schema
 
 numArgs = len(sys.argv)
 
@@ -24,6 +26,7 @@ outputFile.write(\
   'id_taxi,distance,fare_amount,surcharge,mta_tax,tip_amount,tolls_amount,payment_type,passengers,' + \
   'field1,field2,field3,field4\n')
 
+# Column layouts, see trip_schema.py for the header names of every era.
 # 2009-2014
 # 0-4: vendor_id, pickup_datetime, dropoff_datetime, passenger_count, trip_distance
 # 5-9: pickup_longitude, pickup_latitude, rate_code, store_and_fwd_flag, dropoff_longitude
@@ -40,8 +43,17 @@ outputFile.write(\
 # 10-14: fare_amount,extra,mta_tax,tip_amount,tolls_amount
 # 15-16: improvement_surcharge,total_amount
 
-# indices for every year are the same, except for 2016 second half
-indices = [1, 2, 5, 6, 9, 10, -1, 4, 12, 13, 14, 15, 16, 11, 3]
+# Output columns, None for the trip id.
+columns = ['pickup_time', 'dropoff_time', 'pickup_lon', 'pickup_lat', 'dropoff_lon',
+           'dropoff_lat', None, 'distance', 'fare_amount', 'surcharge', 'mta_tax',
+           'tip_amount', 'tolls_amount', 'payment_type', 'passengers']
+
+# The city map matching needs coordinates, which 2016 July onward does not have.
+schema = detect_schema(tripsHeader, location_zone_file=None)
+if not schema.has_coordinates():
+    print 'Trips of the %s era have no coordinates' % schema.era
+    exit(1)
+indices = [-1 if key is None else schema.header_indices[key] for key in columns]
 
 count = 1
 for (tripLine) in tripsFile:
@@ -0,0 +1,341 @@
+import math
+import numpy as np
+
+# Speed histogram resolution: 10 buckets per mph, i.e. 0.1 mph wide buckets.
+BUCKETS_PER_MPH = 10
+# Validated trips are at most 100 mph. Faster speeds are counted in the last bucket.
+MAX_SPEED = 100
+NUM_BUCKETS = MAX_SPEED * BUCKETS_PER_MPH + 1
+
+def speed_buckets(speeds):
+  """
+  Returns: int64 array of the histogram bucket of each speed.
+  """
+  return np.clip((speeds * BUCKETS_PER_MPH).astype(np.int64), 0, NUM_BUCKETS - 1)
+
+
+class SpeedStats:
+  def __init__(self):
+    """
+    Mergeable accumulator of the speeds in one bin, replacing the list of speeds.
+
+    Mean and std are kept as Chan et al. moments (count, mean, sum of squared
+    differences) and match np.average/np.std up to float rounding. Merging partial
+    results from different workers may change the last bits.
+
+    Percentiles are computed from an exact histogram of 0.1 mph buckets plus the exact
+    min and max. Every order statistic is estimated by its bucket center, so for speeds
+    within [0, MAX_SPEED] a percentile is within 0.05 mph of np.percentile. It is exact
+    for bins of one or two speeds.
+    """
+    self.count = 0
+    self.mean = 0.
+    self.m2 = 0. # sum of squared differences from the mean
+    self.min = float('inf')
+    self.max = float('-inf')
+    self.histogram = np.zeros(0, dtype=np.int64) # grows up to NUM_BUCKETS
+
+  def add(self, speeds):
+    """
+    Args:
+      speeds: NumPy array of speeds in mph.
+    """
+    if len(speeds) == 0:
+      return
+    mean = speeds.mean()
+    m2 = np.square(speeds - mean).sum()
+    self._combine(len(speeds), mean, m2)
+    self.min = min(self.min, speeds.min())
+    self.max = max(self.max, speeds.max())
+    self._add_histogram(np.bincount(speed_buckets(speeds)))
+
+  def merge(self, other):
+    """
+    Adds the speeds accumulated by another SpeedStats.
+    """
+    if other.count == 0:
+      return
+    self._combine(other.count, other.mean, other.m2)
+    self.min = min(self.min, other.min)
+    self.max = max(self.max, other.max)
+    self._add_histogram(other.histogram)
+
+  def _combine(self, count, mean, m2):
+    if self.count == 0:
+      self.count, self.mean, self.m2 = count, mean, m2
+      return
+    total = self.count + count
+    delta = mean - self.mean
+    self.mean += delta * count / total
+    self.m2 += m2 + delta * delta * self.count * count / total
+    self.count = total
+
+  def _add_histogram(self, histogram):
+    if len(histogram) > len(self.histogram):
+      histogram, self.histogram = self.histogram, histogram.copy()
+    self.histogram[:len(histogram)] += histogram
+
+  def std(self):
+    """
+    Returns: Population standard deviation, as np.std.
+    """
+    return math.sqrt(max(self.m2, 0.) / self.count)
+
+  def percentile(self, q):
+    """
+    Returns: Estimate of np.percentile(speeds, q), with linear interpolation.
+    """
+    rank = q / 100. * (self.count - 1)
+    low, high = int(math.floor(rank)), int(math.ceil(rank))
+    value_low, value_high = self._order_statistic(low), self._order_statistic(high)
+    return value_low + (value_high - value_low) * (rank - low)
+
+  def _order_statistic(self, k):
+    """
+    Returns: Estimate of the k-th smallest speed (0-based).
+    """
+    if k == 0:
+      return self.min
+    if k == self.count - 1:
+      return self.max
+    bucket = np.searchsorted(np.cumsum(self.histogram), k, side='right')
+    center = (bucket + .5) / BUCKETS_PER_MPH
+    return min(max(center, self.min), self.max)
+
+
+class BinnedSpeedStats:
+
+  # Number of histogram entries of added chunks kept aside before they are merged into
+  # the sorted histogram, at least as many as the histogram has, so that every entry is
+  # only merged a few times.
+  min_pending_histogram = 1 << 20
+
+  def __init__(self, num_bins):
+    """
+    SpeedStats for a dense range of integer bin ids, kept in NumPy arrays and updated
+    by whole batches at a time.
+
+    Count, mean, m2 (sum of squared differences from the mean), min and max are dense
+    arrays of num_bins, with the moments combined as in SpeedStats. The speed
+    histogram of all the bins is a sparse tensor: sorted unique keys
+    bin_id * NUM_BUCKETS + bucket with their counts, since a dense
+    (num_bins, NUM_BUCKETS) tensor would be mostly zeros. Percentiles have the same
+    0.05 mph bound as SpeedStats.
+    """
+    self.num_bins = num_bins
+    self.count = np.zeros(num_bins, dtype=np.int64)
+    self.speed_mean = np.zeros(num_bins)
+    self.m2 = np.zeros(num_bins)
+    self.min = np.full(num_bins, np.inf)
+    self.max = np.full(num_bins, -np.inf)
+    self.histogram_keys = np.zeros(0, dtype=np.int64)
+    self.histogram_counts = np.zeros(0, dtype=np.int64)
+    self.pending_histograms = [] # (keys, counts) not merged into the histogram yet
+    self.num_pending_histogram = 0
+
+  def add(self, bin_ids, speeds):
+    """
+    Args:
+      bin_ids: int64 array of bin ids in [0, num_bins).
+      speeds: Array of speeds in mph, of the same length.
+    """
+    if len(speeds) == 0:
+      return
+    self._add_moments(bin_ids, np.ones(len(speeds)), speeds, np.zeros(len(speeds)))
+    np.minimum.at(self.min, bin_ids, speeds)
+    np.maximum.at(self.max, bin_ids, speeds)
+    keys, counts = np.unique(bin_ids * NUM_BUCKETS + speed_buckets(speeds),
+                             return_counts=True)
+    self._add_histogram(keys, counts)
+
+  def merge(self, other):
+    """
+    Adds the speeds accumulated by another BinnedSpeedStats of the same num_bins.
+    """
+    bins = other.nonempty_bins()
+    self._combine(bins, other.count[bins], other.speed_mean[bins], other.m2[bins])
+    np.minimum(self.min, other.min, out=self.min)
+    np.maximum(self.max, other.max, out=self.max)
+    other._merge_pending_histograms()
+    self._add_histogram(other.histogram_keys, other.histogram_counts)
+
+  def grow(self, num_bins):
+    """
+    Appends empty bins up to num_bins.
+    """
+    extra = num_bins - self.num_bins
+    self.num_bins = num_bins
+    self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+    self.speed_mean = np.concatenate([self.speed_mean, np.zeros(extra)])
+    self.m2 = np.concatenate([self.m2, np.zeros(extra)])
+    self.min = np.concatenate([self.min, np.full(extra, np.inf)])
+    self.max = np.concatenate([self.max, np.full(extra, -np.inf)])
+
+  def add_moments(self, bin_ids, counts, means, stds):
+    """
+    Adds speeds summarized by their count, mean and population std, e.g. the rows of
+    an aggregated CSV. Min, max and the histogram are not known, so percentiles of the
+    bins are not available afterwards, see has_histogram.
+
+    Args:
+      bin_ids: int64 array of bin ids in [0, num_bins).
+      counts, means, stds: Arrays of the same length.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    self._add_moments(bin_ids, counts, means, stds * stds * counts)
+
+  def rollup(self, other, bin_map):
+    """
+    Adds the speeds of another BinnedSpeedStats with finer bins, such as days to months.
+
+    Args:
+      other: BinnedSpeedStats.
+      bin_map: int64 array from the bin ids of other to bin ids of this one.
+    """
+    bins = other.nonempty_bins()
+    target = bin_map[bins]
+    self._add_moments(target, other.count[bins].astype(np.float64),
+                      other.speed_mean[bins], other.m2[bins])
+    np.minimum.at(self.min, target, other.min[bins])
+    np.maximum.at(self.max, target, other.max[bins])
+    other._merge_pending_histograms()
+    keys = (bin_map[other.histogram_keys / NUM_BUCKETS] * NUM_BUCKETS +
+            other.histogram_keys % NUM_BUCKETS)
+    self._add_histogram(keys, other.histogram_counts)
+
+  def _add_moments(self, bin_ids, counts, means, m2s):
+    """
+    Adds groups of speeds given by their count, mean and m2, grouped by bin first.
+    The m2 of a bin is summed around the mean of the bin in two passes, so that equal
+    speeds have an m2 of exactly 0.
+    """
+    count = np.bincount(bin_ids, weights=counts, minlength=self.num_bins)
+    bins = np.flatnonzero(count)
+    mean = np.zeros(self.num_bins)
+    mean[bins] = (np.bincount(bin_ids, weights=counts * means, minlength=self.num_bins)[bins] /
+                  count[bins])
+    delta = means - mean[bin_ids]
+    m2 = np.bincount(bin_ids, weights=m2s + counts * delta * delta, minlength=self.num_bins)
+    self._combine(bins, count[bins].astype(np.int64), mean[bins], m2[bins])
+
+  def _combine(self, bins, count, mean, m2):
+    """
+    Combines the moments of distinct bins with those of other speeds, as
+    SpeedStats._combine does.
+    """
+    old_count = self.count[bins]
+    total = old_count + count
+    weight = count / np.maximum(total, 1).astype(np.float64)
+    delta = mean - self.speed_mean[bins]
+    self.speed_mean[bins] += delta * weight
+    self.m2[bins] += m2 + delta * delta * old_count * weight
+    self.count[bins] = total
+
+  def has_histogram(self, bins):
+    """
+    Returns: Whether the histogram covers all the speeds of each of the given bins,
+      i.e. none were added by add_moments.
+    """
+    return self._histogram_totals()[bins] == self.count[bins]
+
+  def _histogram_totals(self):
+    """
+    Returns: int64 array of the number of speeds in the histogram of every bin.
+    """
+    self._merge_pending_histograms()
+    return np.bincount(self.histogram_keys / NUM_BUCKETS, weights=self.histogram_counts,
+                       minlength=self.num_bins).astype(np.int64)
+
+  def to_arrays(self):
+    """
+    Returns: Dict of the arrays holding the accumulated speeds, see from_arrays.
+    """
+    self._merge_pending_histograms()
+    return {
+      'count': self.count,
+      'speed_mean': self.speed_mean,
+      'm2': self.m2,
+      'min': self.min,
+      'max': self.max,
+      'histogram_keys': self.histogram_keys,
+      'histogram_counts': self.histogram_counts
+    }
+
+  @staticmethod
+  def from_arrays(arrays):
+    """
+    Returns: The BinnedSpeedStats of a dict returned by to_arrays.
+    """
+    stats = BinnedSpeedStats(len(arrays['count']))
+    if 'sum' in arrays:
+      # Written with sums of speeds and squared speeds instead of mean and m2.
+      arrays = dict([(key, arrays[key]) for key in arrays.keys()])
+      count = np.maximum(arrays['count'], 1)
+      arrays['speed_mean'] = arrays['sum'] / count
+      arrays['m2'] = np.maximum(arrays['sum_sq'] - arrays['speed_mean'] * arrays['sum'], 0.)
+    for key in stats.to_arrays().keys():
+      setattr(stats, key, np.array(arrays[key]))
+    return stats
+
+  def _add_histogram(self, keys, counts):
+    """
+    Sets aside the histogram entries of a chunk. They are merged into the histogram
+    once as many have been added as the histogram has, or when it is read.
+    """
+    self.pending_histograms.append((keys, counts))
+    self.num_pending_histogram += len(keys)
+    if self.num_pending_histogram >= max(len(self.histogram_keys), self.min_pending_histogram):
+      self._merge_pending_histograms()
+
+  def _merge_pending_histograms(self):
+    if len(self.pending_histograms) == 0:
+      return
+    keys = np.concatenate([self.histogram_keys] + [k for k, _ in self.pending_histograms])
+    counts = np.concatenate([self.histogram_counts] + [c for _, c in self.pending_histograms])
+    self.histogram_keys, inverse = np.unique(keys, return_inverse=True)
+    self.histogram_counts = np.bincount(inverse, weights=counts).astype(np.int64)
+    self.pending_histograms = []
+    self.num_pending_histogram = 0
+
+  def nonempty_bins(self):
+    """
+    Returns: Sorted int64 array of the bin ids with at least one speed.
+    """
+    return np.flatnonzero(self.count)
+
+  def mean(self, bins):
+    return self.speed_mean[bins]
+
+  def std(self, bins):
+    """
+    Returns: Population standard deviation of the given bins, as np.std, and exactly 0
+      for bins of equal speeds.
+    """
+    std = np.sqrt(np.maximum(self.m2[bins], 0.) / self.count[bins])
+    return np.where(self.min[bins] == self.max[bins], 0., std)
+
+  def percentile(self, bins, q):
+    """
+    Returns: Estimates of np.percentile(speeds, q) of the given non-empty bins, with
+      linear interpolation.
+    """
+    rank = q / 100. * (self.count[bins] - 1)
+    low, high = np.floor(rank).astype(np.int64), np.ceil(rank).astype(np.int64)
+    value_low, value_high = self._order_statistic(bins, low), self._order_statistic(bins, high)
+    return value_low + (value_high - value_low) * (rank - low)
+
+  def _order_statistic(self, bins, k):
+    """
+    Returns: Estimates of the k-th smallest speed (0-based) of each of the given bins.
+    """
+    self._merge_pending_histograms()
+    cumulative = np.cumsum(self.histogram_counts)
+    # number of histogram speeds in the bins before each bin, without the speeds added
+    # by add_moments
+    totals = self._histogram_totals()
+    offset = np.cumsum(totals)[bins] - totals[bins]
+    entry = np.searchsorted(cumulative, offset + k, side='right')
+    center = (self.histogram_keys[entry] % NUM_BUCKETS + .5) / BUCKETS_PER_MPH
+    values = np.minimum(np.maximum(center, self.min[bins]), self.max[bins])
+    values = np.where(k == 0, self.min[bins], values)
+    return np.where(k == self.count[bins] - 1, self.max[bins], values)
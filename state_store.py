@@ -0,0 +1,115 @@
+import hashlib, json, os
+import numpy as np
+from trip_cache import file_signature
+
+# Persisted partial aggregation states, one per data file, so that a rerun over a
+# growing data list only processes the new or changed months and merges the stored
+# partial states of the others.
+#
+# A state directory holds manifest.json and one .npz file of NumPy arrays per data
+# file. The manifest records the settings the states were computed with, and the
+# signature (absolute path, size, mtime) of every data file together with the inputs
+# its state was computed from besides the data file, e.g. the form the trips were read
+# in or the signatures of side files. A state is only reused if all still match.
+
+STATE_VERSION = 2
+
+class StateStore:
+  def __init__(self, state_dir, settings):
+    """
+    Args:
+      state_dir: State directory, created if needed. '' disables the store: nothing is
+        loaded or saved.
+      settings: JSON-serializable dict of everything the states depend on besides the
+        data files, e.g. the aggregation and the zone file signature. Stored states
+        computed with other settings are discarded.
+    """
+    self.state_dir = state_dir
+    self.settings = dict(settings, version=STATE_VERSION)
+    # absolute data file path -> {'source': signature, 'inputs': inputs, 'state': name}
+    self.entries = {}
+    if state_dir == '':
+      return
+    if not os.path.exists(state_dir):
+      os.makedirs(state_dir)
+    manifest_path = os.path.join(state_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+      with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+      if manifest['settings'] == json.loads(json.dumps(self.settings)):
+        self.entries = manifest['entries']
+
+  def load(self, source_path, inputs=None):
+    """
+    Args:
+      source_path: Path to the data file.
+      inputs: JSON-serializable inputs of the state besides the data file, as given
+        to save.
+
+    Returns: Dict of the arrays saved for a data file if they are up to date,
+      otherwise None.
+    """
+    entry = self.entries.get(os.path.abspath(source_path))
+    if entry is None or entry['source'] != file_signature(source_path):
+      return None
+    if entry.get('inputs') != json.loads(json.dumps(inputs)):
+      return None
+    path = os.path.join(self.state_dir, entry['state'])
+    if not os.path.exists(path):
+      return None
+    with np.load(path) as arrays:
+      return dict([(key, arrays[key]) for key in arrays.files])
+
+  def save(self, source_path, state, inputs=None):
+    """
+    Saves the state of a data file and updates the manifest.
+
+    Args:
+      source_path: Path to the data file.
+      state: Dict from names to NumPy arrays.
+      inputs: JSON-serializable inputs of the state besides the data file, checked by
+        load.
+    """
+    if self.state_dir == '':
+      return
+    key = hashlib.sha1(os.path.abspath(source_path)).hexdigest()[:16]
+    name = '%s.%s.npz' % (os.path.splitext(os.path.basename(source_path))[0], key)
+    temp_path = os.path.join(self.state_dir, '%s.tmp%d.npz' % (name, os.getpid()))
+    np.savez_compressed(temp_path, **state)
+    os.rename(temp_path, os.path.join(self.state_dir, name))
+    self.entries[os.path.abspath(source_path)] = {
+      'source': file_signature(source_path),
+      'inputs': inputs,
+      'state': name
+    }
+    self._write_manifest()
+
+  def _write_manifest(self):
+    manifest_path = os.path.join(self.state_dir, 'manifest.json')
+    temp_path = '%s.tmp%d' % (manifest_path, os.getpid())
+    with open(temp_path, 'w') as f:
+      json.dump({'settings': self.settings, 'entries': self.entries}, f, indent=2,
+                sort_keys=True)
+    os.rename(temp_path, manifest_path)
+
+
+def pending_files(store, filenames, inputs=None):
+  """
+  Args:
+    store: StateStore.
+    filenames: Data files.
+    inputs: Optional dict from data files to their inputs for StateStore.load, None
+      for the files missing from it.
+
+  Returns: (states, pending) where states is a dict from the data files with an up to
+    date stored state to the state, and pending the list of the other files, in order.
+  """
+  inputs = inputs or {}
+  states, pending = {}, []
+  for filename in filenames:
+    state = store.load(filename, inputs.get(filename))
+    if state is None:
+      pending.append(filename)
+    else:
+      states[filename] = state
+  return states, pending
@@ -0,0 +1,89 @@
+import os, sys, shutil, subprocess, tempfile, unittest
+import numpy as np
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+from speed_stats import BinnedSpeedStats
+from trip_file import NUM_DAY_BINS, DAY_BASE, HOUR_BASE
+
+class AggregateMonthTest(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp(prefix='test_aggregate_month')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def write_day_csv(self, year_month, hour, speeds, histogram):
+    """
+    Writes day_<year_month>.csv with one bin of the speeds on day 1 at the given hour,
+    and its _histogram.npz as aggregate_day.py --histograms if histogram is set.
+
+    Returns: The CSV path.
+    """
+    path = os.path.join(self.dir, 'day_%s.csv' % year_month)
+    with open(path, 'w') as f:
+      f.write('date,hour,pickup_zone,dropoff_zone,mean,std,percentile_85,count\n')
+      f.write('%s-01,%d,0,0,%.9f,%.9f,%.9f,%d\n' % (
+        year_month, hour, speeds.mean(), speeds.std(), np.percentile(speeds, 85),
+        len(speeds)))
+    if histogram:
+      bins = BinnedSpeedStats(NUM_DAY_BINS)
+      bins.add(np.full(len(speeds), hour * HOUR_BASE, dtype=np.int64), speeds)
+      np.savez_compressed(os.path.join(self.dir, 'day_%s_histogram.npz' % year_month),
+                          year_month=year_month, **bins.to_arrays())
+    return path
+
+  def aggregate(self, files, state_dir=''):
+    """
+    Runs aggregate_month.py over the files.
+
+    Returns: The rows of the output, without the header.
+    """
+    data_list = os.path.join(self.dir, 'data_list.txt')
+    with open(data_list, 'w') as f:
+      f.write('\n'.join(files) + '\n')
+    output = os.path.join(self.dir, 'month.csv')
+    subprocess.check_call([sys.executable, os.path.join(root, 'aggregate_month.py'),
+                           '--data_list', data_list, '--output', output,
+                           '--state_dir', state_dir],
+                          stdout=open(os.devnull, 'w'))
+    with open(output, 'r') as f:
+      return [line.strip().split(',') for line in f.readlines()[1:]]
+
+  def test_mixed_csv_and_histogram_inputs(self):
+    random = np.random.RandomState(1)
+    csv_speeds = random.uniform(5, 40, 2000)
+    histogram_speeds = random.uniform(5, 40, 50)
+    files = [self.write_day_csv('2015-01', 3, csv_speeds, False),
+             self.write_day_csv('2015-02', 5, histogram_speeds, True)]
+    rows = self.aggregate(files)
+    self.assertEqual([row[:2] for row in rows], [['2015-01', '3'], ['2015-02', '5']])
+    self.assertEqual(rows[0][4], 'nan')
+    self.assertLessEqual(abs(float(rows[1][4]) - np.percentile(histogram_speeds, 85)), .05)
+    self.assertEqual([int(row[5]) for row in rows], [2000, 50])
+
+  def test_years_outside_tlc_data(self):
+    random = np.random.RandomState(3)
+    files = [self.write_day_csv('2045-11', 2, random.uniform(5, 40, 10), True),
+             self.write_day_csv('2001-06', 9, random.uniform(5, 40, 20), False)]
+    state_dir = os.path.join(self.dir, 'states')
+    rows = self.aggregate(files, state_dir)
+    self.assertEqual([row[:2] + row[5:] for row in rows],
+                     [['2001-06', '9', '20'], ['2045-11', '2', '10']])
+    self.assertEqual(self.aggregate(files, state_dir), rows)
+
+  def test_stored_state_after_histogram_added(self):
+    random = np.random.RandomState(2)
+    speeds = random.uniform(5, 40, 100)
+    state_dir = os.path.join(self.dir, 'states')
+    files = [self.write_day_csv('2015-03', 7, speeds, False)]
+    self.assertEqual(self.aggregate(files, state_dir)[0][4], 'nan')
+    # The stored state was computed without the histograms, and is not reused.
+    self.write_day_csv('2015-03', 7, speeds, True)
+    rows = self.aggregate(files, state_dir)
+    self.assertLessEqual(abs(float(rows[0][4]) - np.percentile(speeds, 85)), .05)
+    self.assertEqual(self.aggregate(files, state_dir), rows)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,54 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from raw_trip import (MISSING_DROPOFF, MISSING_PICKUP, REGULAR, RawTrip, TripStats,
+                      parse_trip_lines, reason_names, validate_trips)
+
+FIELDS = ['1', '2015-01-15 19:05:39', '2015-01-15 19:23:42', '1', '1.59', '-73.993896',
+          '40.750111', '1', 'N', '-73.974785', '40.750618', '1', '12', '1', '0.5', '3.25',
+          '0', '17.05']
+
+
+def trip_line(values={}):
+  """
+  Returns: A trip record with the fields at the given indices replaced.
+  """
+  fields = list(FIELDS)
+  for index, value in values.iteritems():
+    fields[index] = value
+  return ','.join(fields)
+
+
+def batch_reason(line):
+  stats = TripStats()
+  validate_trips(parse_trip_lines([line]), stats)
+  return [reason for reason in reason_names if stats.counts[reason] > 0]
+
+
+class ValidateTest(unittest.TestCase):
+
+  def check_reason(self, line, reason):
+    self.assertEqual(RawTrip(line, TripStats()).reason, reason)
+    self.assertEqual(batch_reason(line), [reason])
+
+  def test_regular(self):
+    self.check_reason(trip_line(), REGULAR)
+
+  def test_non_finite_coordinates(self):
+    for value in ['nan', 'NaN', 'inf', '-inf', '1e400', '0']:
+      self.check_reason(trip_line({5: value}), MISSING_PICKUP)
+      self.check_reason(trip_line({6: value}), MISSING_PICKUP)
+      self.check_reason(trip_line({9: value}), MISSING_DROPOFF)
+      self.check_reason(trip_line({10: value}), MISSING_DROPOFF)
+
+  def test_non_finite_distance(self):
+    for value in ['nan', 'inf', '1e400', 'x']:
+      line = trip_line({4: value})
+      self.assertEqual([RawTrip(line, TripStats()).reason], batch_reason(line))
+
+
+if __name__ == '__main__':
+  unittest.main()
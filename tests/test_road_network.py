@@ -0,0 +1,44 @@
+import os, sys, shutil, tempfile, unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'hourly_segments'))
+import road_network
+
+class SnapshotTest(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp(prefix='test_road_network')
+    self.network_file = os.path.join(self.dir, 'network.txt')
+    self.write_network(1.5)
+    self.snapshot = os.path.join(self.dir, 'network.npz')
+    network = road_network.read_simple_network(self.network_file)
+    road_network.write_snapshot(network, self.snapshot, [self.network_file])
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def write_network(self, dist):
+    with open(self.network_file, 'w') as f:
+      f.write('2 2\n40.700000 -74.000000\n40.710000 -74.000000\n')
+      f.write('0 1 %.6f\n1 0 %.6f\n' % (dist, dist))
+
+  def load(self):
+    return road_network.load_snapshot(self.snapshot, [self.network_file])
+
+  def test_unchanged(self):
+    network = self.load()
+    self.assertEqual(network.edge_dist.tolist(), [1.5, 1.5])
+
+  def test_same_size_and_mtime(self):
+    # A rewrite of the same size that keeps the mtime, as cp -p or rsync do.
+    status = os.stat(self.network_file)
+    self.write_network(2.5)
+    os.utime(self.network_file, (status.st_atime, status.st_mtime))
+    self.assertIsNone(self.load())
+
+  def test_size_changed(self):
+    self.write_network(12.5)
+    self.assertIsNone(self.load())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,62 @@
+import os, sys, unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from speed_stats import BinnedSpeedStats
+
+class BinnedSpeedStatsTest(unittest.TestCase):
+  def test_percentile_after_add_moments(self):
+    # Bins 0 and 2 only have moments, bins 1 and 3 histograms: the order statistics of
+    # bins 1 and 3 must not be shifted by the speeds of bins 0 and 2.
+    random = np.random.RandomState(0)
+    stats = BinnedSpeedStats(4)
+    stats.add_moments(np.array([0, 2]), np.array([500., 7000.]), np.array([20., 30.]),
+                      np.array([3., 4.]))
+    speeds = {1: random.uniform(5, 40, 300), 3: random.uniform(5, 40, 40)}
+    for bin_id, values in speeds.iteritems():
+      stats.add(np.full(len(values), bin_id, dtype=np.int64), values)
+
+    self.assertEqual(stats.has_histogram(np.arange(4)).tolist(), [False, True, False, True])
+    percentile = stats.percentile(np.array([1, 3]), 85)
+    for value, bin_id in zip(percentile, [1, 3]):
+      self.assertLessEqual(abs(value - np.percentile(speeds[bin_id], 85)), .05)
+
+
+  def test_std_of_equal_speeds(self):
+    stats = BinnedSpeedStats(2)
+    stats.add(np.array([1, 1, 1]), np.array([7.1, 7.1, 7.1]))
+    self.assertEqual(stats.std(np.array([1]))[0], 0.)
+
+  def test_chunks(self):
+    # Chunks, merges and rollups give the moments and histogram of a single add.
+    random = np.random.RandomState(1)
+    bin_ids = random.randint(0, 20, 10000)
+    speeds = random.uniform(1, 60, 10000)
+    whole = BinnedSpeedStats(20)
+    whole.add(bin_ids, speeds)
+    chunked, other = BinnedSpeedStats(20), BinnedSpeedStats(20)
+    chunked.min_pending_histogram = other.min_pending_histogram = 100
+    for start in range(0, 6300, 700):
+      chunked.add(bin_ids[start:start + 700], speeds[start:start + 700])
+    other.add(bin_ids[6300:], speeds[6300:])
+    chunked.merge(other)
+
+    bins = np.arange(20)
+    expected_std = [np.std(speeds[bin_ids == bin_id]) for bin_id in bins]
+    expected_mean = [np.mean(speeds[bin_ids == bin_id]) for bin_id in bins]
+    for stats in [whole, chunked]:
+      self.assertTrue(np.allclose(stats.std(bins), expected_std, rtol=0, atol=1e-9))
+      self.assertTrue(np.allclose(stats.mean(bins), expected_mean, rtol=0, atol=1e-9))
+    for key, value in whole.to_arrays().iteritems():
+      if key not in ['speed_mean', 'm2']:
+        self.assertEqual(chunked.to_arrays()[key].tolist(), value.tolist())
+
+    rolled = BinnedSpeedStats(2)
+    rolled.rollup(chunked, bins % 2)
+    self.assertTrue(np.allclose(rolled.std(np.arange(2)),
+                                [np.std(speeds[bin_ids % 2 == k]) for k in range(2)],
+                                rtol=0, atol=1e-9))
+
+
+if __name__ == '__main__':
+  unittest.main()
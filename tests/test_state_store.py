@@ -0,0 +1,35 @@
+import os, sys, shutil, tempfile, unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from state_store import StateStore, pending_files
+
+class StateStoreTest(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp(prefix='test_state_store')
+    self.data_file = os.path.join(self.dir, 'data.csv')
+    with open(self.data_file, 'w') as f:
+      f.write('trips\n')
+    self.state_dir = os.path.join(self.dir, 'states')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_inputs(self):
+    store = StateStore(self.state_dir, {'aggregation': 'zone'})
+    store.save(self.data_file, {'count': np.arange(3)}, 'trip_file')
+
+    store = StateStore(self.state_dir, {'aggregation': 'zone'})
+    self.assertEqual(store.load(self.data_file, 'trip_file')['count'].tolist(), [0, 1, 2])
+    self.assertIsNone(store.load(self.data_file, 'csv'))
+    self.assertIsNone(store.load(self.data_file))
+    states, pending = pending_files(store, [self.data_file], {self.data_file: 'csv'})
+    self.assertEqual((states, pending), ({}, [self.data_file]))
+
+  def test_settings(self):
+    StateStore(self.state_dir, {'num_bins': 1}).save(self.data_file, {'count': np.arange(3)})
+    self.assertIsNone(StateStore(self.state_dir, {'num_bins': 2}).load(self.data_file))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,86 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+import trip_cache
+from raw_trip import TripStats, ZoneLocator
+
+HEADER = ('VendorID,tpep_pickup_datetime,tpep_dropoff_datetime,passenger_count,'
+          'trip_distance,RatecodeID,store_and_fwd_flag,PULocationID,DOLocationID,'
+          'payment_type,fare_amount,extra,mta_tax,tip_amount,tolls_amount,'
+          'improvement_surcharge,total_amount\n')
+TRIPS = ['2,2016-07-01 00:00:00,2016-07-01 00:10:00,1,2.5,1,N,%d,%d,1,10,0.5,0.5,2,0,0.3,13.3\n'
+         % (pickup, dropoff) for pickup, dropoff in [(4, 7), (7, 4), (9, 7)]]
+
+
+class TableLocator:
+  """
+  Zone locator of trips without coordinates, which only need the lookup table.
+  """
+  def __init__(self, location_zone_file):
+    self.location_zone_file = location_zone_file
+
+
+class LocationZoneTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.data_file = os.path.join(self.dir, 'yellow_tripdata_2016-07.csv')
+    with open(self.data_file, 'w') as f:
+      f.write(HEADER + ''.join(TRIPS))
+    self.location_zone_file = os.path.join(self.dir, 'location_zones.csv')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def read(self, zone_locator=None):
+    stats = TripStats()
+    trips = [batch for batch, _ in trip_cache.read_validated_trips(
+      self.data_file, stats, zone_locator=zone_locator)]
+    return trips[0], stats
+
+  def test_without_zones(self):
+    # The lookup table is not needed, and not read, without a zone locator.
+    trips, stats = self.read()
+    self.assertEqual(len(trips), 3)
+    self.assertEqual(stats.regular, 3)
+
+  def test_with_zones(self):
+    with open(self.location_zone_file, 'w') as f:
+      f.write('LocationID,zone\n4,10\n7,11\n9,-1\n')
+    # Trips of the location_id era are mapped by the lookup table, not the polygons.
+    trips, stats = self.read(TableLocator(self.location_zone_file))
+    self.assertEqual(trips.pickup_zone.tolist(), [10, 11])
+    self.assertEqual(trips.dropoff_zone.tolist(), [11, 10])
+    self.assertEqual(stats.pickup_nozone, 1)
+
+  def test_ingest_writes_location_zones(self):
+    # Zones 10 and 11 are the unit squares at lon -74 and -73, lat 40.
+    zone_file = os.path.join(self.dir, 'zones.csv')
+    with open(zone_file, 'w') as f:
+      f.write('id,part,zone,lon,lat\n')
+      for zone, lon in [(10, -74.), (11, -73.)]:
+        for dx, dy in [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)]:
+          f.write('0,0,%d,%f,%f\n' % (zone, lon + dx, 40. + dy))
+    centroid_file = os.path.join(self.dir, 'centroids.csv')
+    with open(centroid_file, 'w') as f:
+      f.write('LocationID,lon,lat\n4,-73.5,40.5\n7,-72.5,40.5\n9,-80,40.5\n')
+    subprocess.check_call([sys.executable, os.path.join(root, 'ingest.py'),
+                           '--zone_file', zone_file,
+                           '--location_zone_file', self.location_zone_file,
+                           '--taxi_zone_centroids', centroid_file],
+                          stdout=open(os.devnull, 'w'))
+
+    trips, stats = self.read(ZoneLocator(zone_file, self.location_zone_file))
+    self.assertEqual(trips.pickup_zone.tolist(), [10, 11])
+    self.assertEqual(stats.pickup_nozone, 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from raw_trip import Polygon, ZoneGrid
+
+
+def star_polygon(random, center_lon, center_lat, num_points, closed):
+  polygon = Polygon()
+  angles = np.sort(random.uniform(0, 2 * np.pi, num_points))
+  radii = random.uniform(.002, .02, num_points)
+  points = [(center_lon + r * np.cos(a), center_lat + r * np.sin(a))
+            for a, r in zip(angles, radii)]
+  if closed:
+    points.append(points[0])
+  for lon, lat in points:
+    polygon.add_point(lon, lat)
+  return polygon
+
+
+class ZoneGridTest(unittest.TestCase):
+
+  def check_grid(self, zone_polygon, random):
+    grid = ZoneGrid(zone_polygon, cell_size=.001)
+    lons = random.uniform(grid.min_lon - .005, grid.min_lon + grid.nx * grid.cell_size + .005, 5000)
+    lats = random.uniform(grid.min_lat - .005, grid.min_lat + grid.ny * grid.cell_size + .005, 5000)
+    # Points on the bounding box edges of the polygons, where contains() changes.
+    for polygon in zone_polygon.values():
+      edge_lats = random.uniform(polygon.min_lat, polygon.max_lat, 500)
+      edge_lons = random.uniform(polygon.min_lon, polygon.max_lon, 500)
+      offsets = random.uniform(-.0005, .0005, 500)
+      lons = np.concatenate([lons, polygon.min_lon + offsets, polygon.max_lon + offsets, edge_lons, edge_lons])
+      lats = np.concatenate([lats, edge_lats, edge_lats, polygon.min_lat + offsets, polygon.max_lat + offsets])
+
+    expected = []
+    for lon, lat in zip(lons, lats):
+      zone = -1
+      for z, polygon in zone_polygon.iteritems():
+        if polygon.contains(lon, lat):
+          zone = z
+          break
+      expected.append(zone)
+    expected = np.array(expected)
+    located = grid.locate_many(lons, lats)
+    self.assertEqual(np.flatnonzero(located != expected).tolist(), [])
+    located = np.array([grid.locate(lon, lat) for lon, lat in zip(lons, lats)])
+    self.assertEqual(np.flatnonzero(located != expected).tolist(), [])
+
+  def test_closed_rings(self):
+    random = np.random.RandomState(1)
+    zone_polygon = dict((zone, star_polygon(random, -74 + .01 * zone, 40.7, 30, True))
+                        for zone in range(4))
+    self.check_grid(zone_polygon, random)
+
+  def test_unclosed_rings(self):
+    for seed in range(3):
+      random = np.random.RandomState(seed)
+      zone_polygon = dict((zone, star_polygon(random, -74 + .01 * zone, 40.7, 30, zone % 2 == 0))
+                          for zone in range(4))
+      self.check_grid(zone_polygon, random)
+
+
+if __name__ == '__main__':
+  unittest.main()
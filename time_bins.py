@@ -0,0 +1,96 @@
+import numpy as np
+from const import time_of_day_ranges, season_months
+
+# Classification of epoch timestamps into calendar bins through small lookup tables,
+# so that every field is one array index. All functions take either a scalar or an
+# int64 NumPy array of epoch seconds (UTC, or naive local time treated as UTC).
+
+SECONDS_PER_DAY = 86400
+
+def time_of_day_table(ranges, default):
+  """
+  Args:
+    ranges: Dict from time of day code to its [start, end] datetime.time, inclusive.
+    default: Code of the seconds outside all ranges.
+
+  Returns: int64 array from second of day to time of day code.
+  """
+  table = np.full(SECONDS_PER_DAY, default, dtype=np.int64)
+  for key, range in ranges.iteritems():
+    start = range[0].hour * 3600 + range[0].minute * 60 + range[0].second
+    end = range[1].hour * 3600 + range[1].minute * 60 + range[1].second
+    table[start:end + 1] = key
+  return table
+
+
+def season_table(months_by_season):
+  """
+  Args:
+    months_by_season: Dict from a sequence of months (1-12) to its season code.
+
+  Returns: int64 array from month (1-12) to season code, -1 at index 0.
+  """
+  table = np.full(13, -1, dtype=np.int64)
+  for months, key in months_by_season.iteritems():
+    table[list(months)] = key
+  return table
+
+
+# Tables of the definitions in const.py.
+time_of_day_codes = time_of_day_table(time_of_day_ranges, 3) # off-peak
+season_codes = season_table(season_months)
+
+def second_of_day(t):
+  return t % SECONDS_PER_DAY
+
+
+def hour(t):
+  return t / 3600 % 24
+
+
+def day_of_week(t):
+  """
+  Returns: Day of week, 0 for Monday.
+  """
+  return (t / SECONDS_PER_DAY + 3) % 7 # 1970-01-01 is a Thursday
+
+
+def is_weekday(t):
+  return day_of_week(t) <= 4
+
+
+def epoch_day(t):
+  """
+  Returns: Days since 1970-01-01.
+  """
+  return t / SECONDS_PER_DAY
+
+
+def epoch_month(t):
+  """
+  Returns: Months since 1970-01.
+  """
+  return np.asarray(t).astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+
+
+def month(t):
+  """
+  Returns: Month of the year, 1-12.
+  """
+  return epoch_month(t) % 12 + 1
+
+
+def day_of_month(t):
+  """
+  Returns: Day of the month, 1-31.
+  """
+  days = (np.asarray(t) / SECONDS_PER_DAY).astype('datetime64[D]')
+  return (days - days.astype('datetime64[M]')).astype(np.int64) + 1
+
+
+def season(t, table=season_codes):
+  return table[month(t)]
+
+
+def time_of_day(t, table=time_of_day_codes):
+  return table[second_of_day(t)]
@@ -0,0 +1,144 @@
+import re
+import numpy as np
+
+# Parsing of TLC 'YYYY-MM-DD HH:MM:SS' timestamps to epoch seconds.
+#
+# Besides the fixed-width format, eras and exports differ in:
+#   - fractional seconds: 'YYYY-MM-DD HH:MM:SS.ffffff', truncated to the second,
+#   - missing seconds: 'YYYY-MM-DD HH:MM', read as second 0,
+#   - a 'T' date and time separator.
+# Other layouts, such as fields that are not zero padded, go through the slower
+# re.split path that RawTrip used, which accepts them.
+
+# Sentinel epoch value for timestamps that cannot be parsed.
+INVALID_TIME = np.iinfo(np.int64).min
+
+days_in_month = [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+def _is_leap(year):
+  return (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+
+
+def _days_from_civil(year, month, day):
+  """
+  Returns: Days since 1970-01-01 of proleptic Gregorian dates, for scalars or arrays.
+  """
+  year = year - (month <= 2)
+  era = year // 400
+  year_of_era = year - era * 400
+  day_of_year = (153 * (month + 9 - 12 * (month > 2)) + 2) // 5 + day - 1
+  day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+  return era * 146097 + day_of_era - 719468
+
+
+def _to_epoch(year, month, day, hour, minute, second):
+  """
+  Returns: Epoch seconds of the scalar fields. Raises ValueError for invalid fields,
+    like datetime.datetime.
+  """
+  if not (1 <= year and 1 <= month <= 12 and hour < 24 and minute < 60 and second < 60):
+    raise ValueError('timestamp field out of range')
+  if not 1 <= day <= days_in_month[month] + (month == 2 and _is_leap(year)):
+    raise ValueError('day is out of range for month')
+  return _days_from_civil(year, month, day) * 86400 + hour * 3600 + minute * 60 + second
+
+
+def parse_timestamp(value):
+  """
+  Args:
+    value: Timestamp string.
+
+  Returns: Epoch seconds. Raises ValueError if value cannot be parsed.
+  """
+  n = len(value)
+  if (n >= 16 and value[4] == '-' and value[7] == '-' and value[10] in ' T' and
+      value[13] == ':' and (n == 16 or (n >= 19 and value[16] == ':' and
+                                        (n == 19 or value[19] == '.')))):
+    return _to_epoch(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                     int(value[11:13]), int(value[14:16]), int(value[17:19]) if n > 16 else 0)
+  fields = re.split('[ T:-]', value.strip())
+  if len(fields) == 6:
+    fields[5] = fields[5].split('.')[0]
+  elif len(fields) == 5:
+    fields.append('0')
+  year, month, day, hour, minute, second = [int(x) for x in fields]
+  return _to_epoch(year, month, day, hour, minute, second)
+
+
+# Byte offsets of the digits of every field in the fixed-width format.
+field_digits = [(0, 4), (5, 7), (8, 10), (11, 13), (14, 16), (17, 19)]
+digit_columns = [column for start, end in field_digits for column in range(start, end)]
+
+# Days since epoch of the first day, and number of days, of every month of the years
+# [TABLE_START_YEAR, TABLE_END_YEAR), indexed by (year - TABLE_START_YEAR) * 12 + month - 1.
+TABLE_START_YEAR, TABLE_END_YEAR = 1900, 2100
+_table_years = np.repeat(np.arange(TABLE_START_YEAR, TABLE_END_YEAR), 12)
+_table_months = np.tile(np.arange(1, 13), TABLE_END_YEAR - TABLE_START_YEAR)
+month_start_days = _days_from_civil(_table_years, _table_months, 1)
+month_lengths = (np.array(days_in_month)[_table_months] +
+                 ((_table_months == 2) & _is_leap(_table_years)))
+
+def parse_timestamp_column(values):
+  """
+  Converts a column of timestamp strings to epoch seconds without per-row Python work
+  for the fixed-width formats.
+
+  Args:
+    values: List or NumPy array of strings.
+
+  Returns: int64 array of epoch seconds, INVALID_TIME for values that cannot be parsed.
+  """
+  strings = np.asarray(values)
+  if strings.dtype.kind == 'U':
+    strings = strings.astype('S')
+  n = len(strings)
+  if n == 0:
+    return np.zeros(0, dtype=np.int64)
+  if strings.dtype.kind != 'S':
+    strings = strings.astype('S')
+
+  # One row of bytes per value, padded with zero bytes. Values have no zero bytes, so a
+  # zero byte marks the end of a value.
+  width = max(strings.dtype.itemsize, 21)
+  chars = np.frombuffer(strings.astype('S%d' % width).tostring(), dtype=np.uint8)
+  chars = chars.reshape(n, width)
+  # Bytes other than digits wrap around to values above 9.
+  digits = chars[:, digit_columns] - np.uint8(ord('0'))
+
+  has_seconds = chars[:, 16] != 0
+  fixed = (chars[:, 4] == ord('-')) & (chars[:, 7] == ord('-'))
+  fixed &= (chars[:, 10] == ord(' ')) | (chars[:, 10] == ord('T'))
+  fixed &= chars[:, 13] == ord(':')
+  fixed &= (digits[:, :12] <= 9).all(axis=1)
+  # 'HH:MM', 'HH:MM:SS' or 'HH:MM:SS.f...'
+  fixed &= ~has_seconds | ((chars[:, 16] == ord(':')) & (digits[:, 12:] <= 9).all(axis=1) &
+                           ((chars[:, 19] == 0) |
+                            ((chars[:, 19] == ord('.')) & (chars[:, 20] != 0))))
+
+  fields = []
+  for start, end in field_digits:
+    field = digits[:, digit_columns.index(start)].astype(np.int32)
+    for column in range(start + 1, end):
+      field = field * 10 + digits[:, digit_columns.index(column)]
+    fields.append(field)
+  year, month, day, hour, minute, second = fields
+  second = np.where(has_seconds, second, 0)
+
+  in_table = (year >= TABLE_START_YEAR) & (year < TABLE_END_YEAR)
+  fixed_in_table = fixed & in_table
+  valid = fixed_in_table & (month >= 1) & (month <= 12) & (hour < 24) & (minute < 60)
+  valid &= second < 60
+  month_index = np.clip((year - TABLE_START_YEAR) * 12 + month - 1, 0, len(month_lengths) - 1)
+  valid &= (day >= 1) & (day <= month_lengths[month_index])
+
+  column = np.full(n, INVALID_TIME, dtype=np.int64)
+  column[valid] = ((month_start_days[month_index[valid]] + day[valid] - 1) * 86400 +
+                   hour[valid] * 3600 + minute[valid] * 60 + second[valid])
+
+  # Values in other layouts or years go through the scalar parser.
+  for i in np.flatnonzero(~fixed_in_table):
+    try:
+      column[i] = parse_timestamp(strings[i])
+    except ValueError:
+      pass
+  return column
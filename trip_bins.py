@@ -0,0 +1,204 @@
+import numpy as np
+from const import *
+from speed_stats import BinnedSpeedStats
+import time_bins
+
+# Bin dimensions of trips and groupings of trips by any list of them, the trip
+# counterpart of the --bin attributes of hourly_segments/aggregate.py.
+#
+# Every dimension maps trips to integer codes in [0, size). The bin id of a grouping is
+# the mixed-radix number of the codes of its dimensions, so that sorting bin ids sorts
+# bins as tuples of codes. Groupings such as date x hour x zone pair have many more
+# possible bins than occur in a data file, so their BinnedSpeedStats only holds the bin
+# ids seen so far, in order of appearance.
+
+# Calendar range of the year_month and date dimensions. Trips outside of it are left
+# out of groupings by these dimensions.
+FIRST_YEAR = 1970 # epoch
+END_YEAR = 2100
+NUM_MONTHS = (END_YEAR - FIRST_YEAR) * 12
+NUM_DATES = (np.datetime64('%d-01-01' % END_YEAR) - np.datetime64('1970-01-01')).astype(int)
+
+NUM_ZONES = len(zone_names)
+
+def _format_year_month(codes):
+  return ['%d-%02d' % (FIRST_YEAR + code / 12, code % 12 + 1) for code in codes]
+
+
+def _format_date(codes):
+  return np.datetime_as_string(codes.astype('datetime64[D]')).tolist()
+
+
+def _format_names(names):
+  return lambda codes: [names[code] for code in codes]
+
+
+# Dimension -> (number of codes, function of a TripBatch returning its codes,
+#   function of codes returning their report strings)
+dimensions = {
+  'year_month': (NUM_MONTHS, lambda trips: time_bins.epoch_month(trips.pickup_time),
+                 _format_year_month),
+  'date': (NUM_DATES, lambda trips: time_bins.epoch_day(trips.pickup_time), _format_date),
+  'hour': (24, lambda trips: time_bins.hour(trips.pickup_time),
+           lambda codes: codes.tolist()),
+  'day_of_week': (7, lambda trips: time_bins.day_of_week(trips.pickup_time),
+                  _format_names(day_of_week_names)),
+  'is_weekday': (2, lambda trips: time_bins.is_weekday(trips.pickup_time).astype(np.int64),
+                 lambda codes: codes.astype(bool).tolist()),
+  'season': (len(season_names), lambda trips: time_bins.season(trips.pickup_time),
+             _format_names(season_names)),
+  'time_of_day': (len(time_of_day_names),
+                  lambda trips: time_bins.time_of_day(trips.pickup_time),
+                  _format_names(time_of_day_names)),
+  'pickup_zone': (NUM_ZONES, lambda trips: trips.pickup_zone.astype(np.int64),
+                  _format_names(zone_names)),
+  'dropoff_zone': (NUM_ZONES, lambda trips: trips.dropoff_zone.astype(np.int64),
+                   _format_names(zone_names))
+}
+
+zone_dimensions = ['pickup_zone', 'dropoff_zone']
+
+def parse_dimensions(value):
+  """
+  Args:
+    value: Comma separated dimension names, e.g. 'year_month,hour'.
+
+  Returns: The list of dimension names. Raises ValueError for unknown or repeated ones.
+  """
+  names = value.split(',')
+  for name in names:
+    if name not in dimensions:
+      raise ValueError('unsupported bin dimension "%s"' % name)
+  if len(set(names)) != len(names):
+    raise ValueError('repeated bin dimension in "%s"' % value)
+  return names
+
+
+class TripFields:
+  def __init__(self, trips):
+    """
+    Dimension codes of a TripBatch, computed once and shared by all the groupings.
+    """
+    self.trips = trips
+    self.codes = {}
+
+  def get(self, name):
+    if name not in self.codes:
+      self.codes[name] = dimensions[name][1](self.trips)
+    return self.codes[name]
+
+
+class KeyedBins:
+  def __init__(self):
+    """
+    BinnedSpeedStats of sparse int64 bin ids, with one bin per bin id seen so far, in
+    order of appearance.
+    """
+    self.keys = np.zeros(0, dtype=np.int64) # bin id of every bin, in order of appearance
+    self.key_order = np.zeros(0, dtype=np.int64) # argsort of keys
+    self.bins = BinnedSpeedStats(0)
+
+  def _indices(self, keys):
+    """
+    Returns: The bins of the given bin ids, appending the ones not seen yet.
+    """
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    sorted_keys = self.keys[self.key_order]
+    position = np.searchsorted(sorted_keys, unique_keys)
+    found = position < len(sorted_keys)
+    found[found] = sorted_keys[position[found]] == unique_keys[found]
+    indices = np.empty(len(unique_keys), dtype=np.int64)
+    indices[found] = self.key_order[position[found]]
+    new_keys = unique_keys[~found]
+    if len(new_keys) > 0:
+      indices[~found] = np.arange(len(self.keys), len(self.keys) + len(new_keys))
+      self.keys = np.concatenate([self.keys, new_keys])
+      self.key_order = np.argsort(self.keys, kind='mergesort')
+      self.bins.grow(len(self.keys))
+    return indices[inverse]
+
+  def merge(self, other):
+    """
+    Adds the bins of another KeyedBins with the same meaning of bin ids.
+    """
+    if len(other.keys) == 0:
+      return
+    self.bins.rollup(other.bins, self._indices(other.keys))
+
+  def nonempty_bins(self):
+    """
+    Returns: The bins with at least one speed, in order of bin id.
+    """
+    return self.key_order[self.bins.count[self.key_order] > 0]
+
+
+class Grouping(KeyedBins):
+  def __init__(self, names):
+    """
+    Speed statistics of trips grouped by a list of dimensions.
+
+    Args:
+      names: List of dimension names, see parse_dimensions.
+    """
+    KeyedBins.__init__(self)
+    self.names = names
+    self.sizes = [dimensions[name][0] for name in names]
+    self.uses_zones = any(name in zone_dimensions for name in names)
+
+  def bin_ids(self, fields):
+    """
+    Returns: (bin_ids, mask) with the bin ids of the trips within the range of every
+      dimension, and the boolean mask of these trips.
+    """
+    bin_ids = np.zeros(len(fields.trips), dtype=np.int64)
+    mask = np.ones(len(fields.trips), dtype=bool)
+    for name, size in zip(self.names, self.sizes):
+      codes = fields.get(name)
+      mask &= (codes >= 0) & (codes < size)
+      bin_ids = bin_ids * size + codes
+    return bin_ids[mask], mask
+
+  def add(self, fields):
+    """
+    Args:
+      fields: TripFields of accepted trips with speed set, and zones located if the
+        grouping has zone dimensions.
+    """
+    bin_ids, mask = self.bin_ids(fields)
+    if len(bin_ids) == 0:
+      return
+    self.bins.add(self._indices(bin_ids), fields.trips.speed[mask])
+
+  def fields(self, bin_ids):
+    """
+    Returns: List of the code arrays of every dimension of the given bin ids.
+    """
+    codes = []
+    for size in reversed(self.sizes):
+      codes.insert(0, bin_ids % size)
+      bin_ids = bin_ids / size
+    return codes
+
+  def report(self, file):
+    """
+    Writes one line per bin, sorted by the dimensions in order.
+    """
+    with open(file, 'w') as f:
+      f.write(','.join(self.names + [
+        'mean',
+        'std',
+        'percentile_85',
+        'count'
+      ]) + '\n')
+
+      bins = self.nonempty_bins()
+      columns = [dimensions[name][2](codes)
+                 for name, codes in zip(self.names, self.fields(self.keys[bins]))]
+      columns += [
+        self.bins.mean(bins),
+        self.bins.std(bins),
+        self.bins.percentile(bins, 85),
+        self.bins.count[bins]
+      ]
+      row_format = ','.join(['%s'] * len(self.names) + ['%.9f', '%.9f', '%.9f', '%d'])
+      f.writelines(row_format % row + '\n' for row in zip(*columns))
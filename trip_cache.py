@@ -0,0 +1,301 @@
+import hashlib, json, os, shutil
+import numpy as np
+import great_circle
+from raw_trip import (TripBatch, TripStats, parse_trip_lines, validate_trips,
+                      REGULAR, PICKUP_NOZONE, DROPOFF_NOZONE)
+from trip_reader import read_line_chunks, read_header
+from trip_schema import detect_schema
+
+# Columnar cache of validated trips, written once by ingest.py and memory-mapped by
+# the aggregators instead of parsing the raw TLC CSVs again.
+#
+# The cache of a data file is a directory under the cache dir, named after the file
+# and keyed by its absolute path, size and mtime. It holds one .npy file per column
+# and meta.json with the TripStats counts of the file.
+#
+# Cached trips have passed every check except the zone checks. Zones are located at
+# ingest time if a zone file is given, with -1 for no zone, and trips without zones are
+# rejected when reading, so the same cache serves aggregators with and without zones.
+#
+# trip_file.py writes the same trips in a more compact fixed-width format that
+# open_cache also accepts.
+
+CACHE_VERSION = 1
+
+# Number of cached trips per chunk yielded when reading.
+CHUNK_ROWS = 1 << 20
+
+trip_columns = [
+  ('pickup_time', np.int64),
+  ('dropoff_time', np.int64),
+  ('pickup_lon', np.float32),
+  ('pickup_lat', np.float32),
+  ('dropoff_lon', np.float32),
+  ('dropoff_lat', np.float32),
+  ('distance', np.float32),
+  ('speed', np.float64)
+]
+
+zone_columns = [
+  ('pickup_zone', np.int8),
+  ('dropoff_zone', np.int8)
+]
+
+def file_signature(file_path):
+  """
+  Returns: [absolute path, size, mtime] identifying the current version of a file.
+  """
+  status = os.stat(file_path)
+  return [os.path.abspath(file_path), status.st_size, int(status.st_mtime)]
+
+
+def cache_path(cache_dir, source_path):
+  """
+  Returns: The cache directory of a data file, keyed by its path, size and mtime.
+  """
+  key = hashlib.sha1(json.dumps(file_signature(source_path))).hexdigest()[:16]
+  name = os.path.splitext(os.path.basename(source_path))[0]
+  return os.path.join(cache_dir, '%s.%s' % (name, key))
+
+
+class TripCache:
+  def __init__(self, path):
+    """
+    Opens the cache in a directory written by write_cache. Columns are memory-mapped.
+    """
+    self.path = path
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+      self.meta = json.load(f)
+    self.num_trips = self.meta['num_trips']
+    self.has_zones = self.meta['zone_file'] is not None
+    columns = trip_columns + (zone_columns if self.has_zones else [])
+    self.columns = {}
+    for key, dtype in columns:
+      self.columns[key] = np.load(os.path.join(path, key + '.npy'), mmap_mode='r')
+
+  def matches(self, zone_locator=None):
+    return matches_meta(self.meta, zone_locator)
+
+  def read_chunks(self, stats, zone_locator=None, chunk_rows=CHUNK_ROWS, keep_nozone=False):
+    """
+    Reads the cached trips with the same result as validate_trips on the raw file.
+
+    Args:
+      stats: TripStats to be updated with the counts of the whole file.
+      zone_locator: If given, trips outside all zones are rejected.
+      chunk_rows: Number of cached trips per chunk.
+      keep_nozone: If True, zones are set but trips outside all zones are kept, with -1
+        for no zone, and counted as regular. See reject_nozone.
+
+    Yields: (trips, progress) with an accepted TripBatch and the fraction of the cached
+      trips read so far.
+    """
+    stats.counts += np.array(self.meta['counts'], dtype=np.int64)
+    for start in range(0, self.num_trips, chunk_rows):
+      end = min(start + chunk_rows, self.num_trips)
+      trips = TripBatch(*[self.columns[key][start:end] for key, dtype in trip_columns[:-1]])
+      trips.speed = self.columns['speed'][start:end]
+      if zone_locator is not None:
+        trips.pickup_zone = self.columns['pickup_zone'][start:end].astype(np.int64)
+        trips.dropoff_zone = self.columns['dropoff_zone'][start:end].astype(np.int64)
+        if not keep_nozone:
+          trips = reject_nozone(trips, stats)
+      yield trips, 1. * end / self.num_trips
+
+
+def reject_nozone(trips, stats):
+  """
+  Moves the trips without pickup or dropoff zone from regular to the zone counters,
+  in the order validate_trips checks them.
+
+  Returns: A TripBatch with the trips having both zones.
+  """
+  pickup_nozone = trips.pickup_zone == -1
+  dropoff_nozone = ~pickup_nozone & (trips.dropoff_zone == -1)
+  num_pickup_nozone, num_dropoff_nozone = pickup_nozone.sum(), dropoff_nozone.sum()
+  stats.add_reason(PICKUP_NOZONE, num_pickup_nozone)
+  stats.add_reason(DROPOFF_NOZONE, num_dropoff_nozone)
+  stats.add_reason(REGULAR, -(num_pickup_nozone + num_dropoff_nozone))
+  return trips.select(~(pickup_nozone | dropoff_nozone))
+
+
+def open_cache(cache_dir, source_path, zone_locator=None):
+  """
+  Returns: The TripCache, or the TripFile written by trip_file.write_trip_file, of a
+    data file if it is up to date and usable with zone_locator, otherwise None.
+  """
+  if not cache_dir:
+    return None
+  from trip_file import TripFile, trip_file_path
+  path = cache_path(cache_dir, source_path)
+  if os.path.exists(os.path.join(path, 'meta.json')):
+    cache = TripCache(path)
+  elif os.path.exists(trip_file_path(cache_dir, source_path)):
+    cache = TripFile(trip_file_path(cache_dir, source_path))
+  else:
+    return None
+  return cache if cache.matches(zone_locator) else None
+
+
+def input_format(cache_dir, source_path, zone_locator=None):
+  """
+  Returns: The form read_validated_trips reads a whole data file in: 'trip_file' for a
+    trip file, whose float32 speeds give slightly different aggregates, otherwise 'csv',
+    as the columnar cache holds the same trips as the CSV.
+  """
+  from trip_file import TripFile
+  cache = open_cache(cache_dir, source_path, zone_locator)
+  return 'trip_file' if isinstance(cache, TripFile) else 'csv'
+
+
+def read_schema(source_path, zone_locator=None):
+  """
+  Returns: The TripSchema of a data file. The lookup table of the location_id era is
+    only read if zones are located, from the location_zone_file of zone_locator.
+  """
+  return detect_schema(read_header(source_path),
+                       zone_locator.location_zone_file if zone_locator is not None else None)
+
+
+def ingest_chunks(source_path, stats, zone_locator=None, progress_callback=None):
+  """
+  Parses and validates a raw TLC CSV in chunks for caching, without the zone checks.
+
+  Args:
+    source_path: Path to the raw data file.
+    stats: TripStats to be updated.
+    zone_locator: If given, zones are located, with -1 for no zone.
+    progress_callback: Optional function of the progress fraction.
+
+  Yields: TripBatch of the trips passing all the other checks.
+  """
+  schema = read_schema(source_path, zone_locator)
+  for lines, progress in read_line_chunks(source_path):
+    trips = validate_trips(parse_trip_lines(lines, schema), stats)
+    if zone_locator is not None:
+      trips.pickup_zone = trips.locate_zones(zone_locator, 'pickup')
+      trips.dropoff_zone = trips.locate_zones(zone_locator, 'dropoff')
+    yield trips
+    if progress_callback is not None:
+      progress_callback(progress)
+
+
+def cache_meta(source_path, zone_locator, num_trips, stats):
+  """
+  Returns: The metadata dict stored with a cache, checked by matches_meta.
+  """
+  return {
+    'version': CACHE_VERSION,
+    'source': file_signature(source_path),
+    'zone_file': (file_signature(zone_locator.zone_file)
+                  if zone_locator is not None else None),
+    'great_circle_mode': great_circle.mode,
+    'num_trips': num_trips,
+    'counts': stats.counts.tolist()
+  }
+
+
+def matches_meta(meta, zone_locator=None):
+  """
+  Returns: Whether a cache with the given metadata was validated with the same
+    settings as a direct read with zone_locator would use.
+  """
+  if meta['version'] != CACHE_VERSION:
+    return False
+  if meta['great_circle_mode'] != great_circle.mode:
+    return False
+  if zone_locator is None:
+    return True
+  return (meta['zone_file'] is not None and
+          meta['zone_file'] == file_signature(zone_locator.zone_file))
+
+
+def write_cache(cache_dir, source_path, zone_locator=None, progress_callback=None):
+  """
+  Parses and validates a raw TLC CSV and writes its cache.
+
+  Args:
+    cache_dir: Cache directory.
+    source_path: Path to the raw data file.
+    zone_locator: If given, zones are located and cached.
+    progress_callback: Optional function of the progress fraction.
+
+  Returns: The TripStats of the file, without the zone checks.
+  """
+  path = cache_path(cache_dir, source_path)
+  temp_path = '%s.tmp%d' % (path, os.getpid())
+  if os.path.exists(temp_path):
+    shutil.rmtree(temp_path)
+  os.makedirs(temp_path)
+
+  columns = trip_columns + (zone_columns if zone_locator is not None else [])
+  # Columns are appended chunk by chunk to raw files, then wrapped into .npy files,
+  # so that memory stays flat regardless of the file size.
+  raw_files = dict([(key, open(os.path.join(temp_path, key + '.raw'), 'wb'))
+                    for key, dtype in columns])
+  stats = TripStats()
+  num_trips = 0
+  for trips in ingest_chunks(source_path, stats, zone_locator, progress_callback):
+    for key, dtype in columns:
+      column = getattr(trips, key)
+      if column is None: # coordinates of the location_id era
+        column = np.full(len(trips), np.nan)
+      column.astype(dtype).tofile(raw_files[key])
+    num_trips += len(trips)
+
+  for key, dtype in columns:
+    raw_files[key].close()
+    raw_path = os.path.join(temp_path, key + '.raw')
+    with open(raw_path, 'rb') as raw, open(os.path.join(temp_path, key + '.npy'), 'wb') as f:
+      np.lib.format.write_array_header_1_0(f, {
+        'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        'fortran_order': False,
+        'shape': (num_trips,)
+      })
+      shutil.copyfileobj(raw, f)
+    os.remove(raw_path)
+
+  with open(os.path.join(temp_path, 'meta.json'), 'w') as f:
+    json.dump(cache_meta(source_path, zone_locator, num_trips, stats), f, indent=2)
+
+  if os.path.exists(path):
+    shutil.rmtree(path)
+  os.rename(temp_path, path)
+  return stats
+
+
+def read_validated_trips(file_path, stats, zone_locator=None, cache_dir='',
+                         byte_range=None, keep_nozone=False):
+  """
+  Reads the validated trips of a data file, from its cache if it is up to date and
+  otherwise by parsing the raw CSV.
+
+  Args:
+    file_path: Path to the raw data file.
+    stats: TripStats to be updated.
+    zone_locator: If given, zones are located and trips outside all zones are rejected.
+    cache_dir: Cache directory written by ingest.py, '' to always parse the CSV.
+    byte_range: Optional (start, end) byte range of the CSV. A cache is only used for
+      whole files.
+    keep_nozone: If True, zones are located but trips outside all zones are kept, with
+      -1 for no zone, and counted as regular. reject_nozone applies the zone checks
+      afterwards.
+
+  Yields: (trips, progress) with an accepted TripBatch and the progress fraction.
+  """
+  cache = open_cache(cache_dir, file_path, zone_locator) if byte_range is None else None
+  if cache is not None:
+    for trips, progress in cache.read_chunks(stats, zone_locator, keep_nozone=keep_nozone):
+      yield trips, progress
+    return
+  schema = read_schema(file_path, zone_locator)
+  for lines, progress in read_line_chunks(file_path, byte_range=byte_range):
+    trips = parse_trip_lines(lines, schema)
+    if not keep_nozone:
+      yield validate_trips(trips, stats, zone_locator=zone_locator), progress
+      continue
+    trips = validate_trips(trips, stats)
+    if zone_locator is not None:
+      trips.pickup_zone = trips.locate_zones(zone_locator, 'pickup')
+      trips.dropoff_zone = trips.locate_zones(zone_locator, 'dropoff')
+    yield trips, progress
@@ -0,0 +1,177 @@
+import json, os
+import numpy as np
+from const import *
+from raw_trip import TripBatch, TripStats
+import time_bins
+from trip_cache import (cache_path, cache_meta, matches_meta, ingest_chunks,
+                        reject_nozone, CHUNK_ROWS)
+
+# Fixed-width binary trip file, the compact form of the trip cache for runs over many
+# years: 14 bytes per trip instead of 46, mapped with np.memmap so that concurrent jobs
+# share the page cache and memory stays flat.
+#
+# Layout:
+#   HEADER_SIZE bytes: TRIP_FILE_MAGIC followed by the cache metadata as JSON (see
+#     trip_cache.cache_meta), padded with spaces.
+#   num_trips records of trip_record, little-endian and packed.
+#
+# Speeds are stored as float32, so aggregates differ from the CSV and columnar cache
+# reads in the last digits.
+
+TRIP_FILE_MAGIC = 'VZTRIPS\x01'
+HEADER_SIZE = 4096
+
+trip_record = np.dtype([
+  ('pickup_time', '<i8'), # epoch seconds
+  ('speed', '<f4'), # mph
+  ('pickup_zone', 'i1'), # -1 for no zone
+  ('dropoff_zone', 'i1')
+])
+
+NUM_ZONES = len(zone_names)
+NUM_DAYS = 31
+NUM_HOURS = 24
+
+# (day, hour, pickup_zone, dropoff_zone) bins, used by aggregate_day.py.
+HOUR_BASE = NUM_ZONES * NUM_ZONES
+DAY_BASE = NUM_HOURS * HOUR_BASE
+NUM_DAY_BINS = NUM_DAYS * DAY_BASE
+
+# (pickup_zone, dropoff_zone, season, is_weekday, time_of_day) bins, used by
+# aggregate_zone.py. Ordered as the tuples of the fields.
+WEEKDAY_BASE = len(time_of_day_names)
+SEASON_BASE = 2 * WEEKDAY_BASE
+ZONE_PAIR_BASE = len(season_names) * SEASON_BASE
+NUM_ZONE_BINS = NUM_ZONES * NUM_ZONES * ZONE_PAIR_BASE
+
+def day_bin_ids(pickup_time, pickup_zone, dropoff_zone):
+  """
+  Returns: int64 array of the compressed (day, hour, pickup_zone, dropoff_zone) bin ids.
+  """
+  day_of_month = time_bins.day_of_month(pickup_time)
+  hour = time_bins.hour(pickup_time)
+  return ((day_of_month - 1) * DAY_BASE + hour * HOUR_BASE +
+          pickup_zone.astype(np.int64) * NUM_ZONES + dropoff_zone)
+
+
+def zone_bin_ids(pickup_time, pickup_zone, dropoff_zone):
+  """
+  Returns: int64 array of the compressed
+    (pickup_zone, dropoff_zone, season, is_weekday, time_of_day) bin ids.
+  """
+  season = time_bins.season(pickup_time)
+  is_weekday = time_bins.is_weekday(pickup_time)
+  time_of_day = time_bins.time_of_day(pickup_time)
+  return ((pickup_zone.astype(np.int64) * NUM_ZONES + dropoff_zone) * ZONE_PAIR_BASE +
+          season * SEASON_BASE + is_weekday * WEEKDAY_BASE + time_of_day)
+
+
+def zone_bin_fields(bin_ids):
+  """
+  Returns: (pickup_zone, dropoff_zone, season, is_weekday, time_of_day) arrays of the
+    given zone bin ids.
+  """
+  return (bin_ids / ZONE_PAIR_BASE / NUM_ZONES,
+          bin_ids / ZONE_PAIR_BASE % NUM_ZONES,
+          bin_ids % ZONE_PAIR_BASE / SEASON_BASE,
+          bin_ids % SEASON_BASE / WEEKDAY_BASE,
+          bin_ids % WEEKDAY_BASE)
+
+
+def trip_file_path(cache_dir, source_path):
+  """
+  Returns: The trip file of a data file in a cache directory.
+  """
+  return cache_path(cache_dir, source_path) + '.trips'
+
+
+def write_trip_file(cache_dir, source_path, zone_locator=None, progress_callback=None):
+  """
+  Parses and validates a raw TLC CSV and writes its trip file.
+
+  Args:
+    cache_dir: Cache directory.
+    source_path: Path to the raw data file.
+    zone_locator: If given, zones are located and stored.
+    progress_callback: Optional function of the progress fraction.
+
+  Returns: The TripStats of the file, without the zone checks.
+  """
+  path = trip_file_path(cache_dir, source_path)
+  temp_path = '%s.tmp%d' % (path, os.getpid())
+  if not os.path.exists(cache_dir):
+    os.makedirs(cache_dir)
+
+  stats = TripStats()
+  num_trips = 0
+  with open(temp_path, 'wb') as f:
+    # The header is written last, once the number of trips is known.
+    f.write('\0' * HEADER_SIZE)
+    for trips in ingest_chunks(source_path, stats, zone_locator, progress_callback):
+      records = np.empty(len(trips), dtype=trip_record)
+      records['pickup_time'] = trips.pickup_time
+      records['speed'] = trips.speed
+      if zone_locator is not None:
+        records['pickup_zone'] = trips.pickup_zone
+        records['dropoff_zone'] = trips.dropoff_zone
+      else:
+        records['pickup_zone'] = records['dropoff_zone'] = -1
+      records.tofile(f)
+      num_trips += len(trips)
+
+    header = TRIP_FILE_MAGIC + json.dumps(
+      cache_meta(source_path, zone_locator, num_trips, stats))
+    assert len(header) <= HEADER_SIZE, 'trip file metadata too long'
+    f.seek(0)
+    f.write(header.ljust(HEADER_SIZE))
+
+  os.rename(temp_path, path)
+  return stats
+
+
+class TripFile:
+  def __init__(self, path):
+    """
+    Maps a trip file written by write_trip_file.
+    """
+    self.path = path
+    with open(path, 'rb') as f:
+      header = f.read(HEADER_SIZE)
+    if not header.startswith(TRIP_FILE_MAGIC):
+      raise ValueError('%s is not a trip file' % path)
+    self.meta = json.loads(header[len(TRIP_FILE_MAGIC):].rstrip())
+    self.num_trips = self.meta['num_trips']
+    if self.num_trips > 0:
+      self.records = np.memmap(path, dtype=trip_record, mode='r', offset=HEADER_SIZE,
+                               shape=(self.num_trips,))
+    else:
+      self.records = np.zeros(0, dtype=trip_record)
+
+  def matches(self, zone_locator=None):
+    return matches_meta(self.meta, zone_locator)
+
+  def stats(self):
+    """
+    Returns: TripStats of the file, without the zone checks.
+    """
+    stats = TripStats()
+    stats.counts += np.array(self.meta['counts'], dtype=np.int64)
+    return stats
+
+  def read_chunks(self, stats, zone_locator=None, chunk_rows=CHUNK_ROWS, keep_nozone=False):
+    """
+    Reads the trips like TripCache.read_chunks. The TripBatches only have
+    pickup_time, speed and zones set, and pickup_time is a view of the mapped file.
+    """
+    stats.merge(self.stats())
+    for start in range(0, self.num_trips, chunk_rows):
+      end = min(start + chunk_rows, self.num_trips)
+      records = self.records[start:end]
+      trips = TripBatch(records['pickup_time'], None, None, None, None, None, None)
+      trips.speed = records['speed'].astype(np.float64)
+      if zone_locator is not None:
+        trips.pickup_zone = records['pickup_zone'].astype(np.int64)
+        trips.dropoff_zone = records['dropoff_zone'].astype(np.int64)
+        if not keep_nozone:
+          trips = reject_nozone(trips, stats)
+      yield trips, 1. * end / self.num_trips
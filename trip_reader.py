@@ -0,0 +1,91 @@
+import os, sys
+
+# Approximate number of bytes read per chunk, about 100k TLC trip lines.
+CHUNK_BYTES = 16 << 20
+
+def read_line_chunks(file_path, chunk_bytes=CHUNK_BYTES, skip_header=True, byte_range=None):
+  """
+  Lazily reads a CSV file in chunks of whole lines, so that memory stays flat
+  regardless of the file size.
+
+  Args:
+    file_path: Path to the CSV file.
+    chunk_bytes: Approximate size of a chunk in bytes.
+    skip_header: Whether the first line is skipped when reading the whole file.
+    byte_range: Optional (start, end) returned by split_byte_ranges. Only the lines
+      starting within [start, end) are read.
+
+  Yields: (lines, progress) where lines is a list of line strings and progress is the
+    fraction of the file (or range) bytes consumed so far.
+  """
+  with open(file_path, 'r') as f:
+    if byte_range is None:
+      start, end = 0, os.path.getsize(file_path)
+      if skip_header:
+        f.readline()
+    else:
+      start, end = byte_range
+      f.seek(start)
+    total_bytes = max(end - start, 1)
+
+    position = f.tell()
+    while position < end:
+      lines = f.readlines(chunk_bytes)
+      if not lines:
+        break
+      if f.tell() > end:
+        # Drop the lines that start at or after the end of the range.
+        for index, line in enumerate(lines):
+          if position >= end:
+            lines = lines[:index]
+            break
+          position += len(line)
+      position = f.tell()
+      yield lines, min(1.0 * (position - start) / total_bytes, 1.0)
+
+
+def read_header(file_path):
+  """
+  Returns: The first line of a CSV file.
+  """
+  with open(file_path, 'r') as f:
+    return f.readline()
+
+
+def split_byte_ranges(file_path, num_ranges, skip_header=True):
+  """
+  Splits a CSV file into byte ranges aligned to line starts, to be read by
+  read_line_chunks in separate processes.
+
+  Args:
+    file_path: Path to the CSV file.
+    num_ranges: Number of ranges. Fewer ranges are returned for small files.
+    skip_header: Whether the first line is excluded from the ranges.
+
+  Returns: A list of (start, end) byte offsets covering every line exactly once.
+  """
+  size = os.path.getsize(file_path)
+  with open(file_path, 'r') as f:
+    if skip_header:
+      f.readline()
+    first = f.tell()
+    boundaries = [first]
+    for k in range(1, num_ranges):
+      position = first + (size - first) * k / num_ranges
+      if position <= boundaries[-1]:
+        continue
+      # Move to the start of the next line at or after position.
+      f.seek(position - 1)
+      f.readline()
+      if f.tell() > boundaries[-1] and f.tell() < size:
+        boundaries.append(f.tell())
+  boundaries.append(size)
+  return zip(boundaries[:-1], boundaries[1:])
+
+
+def print_progress(progress):
+  """
+  Prints the progress fraction in place.
+  """
+  print '\r%.2f%%' % (progress * 100),
+  sys.stdout.flush()
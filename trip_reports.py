@@ -0,0 +1,171 @@
+import numpy as np
+from const import *
+from raw_trip import group_indices
+from speed_stats import SpeedStats, BinnedSpeedStats
+from trip_file import (day_bin_ids, zone_bin_ids, zone_bin_fields, NUM_HOURS,
+                       NUM_DAY_BINS, NUM_ZONE_BINS, DAY_BASE, HOUR_BASE)
+import time_bins
+
+# Aggregators of the trip reports, fed with batches of validated trips:
+#   HourAggregator: <yyyy-mm>.txt of aggregate_yyyy-mm_hour.py, bins (yyyy-mm, hour).
+#   DayAggregator: day_<yyyy-mm>.csv of aggregate_day.py, bins
+#     (day, hour, pickup_zone, dropoff_zone).
+#   ZoneAggregator: zone report of aggregate_zone.py, bins
+#     (pickup_zone, dropoff_zone, season, is_weekday, time_of_day).
+# aggregate_trips.py --reports feeds several of them from a single pass.
+
+NUM_ZONES = len(zone_names)
+
+class HourAggregator:
+  def __init__(self, year_month):
+    self.year_month = year_month
+    self.bins = {}
+
+  def add_trips(self, trips):
+    """
+    Args:
+      trips: TripBatch of accepted trips.
+    """
+    hours = time_bins.hour(trips.pickup_time)
+    for hour, indices in group_indices(hours):
+      bin_id = (self.year_month, int(hour))
+      if bin_id not in self.bins:
+        self.bins[bin_id] = SpeedStats()
+      self.bins[bin_id].add(trips.speed[indices])
+
+  def merge(self, other):
+    """
+    Merges the bins of another Aggregator into this one.
+    """
+    for bin_id, speeds in other.bins.iteritems():
+      if bin_id not in self.bins:
+        self.bins[bin_id] = SpeedStats()
+      self.bins[bin_id].merge(speeds)
+
+  def report(self, filename):
+    with open(filename, 'w') as f:
+      f.write(','.join([
+        'year_month',
+        'hour',
+        'mean',
+        'std',
+        'percentile_85',
+        'count'
+      ]) + '\n')
+      bin_ids = sorted(self.bins.keys())
+      for bin_id in bin_ids:
+        speeds = self.bins[bin_id]
+
+        f.write('%s,%d,%.9f,%.9f,%.9f,%d\n' % (
+          bin_id[0], # yyyy-mm
+          bin_id[1], # hour
+          speeds.mean,
+          speeds.std(),
+          speeds.percentile(85),
+          speeds.count
+        ))
+
+
+class DayAggregator:
+  def __init__(self, year_month):
+    self.year_month = year_month
+    self.bins = BinnedSpeedStats(NUM_DAY_BINS)
+
+  def add_trips(self, trips):
+    """
+    Args:
+      trips: TripBatch of accepted trips with zones located.
+    """
+    # use compressed integer index for (day, hour, pickup_zone, dropoff_zone)
+    bin_ids = day_bin_ids(trips.pickup_time, trips.pickup_zone, trips.dropoff_zone)
+    self.bins.add(bin_ids, trips.speed)
+
+  def merge(self, other):
+    """
+    Merges the bins of another Aggregator of the same month into this one.
+    """
+    self.bins.merge(other.bins)
+
+  def report(self, file=''):
+    with open(file, 'w') as f:
+      f.write(','.join([
+        'date',
+        'hour',
+        'pickup_zone',
+        'dropoff_zone',
+        'mean',
+        'std',
+        'percentile_85',
+        'count'
+      ]) + '\n')
+
+      bin_ids = self.bins.nonempty_bins()
+      columns = zip(
+        bin_ids / DAY_BASE + 1, # day
+        bin_ids / HOUR_BASE % NUM_HOURS, # hour
+        bin_ids / NUM_ZONES % NUM_ZONES, # pickup_zone
+        bin_ids % NUM_ZONES, # dropoff_zone
+        self.bins.mean(bin_ids),
+        self.bins.std(bin_ids),
+        self.bins.percentile(bin_ids, 85),
+        self.bins.count[bin_ids]
+      )
+      f.writelines('%s-%02d,%d,%d,%d,%.9f,%.9f,%.9f,%d\n' % (
+        (self.year_month,) + row) for row in columns)
+
+  def write_histogram(self, file):
+    """
+    Writes the arrays of the bins with the month, see read_day_histogram in
+    aggregate_month.py.
+    """
+    np.savez_compressed(file, year_month=self.year_month, **self.bins.to_arrays())
+
+
+class ZoneAggregator:
+  def __init__(self):
+    self.bins = BinnedSpeedStats(NUM_ZONE_BINS)
+
+  def add_trips(self, trips):
+    """
+    Args:
+      trips: TripBatch of accepted trips with zones located.
+    """
+    # use compressed integer index for
+    # (pickup_zone, dropoff_zone, season, is_weekday, time_of_day)
+    bin_ids = zone_bin_ids(trips.pickup_time, trips.pickup_zone, trips.dropoff_zone)
+    self.bins.add(bin_ids, trips.speed)
+
+  def merge(self, other):
+    """
+    Merges the bins of another Aggregator into this one.
+    """
+    self.bins.merge(other.bins)
+
+  def report(self, file=''):
+    with open(file, 'w') as f:
+      f.write(','.join([
+        'pickup_zone',
+        'dropoff_zone',
+        'season',
+        'is_weekday',
+        'time_of_day',
+        'mean',
+        'std',
+        'percentile_85',
+        'count'
+      ]) + '\n')
+
+      bin_ids = self.bins.nonempty_bins()
+      pickup_zone, dropoff_zone, season, is_weekday, time_of_day = zone_bin_fields(bin_ids)
+      columns = zip(
+        [zone_names[zone] for zone in pickup_zone],
+        [zone_names[zone] for zone in dropoff_zone],
+        [season_names[key] for key in season],
+        is_weekday.astype(bool),
+        [time_of_day_names[key] for key in time_of_day],
+        self.bins.mean(bin_ids),
+        self.bins.std(bin_ids),
+        self.bins.percentile(bin_ids, 85),
+        self.bins.count[bin_ids]
+      )
+      f.writelines('%s,%s,%s,%s,%s,%.9f,%.9f,%.9f,%d\n' % row for row in columns)
@@ -0,0 +1,172 @@
+import numpy as np
+
+# Registry of the TLC yellow cab CSV layouts. The era of a data file is detected from
+# its header line, and the header columns are mapped to canonical column names once
+# per file, so that parsing has no per-row overhead.
+#
+# 2009:            vendor_name,Trip_Pickup_DateTime,Trip_Dropoff_DateTime,Passenger_Count,
+#                  Trip_Distance,Start_Lon,Start_Lat,Rate_Code,store_and_forward,End_Lon,
+#                  End_Lat,Payment_Type,Fare_Amt,surcharge,mta_tax,Tip_Amt,Tolls_Amt,Total_Amt
+# 2010-2014:       vendor_id,pickup_datetime,dropoff_datetime,passenger_count,trip_distance,
+#                  pickup_longitude,pickup_latitude,rate_code,store_and_fwd_flag,
+#                  dropoff_longitude,dropoff_latitude,payment_type,fare_amount,surcharge,
+#                  mta_tax,tip_amount,tolls_amount,total_amount
+# 2015-2016 June:  VendorID,tpep_pickup_datetime,tpep_dropoff_datetime,passenger_count,
+#                  trip_distance,pickup_longitude,pickup_latitude,RateCodeID,
+#                  store_and_fwd_flag,dropoff_longitude,dropoff_latitude,payment_type,
+#                  fare_amount,extra,mta_tax,tip_amount,tolls_amount,improvement_surcharge,
+#                  total_amount
+# 2016 July-:      VendorID,tpep_pickup_datetime,tpep_dropoff_datetime,passenger_count,
+#                  trip_distance,RatecodeID,store_and_fwd_flag,PULocationID,DOLocationID,
+#                  payment_type,fare_amount,extra,mta_tax,tip_amount,tolls_amount,
+#                  improvement_surcharge,total_amount
+#
+# From July 2016 trips only have TLC taxi zone IDs instead of coordinates. These are
+# mapped to our OD zones by a lookup table, see read_location_zones.
+
+# Header names (lower case) of every canonical column.
+column_aliases = {
+  'pickup_time': ['trip_pickup_datetime', 'pickup_datetime', 'tpep_pickup_datetime'],
+  'dropoff_time': ['trip_dropoff_datetime', 'dropoff_datetime', 'tpep_dropoff_datetime'],
+  'pickup_lon': ['start_lon', 'pickup_longitude'],
+  'pickup_lat': ['start_lat', 'pickup_latitude'],
+  'dropoff_lon': ['end_lon', 'dropoff_longitude'],
+  'dropoff_lat': ['end_lat', 'dropoff_latitude'],
+  'pickup_location': ['pulocationid'],
+  'dropoff_location': ['dolocationid'],
+  'distance': ['trip_distance'],
+  'passengers': ['passenger_count'],
+  'payment_type': ['payment_type'],
+  'fare_amount': ['fare_amt', 'fare_amount'],
+  'surcharge': ['surcharge', 'extra'],
+  'mta_tax': ['mta_tax'],
+  'tip_amount': ['tip_amt', 'tip_amount'],
+  'tolls_amount': ['tolls_amt', 'tolls_amount']
+}
+
+# Trip columns parsed for speed estimation, per era, in detection order.
+era_columns = [
+  ('coordinates', ['pickup_time', 'dropoff_time', 'pickup_lon', 'pickup_lat',
+                   'dropoff_lon', 'dropoff_lat', 'distance']),
+  ('location_id', ['pickup_time', 'dropoff_time', 'pickup_location',
+                   'dropoff_location', 'distance'])
+]
+
+# indices for every year are the same, except for 2016 second half
+coordinate_indices = {
+  'pickup_time': 1,
+  'dropoff_time': 2,
+  'pickup_lon': 5,
+  'pickup_lat': 6,
+  'dropoff_lon': 9,
+  'dropoff_lat': 10,
+  'distance': 4
+}
+
+class TripSchema:
+  def __init__(self, era, indices, header_indices=None, location_zones=None):
+    """
+    Args:
+      era: Name of the era in era_columns.
+      indices: Dict from the canonical trip columns of the era to column indices.
+      header_indices: Dict from every canonical column found in the header to its index.
+      location_zones: For the location_id era, int64 array from taxi zone ID to OD zone,
+        -1 for no zone.
+    """
+    self.era = era
+    self.indices = indices
+    self.header_indices = header_indices if header_indices is not None else indices
+    self.location_zones = location_zones
+    self.min_tokens = max(indices.values()) + 1
+
+  def has_coordinates(self):
+    return self.era == 'coordinates'
+
+
+# Schema of files without a header line.
+default_schema = TripSchema('coordinates', coordinate_indices)
+
+def header_indices(header_line):
+  """
+  Returns: Dict from the canonical columns found in a header line to their indices.
+  """
+  names = [name.strip().strip('"').lower() for name in header_line.strip().split(',')]
+  indices = {}
+  for key, aliases in column_aliases.iteritems():
+    for index, name in enumerate(names):
+      if name in aliases:
+        indices[key] = index
+        break
+  return indices
+
+
+def detect_schema(header_line, location_zone_file=None):
+  """
+  Detects the era of a TLC data file from its header line.
+
+  Args:
+    header_line: First line of the file.
+    location_zone_file: Lookup table file read for the location_id era, see
+      read_location_zones. None to skip reading it when zones are not needed.
+
+  Returns: The TripSchema of the file.
+  """
+  found = header_indices(header_line)
+  for era, columns in era_columns:
+    if all(key in found for key in columns):
+      indices = dict([(key, found[key]) for key in columns])
+      location_zones = None
+      if era == 'location_id' and location_zone_file is not None:
+        location_zones = read_location_zones(location_zone_file)
+      return TripSchema(era, indices, found, location_zones)
+  raise ValueError('unknown TLC data header "%s"' % header_line.strip())
+
+
+location_zone_tables = {} # file -> table, read once per process
+
+def read_location_zones(file):
+  """
+  Reads the lookup table from TLC taxi zone IDs to OD zones, a CSV with header
+  LocationID,zone and -1 for taxi zones outside all OD zones (see write_location_zones).
+
+  Returns: int64 array indexed by taxi zone ID, -1 for unknown IDs.
+  """
+  if file not in location_zone_tables:
+    table = np.loadtxt(file, delimiter=',', skiprows=1, dtype=np.int64, ndmin=2)
+    location_zones = np.full(table[:, 0].max() + 1 if len(table) > 0 else 0, -1,
+                             dtype=np.int64)
+    location_zones[table[:, 0]] = table[:, 1]
+    location_zone_tables[file] = location_zones
+  return location_zone_tables[file]
+
+
+def write_location_zones(centroid_file, zone_locator, file):
+  """
+  Precomputes the lookup table by locating the centroid of every taxi zone.
+
+  Args:
+    centroid_file: CSV with header LocationID,lon,lat of the TLC taxi zone centroids.
+    zone_locator: ZoneLocator of the OD zones.
+    file: Output path of the table.
+  """
+  centroids = np.loadtxt(centroid_file, delimiter=',', skiprows=1, ndmin=2)
+  zones = zone_locator.locate_many(centroids[:, 1], centroids[:, 2])
+  with open(file, 'w') as f:
+    f.write('LocationID,zone\n')
+    for location, zone in zip(centroids[:, 0].astype(np.int64), zones):
+      f.write('%d,%d\n' % (location, zone))
+
+
+def map_location_zones(location_zones, locations):
+  """
+  Args:
+    location_zones: Lookup table returned by read_location_zones.
+    locations: float64 array of taxi zone IDs, NaN if missing.
+
+  Returns: int64 array of OD zones, -1 for missing or unknown IDs.
+  """
+  known = ~np.isnan(locations)
+  known[known] = (locations[known] >= 0) & (locations[known] < len(location_zones))
+  zones = np.full(len(locations), -1, dtype=np.int64)
+  zones[known] = location_zones[locations[known].astype(np.int64)]
+  return zones